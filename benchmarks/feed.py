@@ -0,0 +1,50 @@
+"""Micro-benchmark of feeding --files-from list to rsync stdin
+
+Compares legacy per-line encode/write/drain with bulk NUL-delimited
+RSync.feed_input, consumer is `cat > /dev/null`.
+
+    python benchmarks/feed.py [number-of-names]
+"""
+
+import asyncio
+import sys
+import time
+
+from jsync.filelist import FileList
+from jsync.rsync import RSync
+
+
+async def feed_legacy(proc, files):
+    for f in files:
+        proc.stdin.write((f[0] + '\n').encode('utf-8'))
+        await proc.stdin.drain()
+
+    proc.stdin.close()
+
+
+async def feed_bulk(proc, files):
+    await RSync().feed_input(proc, files.names())
+
+
+async def measure(feed, files):
+    proc = await asyncio.create_subprocess_shell('cat > /dev/null', stdin=asyncio.subprocess.PIPE)
+
+    started = time.perf_counter()
+    await feed(proc, files)
+    await proc.wait()
+    return time.perf_counter() - started
+
+
+def main(n):
+    files = FileList()
+    for i in range(n):
+        files.append((f'folder{i % 100}/folder{i % 7}/IMG_{i:08d}.xmp', '>f+++++++++', 1000))
+
+    view = files[:]
+    for name, feed in (('legacy', feed_legacy), ('bulk', feed_bulk)):
+        t = asyncio.run(measure(feed, view))
+        print(f'{name:>8}: {n} names in {t:6.2f}s, {n / t:12,.0f} names/s')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
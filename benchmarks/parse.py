@@ -0,0 +1,77 @@
+"""Benchmark of rsync transfer output parsers
+
+Replays rsync output through legacy (progress) and records parsers feeding
+a Job, like a real transfer does, with and without console renderer state
+updates. Output is either recorded from real rsync:
+
+    rsync ... --files-from=list --info=progress2 --no-v --no-h -v src dst > legacy.out
+    rsync ... --files-from=list --info=progress2 --no-v --no-h \\
+        --out-format='%i %l %n' src dst > records.out
+    python benchmarks/parse.py legacy.out records.out
+
+or generated (given number of files):
+
+    python benchmarks/parse.py [number-of-files]
+"""
+
+import io
+import sys
+import time
+
+from jsync.events import EventBus
+from jsync.job import Job
+from jsync.render import ConsoleRenderer
+from jsync.rsync import RSync
+
+
+def generate(n, records):
+    out = io.BytesIO()
+    size = 0
+    for i in range(n):
+        name = f'folder{i % 100}/folder{i % 7}/IMG_{i:08d}.xmp'
+        out.write(f'>f+++++++++ 4096 {name}\n'.encode() if records else f'{name}\n'.encode())
+        size += 4096
+        out.write(
+            f'{size:>15} {100 * i // n:3d}%  263.33MB/s    0:00:{i % 60:02d} '
+            f'(xfr#{i + 1}, to-chk={n - i - 1}/{n})\r'.encode()
+        )
+
+    out.write(b'\nsent 100 bytes  received 100 bytes  200.00 bytes/sec\n')
+    return out.getvalue()
+
+
+def replay(data, parser, render=False):
+    bus = EventBus()
+    if render:
+        # events are applied to renderer state, screen is not drawn (it is done per tick)
+        bus.subscribe(ConsoleRenderer(bus, quiet=True))
+
+    job = Job(1, [], bus, RSync(), callback=lambda dsize, dtotal, drate: None, parser=parser)
+    job.set_progress(0, 1 << 60, 0)
+    p = job.make_parser()
+
+    nlines = data.count(b'\n') + data.count(b'\r')
+    started = time.perf_counter()
+    for i in range(0, len(data), 65536):
+        p.feed(data[i : i + 65536])
+    p.close()
+
+    return nlines, time.perf_counter() - started
+
+
+def main(argv):
+    if len(argv) == 2:
+        inputs = {'progress': open(argv[0], 'rb').read(), 'records': open(argv[1], 'rb').read()}
+    else:
+        n = int(argv[0]) if argv else 200_000
+        inputs = {'progress': generate(n, False), 'records': generate(n, True)}
+
+    for parser, data in inputs.items():
+        for render in (False, True):
+            nlines, t = replay(data, parser, render)
+            name = f'{parser}+render' if render else parser
+            print(f'{name:>15}: {nlines} lines in {t:6.2f}s, {nlines / t:12,.0f} lines/s')
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,108 @@
+"""Benchmark of startup time and end-to-end latency of small incremental syncs
+
+Measures time of importing jsync (against bare interpreter start), then
+keeps a small synchronized tree and for every number of changed files runs
+plain rsync, jsync and jsync with --fast-path over it:
+
+    python benchmarks/startup.py --work=/var/tmp/jsync-startup
+    python benchmarks/startup.py --transport=loopback --changes 1 10 100 1000 --fast-path=500,64M
+
+Changed files get new content (same size, new mtime) before every run,
+median of --repeat runs is reported. Runs without changes are not measured:
+jsync reports them as an error.
+"""
+
+import argparse
+import functools
+import os
+import random
+import shutil
+import statistics
+import sys
+
+from suite import LOOPBACK_RSH, run
+
+
+def populate(src, nfiles, rnd, fanout=100):
+    for i in range(nfiles):
+        d = os.path.join(src, f'd{i // fanout:04d}')
+        if i % fanout == 0:
+            os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f'f{i:06d}.dat'), 'wb') as f:
+            f.write(rnd.randbytes(rnd.randint(0, 8192)))
+
+
+def touch(src, nchanged, rnd):
+    files = sorted(os.path.join(d, f) for d, _, fs in os.walk(src) for f in fs)
+    for path in rnd.sample(files, min(nchanged, len(files))):
+        size = os.path.getsize(path)
+        with open(path, 'wb') as f:
+            f.write(rnd.randbytes(size))
+
+
+def median_wall(cmd, repeat, before=None):
+    walls = []
+    for _ in range(repeat):
+        if before:
+            before()
+        walls.append(run(cmd)[0])
+    return statistics.median(walls)
+
+
+def main(argv):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--work', default=os.path.join('/var/tmp', 'jsync-startup'))
+    p.add_argument('--files', type=int, default=5000, help='files in the tree')
+    p.add_argument('--changes', nargs='+', type=int, default=[1, 10, 100, 1000])
+    p.add_argument('--transport', choices=('local', 'loopback'), default='local')
+    p.add_argument('--jobs', type=int, default=4)
+    p.add_argument('--fast-path', default='1000', help='limits of jsync --fast-path')
+    p.add_argument('--repeat', type=int, default=5)
+    args = p.parse_args(argv)
+
+    python = [sys.executable, '-c']
+    bare = median_wall(python + ['pass'], args.repeat * 4)
+    imported = median_wall(python + ['import jsync'], args.repeat * 4)
+    print(f'interpreter {bare * 1000:7.1f}ms, import jsync +{(imported - bare) * 1000:7.1f}ms')
+
+    src = os.path.join(args.work, 'src')
+    dst = os.path.join(args.work, 'dst')
+    rnd = random.Random('startup')
+    for d in (src, dst):
+        shutil.rmtree(d, ignore_errors=True)
+    os.makedirs(src)
+    populate(src, args.files, rnd)
+
+    rsh = os.path.join(args.work, 'loopback-rsh')
+    with open(rsh, 'w') as f:
+        f.write(LOOPBACK_RSH)
+    os.chmod(rsh, 0o755)
+
+    target = dst + '/'
+    opts = ['-a']
+    if args.transport == 'loopback':
+        target = 'localhost:' + target
+        opts.append(f'--rsh={rsh}')
+
+    jsync = python + ['import jsync; jsync.synchronize()', f'-j{args.jobs}', '--no-echo']
+    variants = {
+        'rsync': ['rsync'],
+        'jsync': jsync,
+        'fast-path': jsync + [f'--fast-path={args.fast_path}'],
+    }
+
+    run(['rsync', *opts, src + '/', target])
+    for nchanged in args.changes:
+        line = []
+        for name, cmd in variants.items():
+            change = functools.partial(touch, src, nchanged, rnd)
+            wall = median_wall(cmd + opts + [src + '/', target], args.repeat, change)
+            line.append(f'{name} {wall:6.3f}s')
+        print(f'{nchanged:>6} changed: ' + '  '.join(line))
+
+    for d in (src, dst):
+        shutil.rmtree(d, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,274 @@
+"""Benchmark suite of whole runs over synthetic source trees
+
+Generates source trees (kept in work directory between runs, generation is
+deterministic), runs jsync local-to-local and over a loopback remote shell
+(remote part runs locally, host name is ignored) for every tree, mode and
+number of jobs, records wall time, throughput, CPU time and peak RSS of
+jsync and its rsync processes:
+
+    python benchmarks/suite.py --work=/var/tmp/jsync-bench --output=results.json
+    python benchmarks/suite.py --work=/var/tmp/jsync-bench --baseline=results.json
+
+With --baseline results are compared by wall time and the suite exits with
+status 1 when some case is slower than baseline by more than --tolerance.
+Trees at --scale=1 are: tiny - a million of small files, huge - 4 files of
+1G, mixed - 100K small and 20 of 64M, deep - 50K files 16 levels deep.
+Mode native is the same as static over loopback (remote side is rsync only).
+Page cache is not dropped: the first repeat reads source from disk, take
+median of a few (--repeat) for stable results.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+MB = 1 << 20
+
+TREES = ('tiny', 'huge', 'mixed', 'deep')
+TRANSPORTS = ('local', 'loopback')
+MODES = {
+    'static': [],
+    'queue': ['--schedule=queue'],
+    'stream': ['--stream'],
+    'native': ['--engine=native'],
+}
+
+LOOPBACK_RSH = """#!/bin/sh
+# remote shell stand-in: runs "remote" command locally, host is ignored
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -l|-p|-o) shift 2 ;;
+        -*) shift ;;
+        *) break ;;
+    esac
+done
+shift
+exec sh -c "$*"
+"""
+
+
+def write_file(path, size, rnd, block):
+    with open(path, 'wb') as f:
+        while size > 0:
+            # unique start of every block - content does not repeat
+            chunk = rnd.randbytes(16) + block[16 : min(size, len(block))]
+            f.write(chunk[:size])
+            size -= len(chunk)
+
+
+def small_files(root, n, rnd, block, sizes=(0, 4096), fanout=1000):
+    for i in range(n):
+        d = os.path.join(root, f'd{i // fanout // fanout:03d}', f'd{i // fanout % fanout:03d}')
+        if i % fanout == 0:
+            os.makedirs(d, exist_ok=True)
+        write_file(os.path.join(d, f'f{i:08d}.dat'), rnd.randint(*sizes), rnd, block)
+
+
+def big_files(root, n, size, rnd, block):
+    os.makedirs(root, exist_ok=True)
+    for i in range(n):
+        write_file(os.path.join(root, f'big{i:03d}.bin'), size, rnd, block)
+
+
+def deep_files(root, n, rnd, block, depth=16):
+    for i in range(n):
+        # binary tree of directories, files spread over leaves
+        d = os.path.join(root, *(f'l{(i >> k) & 1}' for k in range(depth)))
+        os.makedirs(d, exist_ok=True)
+        write_file(os.path.join(d, f'f{i:08d}.dat'), rnd.randint(0, 16384), rnd, block)
+
+
+def generate(name, root, scale):
+    rnd = random.Random(name)
+    block = rnd.randbytes(MB)
+
+    if name == 'tiny':
+        small_files(root, int(1_000_000 * scale), rnd, block)
+    elif name == 'huge':
+        big_files(root, 4, max(MB, int(1024 * MB * scale)), rnd, block)
+    elif name == 'mixed':
+        small_files(os.path.join(root, 'small'), int(100_000 * scale), rnd, block, (0, 65536))
+        big_files(os.path.join(root, 'big'), 20, max(MB, int(64 * MB * scale)), rnd, block)
+    elif name == 'deep':
+        deep_files(root, int(50_000 * scale), rnd, block)
+
+
+def tree(work, name, scale):
+    """Path of generated tree, (number of files, bytes) in it"""
+
+    root = os.path.join(work, 'trees', f'{name}-{scale:g}')
+    done = root + '.json'
+    if not os.path.exists(done):
+        shutil.rmtree(root, ignore_errors=True)
+        os.makedirs(root)
+        started = time.perf_counter()
+        generate(name, root, scale)
+        nfiles = nbytes = 0
+        for d, _, files in os.walk(root):
+            nfiles += len(files)
+            nbytes += sum(os.path.getsize(os.path.join(d, f)) for f in files)
+        with open(done, 'w') as f:
+            json.dump({'files': nfiles, 'bytes': nbytes}, f)
+        print(
+            f'generated {name}: {nfiles} files, {nbytes / MB:.1f}M '
+            f'in {time.perf_counter() - started:.1f}s'
+        )
+
+    with open(done) as f:
+        info = json.load(f)
+    return root, info['files'], info['bytes']
+
+
+def run(cmd):
+    """Run command, (wall, user, sys, maxrss) of it and its waited descendants"""
+
+    with tempfile.TemporaryFile() as err:
+        started = time.perf_counter()
+        proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=err)
+        # not proc.wait(): wait4 gives resource usage of this very process
+        _, status, ru = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - started
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        err.seek(0)
+        msg = err.read().decode(errors='replace').strip()
+
+    if proc.returncode != 0 or msg:
+        raise Exception(f'{" ".join(cmd)}: exit {proc.returncode}\n{msg}')
+
+    # ru_maxrss is in KiB on Linux
+    return wall, ru.ru_utime, ru.ru_stime, ru.ru_maxrss * 1024
+
+
+def case(args, src, transport, mode, jobs):
+    dst = os.path.join(args.work, 'dst')
+    shutil.rmtree(dst, ignore_errors=True)
+    os.makedirs(dst)
+
+    rsh = []
+    target = dst + '/'
+    if transport == 'loopback':
+        rsh = [f'--rsh={os.path.join(args.work, "loopback-rsh")}']
+        target = 'localhost:' + target
+
+    # like console script: jsync reports errors to stderr
+    cmd = [sys.executable, '-c', 'import jsync; jsync.synchronize()']
+    cmd += [f'-j{jobs}', '--no-echo', *MODES[mode]]
+    return run(cmd + ['-a', *rsh, src + '/', target])
+
+
+def benchmark(args):
+    os.makedirs(args.work, exist_ok=True)
+    rsh = os.path.join(args.work, 'loopback-rsh')
+    with open(rsh, 'w') as f:
+        f.write(LOOPBACK_RSH)
+    os.chmod(rsh, 0o755)
+
+    results = []
+    for name in args.trees:
+        src, nfiles, nbytes = tree(args.work, name, args.scale)
+        for transport in args.transports:
+            for mode in args.modes:
+                for jobs in args.jobs:
+                    runs = [case(args, src, transport, mode, jobs) for _ in range(args.repeat)]
+                    wall = statistics.median(r[0] for r in runs)
+                    r = {
+                        'tree': name,
+                        'transport': transport,
+                        'mode': mode,
+                        'jobs': jobs,
+                        'files': nfiles,
+                        'bytes': nbytes,
+                        'wall': wall,
+                        'bytes_rate': nbytes / wall,
+                        'files_rate': nfiles / wall,
+                        'user': statistics.median(r[1] for r in runs),
+                        'sys': statistics.median(r[2] for r in runs),
+                        'maxrss': max(r[3] for r in runs),
+                    }
+                    results.append(r)
+                    print(
+                        f'{name:>6} {transport:>8} {mode:>6} -j{jobs:<3} {wall:8.2f}s '
+                        f'{r["bytes_rate"] / MB:9.1f}M/s {r["files_rate"]:10,.0f} files/s '
+                        f'cpu {r["user"] + r["sys"]:7.2f}s rss {r["maxrss"] / MB:7.1f}M'
+                    )
+
+    shutil.rmtree(os.path.join(args.work, 'dst'), ignore_errors=True)
+    return results
+
+
+def key(r):
+    return r['tree'], r['transport'], r['mode'], r['jobs']
+
+
+def compare(results, baseline, tolerance):
+    """Print comparison with baseline, number of regressions"""
+
+    base = {key(r): r for r in baseline['results']}
+    regressions = 0
+    for r in results:
+        b = base.get(key(r))
+        if b is None:
+            continue
+        ratio = r['wall'] / b['wall']
+        slower = ratio > 1 + tolerance
+        regressions += slower
+        print(
+            f'{r["tree"]:>6} {r["transport"]:>8} {r["mode"]:>6} -j{r["jobs"]:<3} '
+            f'{b["wall"]:8.2f}s -> {r["wall"]:8.2f}s {ratio:6.2f}x'
+            f'{"  REGRESSION" if slower else ""}'
+        )
+
+    return regressions
+
+
+def main(argv):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    p.add_argument('--work', default=os.path.join('/var/tmp', 'jsync-bench'))
+    p.add_argument('--scale', type=float, default=0.05, help='size of trees, 1 - full size')
+    p.add_argument('--trees', nargs='+', choices=TREES, default=list(TREES))
+    p.add_argument('--transports', nargs='+', choices=TRANSPORTS, default=list(TRANSPORTS))
+    p.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    p.add_argument('--jobs', nargs='+', type=int, default=[1, 2, 4, 8])
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--output', help='results file (JSON)')
+    p.add_argument('--baseline', help='results file to compare with')
+    p.add_argument('--tolerance', type=float, default=0.1, help='allowed slowdown, 0.1 - 10%%')
+    args = p.parse_args(argv)
+
+    results = benchmark(args)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(
+                {
+                    'time': time.time(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'cpus': os.cpu_count(),
+                    'scale': args.scale,
+                    'repeat': args.repeat,
+                    'results': results,
+                },
+                f,
+                indent=2,
+            )
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print(f'warning: baseline scale {baseline.get("scale")} != {args.scale}')
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,9 +1,15 @@
-import importlib.metadata as importlib_metadata
-
-from jsync.jsync import synchronize
+from jsync.jsync import events, synchronize
 from jsync.rsync import RSync
 from jsync.syncer import Syncer
 
-__version__ = importlib_metadata.version(__name__)
+__all__ = ["RSync", "Syncer", "events", "synchronize"]
+
+
+def __getattr__(name):
+    # importlib.metadata takes longer to import than jsync itself, resolved on demand
+    if name == '__version__':
+        import importlib.metadata as importlib_metadata
+
+        return importlib_metadata.version(__name__)
 
-__all__ = ["RSync", "Syncer", "synchronize"]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
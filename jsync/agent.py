@@ -0,0 +1,293 @@
+"""Transfers run by jsync agents on mover hosts, driven by a coordinator over TCP
+
+Protocol is JSON lines. Coordinator authenticates by {"token": shared secret},
+agent replies {"ok": true} or {"error": message} and closes. Then coordinator
+sends a request per transfer:
+{"argv": rsync options and arguments, "extra": options, "names": [...]},
+agent runs rsync and replies with {"out": chunk of stdout}, {"err": line}
+and finally {"usage": [...]} or {"error": message}. Raw names and output
+are passed as surrogate-escaped strings (os.fsdecode).
+
+Agent runs only rsync options of SAFE_FLAGS and SAFE_OPTIONS: no remote
+shell (--rsh/-e), remote programs or files of agent host named by options.
+"""
+
+import asyncio
+import hmac
+import json
+import os
+import time
+
+from .rsync import RSync, Usage
+
+# max size of a JSON line: request carries names of a whole batch
+LINE_LIMIT = 64 * 1024 * 1024
+
+# short rsync options without values
+SAFE_FLAGS = set('aAcCdDEgHhiIklLmnoOpPqrRsStuUvWxXz')
+
+# long rsync options, with values or without, --no-<option> is allowed as well
+SAFE_OPTIONS = {
+    'acls',
+    'append',
+    'append-verify',
+    'archive',
+    'atimes',
+    'bwlimit',
+    'checksum',
+    'compress',
+    'compress-choice',
+    'compress-level',
+    'copy-links',
+    'copy-unsafe-links',
+    'crtimes',
+    'delete',
+    'delete-after',
+    'delete-before',
+    'delete-delay',
+    'delete-during',
+    'delete-excluded',
+    'delete-missing-args',
+    'devices',
+    'dirs',
+    'dry-run',
+    'executability',
+    'exclude',
+    'existing',
+    'force',
+    'from0',
+    'group',
+    'hard-links',
+    'human-readable',
+    'ignore-existing',
+    'ignore-missing-args',
+    'ignore-times',
+    'implied-dirs',
+    'info',
+    'inplace',
+    'include',
+    'itemize-changes',
+    'links',
+    'modify-window',
+    'numeric-ids',
+    'omit-dir-times',
+    'omit-link-times',
+    'one-file-system',
+    'out-format',
+    'owner',
+    'partial',
+    'perms',
+    'preallocate',
+    'recursive',
+    'relative',
+    'safe-links',
+    'size-only',
+    'sparse',
+    'specials',
+    'super',
+    'times',
+    'update',
+    'verbose',
+    'whole-file',
+    'xattrs',
+}
+
+
+def check_options(opts):
+    """Raise for rsync options an agent does not run"""
+
+    for o in opts:
+        if o.startswith('--'):
+            name, _, value = o[2:].partition('=')
+            if name == 'files-from' and value == '-':
+                continue
+            if name.startswith('no-'):
+                name = name[3:]
+            if name in SAFE_OPTIONS or name in SAFE_FLAGS:
+                continue
+        elif o.startswith('-') and len(o) > 1 and set(o[1:]) <= SAFE_FLAGS:
+            continue
+
+        raise Exception(f'rsync option {o} is not allowed by agents')
+
+
+class WorkerLost(Exception):
+    """Agent is not reachable, transfer is not done"""
+
+
+def split_address(address, default_host='127.0.0.1'):
+    host, _, port = address.rpartition(':')
+    return host or default_host, int(port)
+
+
+class AgentRSync(RSync):
+    """RSync which transfers are run by the agent at address (host:port), same interface
+
+    Every instance keeps its own connection, agent runs its requests one by one.
+    """
+
+    def __init__(self, address, token, *args) -> None:
+        super().__init__(*args)
+        self.address = address
+        self.token = token
+        self.stream = None
+
+    def transfer_command(self, extra=()):
+        return [f'[{self.address}]'] + super().transfer_command(extra)
+
+    async def connect(self):
+        host, port = split_address(self.address)
+        try:
+            self.stream = await asyncio.open_connection(host, port, limit=LINE_LIMIT)
+        except OSError as e:
+            raise WorkerLost(f'agent {self.address} is not reachable: {e.strerror}') from e
+
+        reader, writer = self.stream
+        try:
+            writer.write(json.dumps({'token': self.token}).encode() + b'\n')
+            reply = json.loads(await reader.readline() or b'{"error": "connection is closed"}')
+        except OSError as e:
+            self.close()
+            raise WorkerLost(f'agent {self.address} is lost: {e}') from e
+
+        if 'error' in reply:
+            self.close()
+            raise WorkerLost(f'agent {self.address}: {reply["error"]}')
+
+    def close(self):
+        if self.stream:
+            self.stream[1].close()
+            self.stream = None
+
+    async def exchange(self, request, parser, error_callback):
+        """Send request, pass replies to parser and error_callback, final reply"""
+
+        reader, writer = self.stream
+        writer.write(json.dumps(request).encode() + b'\n')
+        await writer.drain()
+
+        while line := await reader.readline():
+            reply = json.loads(line)
+            if 'out' in reply:
+                parser.feed(os.fsencode(reply['out']))
+            elif 'err' in reply:
+                error_callback(reply['err'])
+            else:
+                return reply
+
+        raise ConnectionResetError('connection is closed by agent')
+
+    async def transfer(self, files, parser, error_callback, extra=(), process_callback=None):
+        """Transfer files by the agent, output of its rsync is fed to parser"""
+
+        started = time.monotonic()
+        if self.stream is None:
+            await self.connect()
+
+        request = {
+            'argv': self.opts + self.args,
+            'extra': parser.args + list(extra),
+            'names': [os.fsdecode(n) for n in self.names(files)],
+        }
+        try:
+            reply = await self.exchange(request, parser, error_callback)
+        except (OSError, EOFError) as e:
+            self.close()
+            raise WorkerLost(f'agent {self.address} is lost: {e}') from e
+
+        parser.close()
+        if 'error' in reply:
+            raise Exception(f'agent {self.address}: {reply["error"]}')
+
+        # wall time as seen by coordinator
+        return Usage(*reply['usage'])._replace(wall=time.monotonic() - started)
+
+
+class Forward:
+    """Parser of agent side: chunks of rsync output are sent to coordinator as they come"""
+
+    args = []
+
+    def __init__(self, send) -> None:
+        self.send = send
+        self.first = None
+
+    def feed(self, chunk):
+        if self.first is None:
+            self.first = time.monotonic()
+        self.send({'out': os.fsdecode(chunk)})
+
+    def close(self):
+        pass
+
+
+class Agent:
+    """Runs transfers requested by coordinators, requests of a connection one by one"""
+
+    def __init__(self, address, token, bus) -> None:
+        self.address = address
+        self.token = token
+        self.bus = bus
+
+    def authenticate(self, line):
+        try:
+            token = json.loads(line)['token']
+        except (ValueError, KeyError, TypeError):
+            return False
+
+        return isinstance(token, str) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    async def handle(self, reader, writer):
+        peer = '{}:{}'.format(*writer.get_extra_info('peername')[:2])
+        ntransfers = 0
+
+        def send(reply):
+            writer.write(json.dumps(reply).encode() + b'\n')
+
+        try:
+            if not self.authenticate(await reader.readline()):
+                self.bus.message('Agent', f'coordinator {peer} is rejected: bad token', 'warning')
+                send({'error': 'authentication failed'})
+                await writer.drain()
+                return
+
+            send({'ok': True})
+            self.bus.message('Agent', f'coordinator {peer} is connected')
+            while line := await reader.readline():
+                request = json.loads(line)
+                try:
+                    rsync = RSync(*request['argv'])
+                    check_options(rsync.opts + request['extra'])
+                    usage = await rsync.transfer(
+                        [(n,) for n in request['names']],
+                        Forward(send),
+                        lambda err: send({'err': err}),
+                        extra=request['extra'],
+                    )
+                    send({'usage': list(usage)})
+                except Exception as e:
+                    send({'error': str(e)})
+
+                ntransfers += 1
+                await writer.drain()
+        except (OSError, EOFError, ValueError) as e:
+            self.bus.message('Agent', f'coordinator {peer}: {e}', 'warning')
+        finally:
+            writer.close()
+
+        self.bus.message('Agent', f'coordinator {peer} is gone, {ntransfers} transfers done')
+
+    async def start(self):
+        """Listen on address, returns the server"""
+
+        if not self.token:
+            raise Exception('Agent requires a token (--agent-token)')
+
+        host, port = split_address(self.address)
+        server = await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+        self.bus.message('Agent', f'listening on {host}:{port}')
+        return server
+
+    async def serve(self):
+        async with await self.start() as server:
+            await server.serve_forever()
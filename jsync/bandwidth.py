@@ -0,0 +1,70 @@
+"""Global bandwidth budget shared by parallel jobs"""
+
+import time
+
+
+class BandwidthBudget:
+    """Splits total rate limit between running jobs
+
+    rsync limit (--bwlimit) is fixed for the life of the process, so a new
+    rsync gets what is left by other running jobs (but not less than a fair
+    share). Job using less than its limit is not bandwidth-bound and gives
+    the rest to others, when share of a job changes a lot its rsync is
+    restarted with the new limit.
+    """
+
+    total: int
+    jobs: list
+    slack: float
+    change: float
+    hold: float
+
+    def __init__(self, total, jobs, slack=0.9, change=0.25, hold=5.0) -> None:
+        self.total = total  # bytes per second
+        self.jobs = jobs  # all jobs, only active are accounted
+        self.slack = slack  # job using this part of its limit is bandwidth-bound
+        self.change = change  # relative change of limit worth restart of rsync
+        self.hold = hold  # seconds before limit of a new rsync is reconsidered
+
+    def bound(self, job):
+        """job is limited by its bwlimit (not by disk, latency or small files)"""
+        return job.bwlimit is not None and job.rate >= self.slack * job.bwlimit
+
+    def used(self, job, fair):
+        """part of budget used by running job"""
+
+        if job.bwlimit is None:
+            # rsync is not started yet
+            return fair
+
+        if self.bound(job) or time.monotonic() - job.limited < self.hold:
+            # not measured yet or using everything given
+            return job.bwlimit
+
+        return job.rate
+
+    def limit(self, job):
+        """bytes per second for the next rsync of job"""
+
+        others = [j for j in self.jobs if j is not job and j.active()]
+        fair = self.total / (len(others) + 1)
+        return int(max(fair, self.total - sum(self.used(j, fair) for j in others)))
+
+    def retune(self):
+        """Jobs which rsync should be restarted with new limit"""
+
+        now = time.monotonic()
+        ret = []
+        for j in self.jobs:
+            if not j.active() or j.bwlimit is None or now - j.limited < self.hold:
+                continue
+
+            target = self.limit(j)
+            if target < j.bwlimit * (1 - self.change):
+                # others need their share back
+                ret.append(j)
+            elif target > j.bwlimit * (1 + self.change) and self.bound(j):
+                # more is available and job can use it
+                ret.append(j)
+
+        return ret
@@ -0,0 +1,133 @@
+"""Shared queue of file batches for dynamically scheduled jobs"""
+
+import asyncio
+import time
+
+from .filelist import FileList, FileListView
+
+
+def batch_size(files):
+    """Number of bytes in a batch"""
+    if isinstance(files, FileListView):
+        return files.nbytes
+
+    return sum(f[2] for f in files)
+
+
+def make_batches(files, nfiles, nbytes=None):
+    """Split files (FileList or its view) into consecutive batches (views)
+    of nfiles entries or nbytes bytes (what comes first)"""
+
+    if isinstance(files, FileList):
+        files = files[:]
+
+    sizes = files.files.sizes
+    start = 0
+    size = 0
+    for n, i in enumerate(files.indexes):
+        size += sizes[i]
+        if n + 1 - start >= nfiles or (nbytes and size >= nbytes):
+            yield files[start : n + 1]
+            start = n + 1
+            size = 0
+
+    if start < len(files):
+        yield files[start:]
+
+
+class BatchQueue:
+    """Queue of batches, consumers get None once queue is closed and drained"""
+
+    nbytes: int
+    nfiles: int
+    closed: bool
+
+    def __init__(self) -> None:
+        self.queue = asyncio.Queue()
+        self.nbytes = 0
+        self.nfiles = 0
+        self.closed = False
+
+    def put(self, batch):
+        if self.closed:
+            raise Exception('Batch queue is closed')
+
+        self.nbytes += batch_size(batch)
+        self.nfiles += len(batch)
+        self.queue.put_nowait(batch)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.queue.put_nowait(None)
+
+    async def get(self):
+        batch = await self.queue.get()
+        if batch is None:
+            # keep end marker for other consumers
+            self.queue.put_nowait(None)
+            return None
+
+        self.nbytes -= batch_size(batch)
+        self.nfiles -= len(batch)
+        return batch
+
+    def qsize(self):
+        return self.queue.qsize() - (1 if self.closed else 0)
+
+
+class BatchBuilder:
+    """Collects streamed entries into FileList and puts batches (views) into the queue
+
+    Incomplete batch is also flushed when it waits longer than `timeout` seconds,
+    so jobs are not idle while a slow itemize produces next files: on append
+    and by flush_waiting() task when no entries come at all.
+    """
+
+    def __init__(self, queue, files, nfiles, nbytes=None, timeout=1.0, callback=None) -> None:
+        self.queue = queue
+        self.files = files
+        self.nfiles = nfiles
+        self.nbytes = nbytes
+        self.timeout = timeout
+        self.callback = callback
+        self.start = len(files)  # first entry of the current batch
+        self.size = 0
+        self.started = time.monotonic()
+
+    def __len__(self):
+        return len(self.files)
+
+    def append(self, entry):
+        if self.start == len(self.files):
+            self.started = time.monotonic()
+
+        self.files.append(entry)
+        self.size += entry[2]
+
+        if (
+            len(self.files) - self.start >= self.nfiles
+            or (self.nbytes and self.size >= self.nbytes)
+            or time.monotonic() - self.started > self.timeout
+        ):
+            self.flush()
+
+    async def flush_waiting(self):
+        """Flush incomplete batch once it waits longer than timeout, until cancelled"""
+
+        while True:
+            wait = self.timeout
+            if self.start < len(self.files):
+                wait = self.started + self.timeout - time.monotonic()
+                if wait <= 0:
+                    self.flush()
+                    wait = self.timeout
+            await asyncio.sleep(wait)
+
+    def flush(self):
+        if self.start < len(self.files):
+            self.queue.put(self.files[self.start :])
+            self.start = len(self.files)
+            self.size = 0
+            if self.callback:
+                self.callback()
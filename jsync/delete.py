@@ -0,0 +1,90 @@
+"""Deletion of extraneous destination entries by parallel rsyncs"""
+
+import asyncio
+import heapq
+
+from .parser import RecordParser
+
+
+class DeletionSink:
+    """Passes entries to files, names of entries to delete (*deleting) are collected apart"""
+
+    def __init__(self, files, deletions) -> None:
+        self.files = files
+        self.deletions = deletions
+
+    def __len__(self):
+        return len(self.files)
+
+    def append(self, entry):
+        if entry[1][0] == '*':
+            self.deletions.append(entry[0])
+        else:
+            self.files.append(entry)
+
+
+def top_entries(names):
+    """names not inside other deleted directories (those go with their directory)"""
+
+    deleted = set(names)
+
+    def nested(name):
+        while (i := name.rfind(b'/')) > 0:
+            name = name[:i]
+            if name in deleted:
+                return True
+        return False
+
+    return [n for n in deleted if not nested(n)]
+
+
+def shard(names, nshards):
+    """Split names into nshards lists, entries of a directory are kept together"""
+
+    dirs = {}
+    for n in top_entries(names):
+        dirs.setdefault(n.rpartition(b'/')[0], []).append(n)
+
+    # largest directories first, each one to the least loaded shard
+    shards = [(0, i, []) for i in range(nshards)]
+    for entries in sorted(dirs.values(), key=len, reverse=True):
+        size, i, shard = heapq.heappop(shards)
+        shard.extend(entries)
+        heapq.heappush(shards, (size + len(entries), i, shard))
+
+    return [s for _, _, s in sorted(shards, key=lambda s: s[1]) if s]
+
+
+async def delete(rsyncs, names, error_callback):
+    """Delete names on destination, one rsync of rsyncs per shard
+
+    Names are missing on source, rsync deletes them as missing arguments.
+    Returns number of deleted (top-level) entries and number of shards.
+    """
+
+    ndeleted = 0
+
+    def record(attr, size, name):
+        nonlocal ndeleted
+        if attr[0] == '*':
+            ndeleted += 1
+
+    async def run(rsync, names):
+        parser = RecordParser(record, lambda size, rate: None)
+        await rsync.transfer(
+            [(n,) for n in sorted(names)],
+            parser,
+            error_callback,
+            extra=['--delete-missing-args', '--force'],
+        )
+
+    shards = shard(names, len(rsyncs))
+    results = await asyncio.gather(
+        *[run(r, s) for r, s in zip(rsyncs, shards)], return_exceptions=True
+    )
+
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        raise Exception(f'{len(errors)} of {len(shards)} deletion rsyncs failed: {errors[0]}')
+
+    return ndeleted, len(shards)
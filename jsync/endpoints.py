@@ -0,0 +1,97 @@
+"""Equivalent addresses of the remote side shared by parallel jobs"""
+
+import time
+
+from .utils import natural_size, transfer_rate
+
+
+class Endpoints:
+    """Hosts reaching the same remote storage over different paths
+
+    Jobs are assigned to hosts round-robin, at every batch boundary a job
+    moves to the host with noticeably better per-stream throughput (EWMA of
+    batches transferred there). Streams leave a saturated path until
+    per-stream throughput of all paths is about the same, a path left
+    without jobs is probed again after a while.
+    """
+
+    hosts: list
+    rsyncs: dict
+    pools: dict
+    rate: dict
+    active: dict
+    alpha: float
+    margin: float
+    stale: float
+
+    def __init__(self, rsync, hosts, alpha=0.3, margin=0.2, stale=30.0) -> None:
+        self.hosts = hosts
+        self.rsyncs = {h: rsync.with_host(h) for h in hosts}
+        self.pools = {}  # host -> SSHPool
+        self.rate = {}  # host -> EWMA of per-stream throughput
+        self.measured = {}  # host -> time of last measurement
+        self.active = dict.fromkeys(hosts, 0)  # host -> number of jobs using it
+        self.nbatches = dict.fromkeys(hosts, 0)
+        self.nbytes = dict.fromkeys(hosts, 0)
+        self.alpha = alpha  # weight of the last measurement
+        self.margin = margin  # relative gain worth moving a job
+        self.stale = stale  # seconds after unused host is probed again
+
+    def rsync_for(self, host, n):
+        """RSync of n-th job running to host"""
+        if pool := self.pools.get(host):
+            return pool.rsync_for(n)
+
+        return self.rsyncs[host]
+
+    def assign(self, n):
+        """Initial host of n-th job"""
+        return self.hosts[n % len(self.hosts)]
+
+    def join(self, host):
+        self.active[host] += 1
+
+    def leave(self, host):
+        self.active[host] -= 1
+
+    def choose(self, current):
+        """Host for the next batch of a job using current host"""
+
+        if current not in self.rate:
+            # throughput of current host is not known yet
+            return current
+
+        now = time.monotonic()
+
+        def score(h):
+            if self.active[h]:
+                return self.rate.get(h, 0)
+            if h not in self.rate or now - self.measured[h] > self.stale:
+                # not measured (or long ago) and nobody uses it - worth a try
+                return float('inf')
+            return self.rate[h]
+
+        best = max(self.hosts, key=score)
+        if best == current or score(best) <= self.rate[current] * (1 + self.margin):
+            return current
+
+        self.active[current] -= 1
+        self.active[best] += 1
+        return best
+
+    def record(self, host, nbytes, seconds):
+        """Account batch of nbytes transferred to host in seconds"""
+
+        self.nbatches[host] += 1
+        self.nbytes[host] += nbytes
+        rate = nbytes / max(seconds, 1e-3)
+        prev = self.rate.get(host)
+        self.rate[host] = rate if prev is None else prev + self.alpha * (rate - prev)
+        self.measured[host] = time.monotonic()
+
+    def report(self):
+        return [
+            f'{h}: {self.nbatches[h]} batches, {natural_size(self.nbytes[h])}, '
+            f'{transfer_rate(self.rate.get(h, 0))} per stream'
+            for h in self.hosts
+        ]
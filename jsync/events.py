@@ -0,0 +1,89 @@
+"""Progress events of synchronization and the bus delivering them to subscribers"""
+
+from typing import NamedTuple
+
+
+class Message(NamedTuple):
+    """Informational message, level: info, warning or error"""
+
+    title: str
+    text: str
+    level: str = 'info'
+
+
+class JobAdded(NamedTuple):
+    job: int
+
+
+class JobStarted(NamedTuple):
+    job: int
+    command: str
+
+
+class JobProgress(NamedTuple):
+    """Counters of a job: bytes done, total bytes, rate (bytes/s) and current file"""
+
+    job: int
+    size: int
+    total: int
+    rate: float
+    file: str
+
+
+class FileDone(NamedTuple):
+    """File reported by rsync (attr is itemize string, empty for legacy parser)"""
+
+    job: int
+    name: str
+    attr: str
+    size: int
+
+
+class JobError(NamedTuple):
+    job: int
+    text: str
+
+
+class JobFinished(NamedTuple):
+    """Job is done, error is None on success"""
+
+    job: int
+    error: str = None
+
+
+class Span(NamedTuple):
+    """Finished interval of work (monotonic times) of a job, job 0 - synchronization itself"""
+
+    name: str
+    job: int
+    start: float
+    end: float
+    args: dict = None
+
+
+class TotalProgress(NamedTuple):
+    """Sum of all jobs counters (number of files while files are itemized)"""
+
+    size: int
+    total: int
+    rate: float
+
+
+class EventBus:
+    """Delivers published events to all subscribers synchronously"""
+
+    def __init__(self) -> None:
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def publish(self, event):
+        for s in self.subscribers:
+            s(event)
+
+    def message(self, title, text='', level='info'):
+        self.publish(Message(title, text, level))
@@ -0,0 +1,99 @@
+"""Single rsync run for small change sets, without separate dry run"""
+
+import asyncio
+
+
+class ChangeSetTooLarge(Exception):
+    pass
+
+
+class LimitSink:
+    """Counts entries reported by rsync, raises when change set exceeds limits
+
+    Bytes are counted for transferred regular files, max_bytes is optional.
+    Files are reported when they are done, so bytes are checked by progress
+    of the transfer as well: a single large file does not go through first.
+    """
+
+    def __init__(self, max_files, max_bytes=None) -> None:
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.nfiles = 0
+        self.nbytes = 0
+
+    def __len__(self):
+        return self.nfiles
+
+    def append(self, entry):
+        _, attr, size = entry
+        self.nfiles += 1
+        if attr[1] == 'f' and attr[0] in '<>':
+            self.nbytes += size
+
+        if self.nfiles > self.max_files:
+            raise ChangeSetTooLarge(f'more than {self.max_files} entries')
+        self.check_bytes(self.nbytes)
+
+    def progress(self, line):
+        """--info=progress2 line: bytes transferred so far, including current file"""
+        if line[:1] == ' ' and (fields := line.split()) and fields[0].isdigit():
+            self.check_bytes(int(fields[0]))
+
+    def check_bytes(self, nbytes):
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            raise ChangeSetTooLarge(f'more than {self.max_bytes} bytes')
+
+
+async def discard(stream):
+    while await stream.read(65536):
+        pass
+
+
+async def fast_path(rsync, sink, progress_callback, error_callback, kill_timeout=10.0):
+    """Run rsync over the whole tree, entries it reports go to sink (LimitSink)
+
+    Returns True when rsync is done, False when it is stopped as change set
+    is too large (entries it has done are not itemized by the next dry run).
+    rsync is terminated to let it remove its temporary files, killed when it
+    does not exit in kill_timeout seconds.
+    """
+
+    aborted = False
+
+    def progress(line):
+        sink.progress(line)
+        progress_callback(line)
+
+    def errors(line):
+        # rsync processes complain about the stopped one
+        if not aborted:
+            error_callback(line)
+
+    proc = await asyncio.create_subprocess_exec(
+        *rsync.direct_command(),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    reader = asyncio.ensure_future(rsync.read_errors(proc, errors))
+
+    try:
+        await rsync.read_listing(proc, sink, progress)
+    except ChangeSetTooLarge:
+        aborted = True
+        proc.terminate()
+        try:
+            await asyncio.wait_for(asyncio.gather(discard(proc.stdout), proc.wait()), kill_timeout)
+        except asyncio.TimeoutError:  # noqa: UP041 - not the builtin one before Python 3.11
+            proc.kill()
+            await discard(proc.stdout)
+
+    await reader
+    await proc.wait()
+
+    if aborted:
+        return False
+
+    if proc.returncode != 0:
+        raise Exception(f'Error running rsync: rc={proc.returncode}')
+
+    return True
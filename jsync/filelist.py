@@ -0,0 +1,207 @@
+"""Compact storage of the itemized list of files"""
+
+import os
+import tempfile
+from array import array
+
+
+class FileList:
+    """Append-only list of (filename, attr, size) entries, filename is raw bytes or str
+
+    Names are packed one after another into a bytes arena with array of offsets,
+    itemize attributes are interned into a small table of codes. When arena grows
+    over memory_limit bytes it is spilled into a temporary file.
+    Slices and views are zero-copy (range or array of indexes into the list).
+    """
+
+    def __init__(self, memory_limit=None) -> None:
+        self.memory_limit = memory_limit
+        self.attrs = []  # code -> attr
+        self.codes = {}  # attr -> code
+        self.kinds = array('H')
+        self.sizes = array('q')
+        self.offsets = array('Q', [0])
+        self.arena = bytearray()
+        self.spill = None  # file with first `spilled` bytes of arena
+        self.spilled = 0
+
+    def __len__(self):
+        return len(self.sizes)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.entry(i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return FileListView(self, range(*i.indices(len(self))))
+
+        if i < 0:
+            i += len(self)
+
+        return self.entry(i)
+
+    def append(self, entry):
+        filename, attr, size = entry
+
+        if (code := self.codes.get(attr)) is None:
+            code = self.codes[attr] = len(self.attrs)
+            self.attrs.append(attr)
+
+        name = os.fsencode(filename)
+        self.arena += name
+        self.offsets.append(self.offsets[-1] + len(name))
+        self.kinds.append(code)
+        self.sizes.append(size)
+
+        if self.memory_limit and len(self.arena) > self.memory_limit:
+            self.spill_arena()
+
+    def extend(self, entries):
+        for e in entries:
+            self.append(e)
+
+    def spill_arena(self):
+        if not self.spill:
+            self.spill = tempfile.TemporaryFile(prefix='jsync-')
+
+        self.spill.write(self.arena)
+        self.spill.flush()
+        self.spilled += len(self.arena)
+        self.arena = bytearray()
+
+    def name(self, i):
+        """raw (bytes) name of i-th entry"""
+        start, end = self.offsets[i], self.offsets[i + 1]
+        if start >= self.spilled:
+            return bytes(self.arena[start - self.spilled : end - self.spilled])
+
+        if end <= self.spilled:
+            return os.pread(self.spill.fileno(), end - start, start)
+
+        return os.pread(self.spill.fileno(), self.spilled - start, start) + bytes(
+            self.arena[: end - self.spilled]
+        )
+
+    def attr(self, i):
+        return self.attrs[self.kinds[i]]
+
+    def entry(self, i):
+        return (
+            os.fsdecode(self.name(i)),
+            self.attrs[self.kinds[i]],
+            self.sizes[i],
+        )
+
+    def view(self, indexes):
+        return FileListView(self, indexes)
+
+    def memory(self):
+        """approximate memory used by the list in bytes"""
+        return (
+            len(self.arena)
+            + self.offsets.itemsize * len(self.offsets)
+            + self.sizes.itemsize * len(self.sizes)
+            + self.kinds.itemsize * len(self.kinds)
+        )
+
+
+class FileListView:
+    """Part of FileList: range or array of indexes, does not copy entries"""
+
+    def __init__(self, files: FileList, indexes) -> None:
+        self.files = files
+        self.indexes = indexes
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def __iter__(self):
+        for i in self.indexes:
+            yield self.files.entry(i)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return FileListView(self.files, self.indexes[i])
+
+        return self.files.entry(self.indexes[i])
+
+    @property
+    def nbytes(self):
+        sizes = self.files.sizes
+        if isinstance(self.indexes, range) and self.indexes.step == 1:
+            return sum(sizes[self.indexes.start : self.indexes.stop])
+
+        return sum(sizes[i] for i in self.indexes)
+
+    def names(self):
+        """raw (bytes) names of entries"""
+        for i in self.indexes:
+            yield self.files.name(i)
+
+    def by_name(self):
+        """raw name -> (attr, size) of entries"""
+        f = self.files
+        return {f.name(i): (f.attr(i), f.sizes[i]) for i in self.indexes}
+
+    def split(self, predicate):
+        """views of entries which index matches predicate and of the rest"""
+        match = array('I')
+        rest = array('I')
+        for i in self.indexes:
+            (match if predicate(i) else rest).append(i)
+
+        return FileListView(self.files, match), FileListView(self.files, rest)
+
+    def without(self, names):
+        """view of entries with raw names not in names (set)"""
+        name = self.files.name
+        return FileListView(
+            self.files, array('I', (i for i in self.indexes if name(i) not in names))
+        )
+
+
+class Completion:
+    """Entries of a view marked done by raw name, as bitmap of positions in the view
+
+    Names are found by open addressing table of positions hashed by name,
+    names are not copied (they are compared with the list): about 2-4
+    bytes of table and a bit of bitmap per entry.
+    """
+
+    def __init__(self, view: FileListView) -> None:
+        self.view = view
+        self.bits = bytearray((len(view) + 7) // 8)
+        nslots = 1 << (2 * len(view) + 1).bit_length()
+        self.mask = nslots - 1
+        self.slots = array('l' if len(view) >= 2**31 else 'i', [-1]) * nslots
+        for pos, name in enumerate(view.names()):
+            slot = hash(name) & self.mask
+            while self.slots[slot] >= 0:
+                slot = (slot + 1) & self.mask
+            self.slots[slot] = pos
+
+    def find(self, name):
+        """position of entry with raw name in the view, None if it is not there"""
+        indexes, entry_name = self.view.indexes, self.view.files.name
+        slot = hash(name) & self.mask
+        while (pos := self.slots[slot]) >= 0:
+            if entry_name(indexes[pos]) == name:
+                return pos
+            slot = (slot + 1) & self.mask
+
+        return None
+
+    def add(self, name):
+        if (pos := self.find(name)) is not None:
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, pos):
+        return bool(self.bits[pos >> 3] & (1 << (pos & 7)))
+
+    def remaining(self):
+        """view of entries not marked done"""
+        indexes = self.view.indexes
+        return FileListView(
+            self.view.files, array('I', (i for n, i in enumerate(indexes) if n not in self))
+        )
@@ -1,23 +1,68 @@
-import random
+import os
 import re
+import time
+from typing import Optional
 
-from rich.progress import Progress, TaskID
-
+from .agent import WorkerLost
+from .bandwidth import BandwidthBudget
+from .batches import BatchQueue, batch_size
+from .endpoints import Endpoints
+from .events import (
+    EventBus,
+    FileDone,
+    JobAdded,
+    JobError,
+    JobFinished,
+    JobProgress,
+    JobStarted,
+    Span,
+)
+from .filelist import Completion
+from .journal import Journal
+from .native import NativeEngine
+from .parser import ProgressParser, RecordParser
 from .rsync import RSync
-from .utils import dehumanize_rate, elapsed_time
+from .tar import TarEngine, split_small
+from .utils import dehumanize_rate
 
 
 class Job:
     id: int
     files: list
-    progress: Progress
-    task: TaskID
-    color: int
+    queue: BatchQueue
+    bus: EventBus
     running: bool
+    retired: bool
+    lost: bool
     rsync: RSync
     file: str
     size: int
     total: int
+    base: int
+    transferred: int
+    skipped: int
+    nfiles: int
+    nbatches: int
+    parser: str
+    journal: Optional[Journal]
+    current: Optional[bytes]
+    track: bool
+    completed: Optional[Completion]
+    failed: list
+    latencies: list
+    nrsyncs: int
+    wall: float
+    user: float
+    sys: float
+    endpoints: Optional[Endpoints]
+    endpoint: Optional[str]
+    budget: Optional[BandwidthBudget]
+    extra: list
+    tar_threshold: Optional[int]
+    native: Optional[NativeEngine]
+    bwlimit: Optional[int]
+    limited: float
+    restarting: bool
     percent: float
     rate: float
     callback: callable
@@ -27,45 +72,131 @@ class Job:
         self,
         id: int,
         files: list,
-        progress: Progress,
+        bus: EventBus,
         rsync: RSync,
         callback: callable,
+        queue: BatchQueue = None,
+        parser: str = 'records',
+        journal: Journal = None,
+        endpoints: Endpoints = None,
+        endpoint: str = None,
+        budget: BandwidthBudget = None,
+        extra=(),
+        tar_threshold: int = None,
+        native: NativeEngine = None,
+        track: bool = False,
     ) -> None:
         self.id = id
         self.files = files
-        self.progress = progress
+        self.queue = queue
+        self.bus = bus
         self.rsync = rsync
         self.running = False
-        self.color = random.randint(20, 230)
+        self.retired = False
+        self.lost = False  # agent running transfers of the job is not reachable
         self.rate = 0
         self.file = ''
         self.percent = 0
         self.size = 0
         self.total = 0
+        self.base = 0  # bytes done by previous batches
+        self.transferred = 0  # bytes of files data transferred by current rsync
+        self.skipped = 0  # bytes of entries reported by current rsync without data transfer
+        self.nfiles = 0
+        self.nbatches = 0
+        self.parser = parser
+        self.journal = journal
+        self.current = None  # name reported last, done when the next one is reported
+        self.track = track  # entries done are tracked (for journal, retries, restarts)
+        self.completed = None  # entries done by current rsync, when tracked
+        self.failed = []  # views of entries not done by failed rsyncs
+        self.latencies = []  # seconds from start of every rsync to its first output
+        self.nrsyncs = 0  # successful rsyncs and their wall and CPU time
+        self.wall = self.user = self.sys = 0
+        self.endpoints = endpoints
+        self.endpoint = endpoint  # host of endpoints used by the job
+        self.budget = budget
+        self.extra = list(extra)  # rsync options of transfers
+        self.tar_threshold = tar_threshold  # smaller regular files go by tar stream
+        self.native = native  # local copy engine, other entries go by rsync
+        self.bwlimit = None  # bytes per second of current rsync
+        self.limited = 0  # time when bwlimit was set
+        self.proc = None  # running rsync
+        self.restarting = False
         self.callback = callback
         self.error_buf = ''
-        self.task = progress.add_task(
-            f"rsync [bold yellow]#{id}",
-            rate=0,
-            filename='',
-            percent='',
-            eta='',
-            total=0,
-            style=f'[color({self.color})]',
-        )
+        self.bus.publish(JobAdded(id))
 
     def start(self):
-        self.progress.start_task(self.task)
-        cmd = ' '.join(self.rsync.transfer_command())
-        self.progress.console.print(
-            f"[bright_cyan]Starting job #{self.id}:[/bright_cyan] {cmd}",
-            highlight=False,
-        )
+        cmd = ' '.join(self.rsync.transfer_command(self.make_parser().args + self.extra))
+        self.bus.publish(JobStarted(self.id, cmd))
         self.running = True
 
     def active(self):
         return self.running
 
+    def retire(self):
+        """Stop taking batches from the queue, current batch is finished"""
+        self.retired = True
+
+    def make_parser(self):
+        if self.parser == 'progress':
+            return ProgressParser(self.process_progress)
+
+        return RecordParser(self.process_record, self.process_rate)
+
+    def show_file(self, name, attr='', size=0):
+        self.file = name
+        self.bus.publish(FileDone(self.id, name, attr, size))
+
+    def set_progress(self, size, total, rate):
+        """Store job counters, pass their changes to callback and publish them"""
+
+        dsize, dtotal, drate = size - self.size, total - self.total, rate - self.rate
+        self.size, self.total, self.rate = size, total, rate
+
+        self.callback(dsize, dtotal, drate)
+        self.bus.publish(JobProgress(self.id, size, total, rate, self.file))
+
+    def update(self):
+        """Update progress from exactly known total and transferred bytes"""
+
+        size = min(self.base + self.transferred + self.skipped, self.total)
+        self.set_progress(size, self.total, self.rate)
+
+    def complete(self, name):
+        """Mark previously reported entry as done, name - raw name of the next one"""
+
+        if self.current is not None and self.completed is not None:
+            self.completed.add(self.current)
+            if self.journal:
+                self.journal.done((self.current,))
+
+        self.current = name.rstrip(b'/') or name
+
+    def done_size(self, files, nfailed):
+        """bytes of files done: all but entries failed (since nfailed-th view),
+        they are accounted again when retried"""
+        return batch_size(files) - sum(batch_size(v) for v in self.failed[nfailed:])
+
+    def remaining(self, files):
+        """view of files not done by current rsync (all of them when not tracked)"""
+        return self.completed.remaining() if self.completed is not None else files
+
+    def process_record(self, attr, size, name):
+        self.nfiles += 1
+        self.complete(name)
+        self.show_file(os.fsdecode(name), attr, size)
+
+        if attr[0] not in '<>' or attr[1] != 'f':
+            # directories, links, attribute changes - no data to transfer
+            self.skipped += size
+            self.update()
+
+    def process_rate(self, size, rate):
+        self.transferred = size
+        self.set_progress(min(self.base + size + self.skipped, self.total), self.total, rate)
+
     def process_progress(self, line):
         # file transferred:
         #   folder1/folder2/IMG_7440.xmp
@@ -74,7 +205,6 @@ class Job:
         #     123345   0%    4.73MB/s    1:05:31
         #    4538368 100%  136.61kB/s    0:00:32 (xfr#554, to-chk=0/557)
         percent = 0
-        delta = None
         if line[0] == ' ' and '% ' in line:
             ndone = ntotal = None
             if m := re.search(r'\(xfr#(\d+), to-chk=(\d+)/(\d+)\)', line):
@@ -84,9 +214,9 @@ class Job:
             else:
                 size, percent, rate, eta = line.split(None, 4)[:4]
 
-            size = int(size)
+            size = self.base + int(size)
             percent = int(percent.replace('%', ''))
-            self.rate = dehumanize_rate(rate)
+            rate = dehumanize_rate(rate)
 
             if percent < 10 and ntotal:
                 # within 10% - use number of files to estimate progress
@@ -95,41 +225,25 @@ class Job:
                 size_percent = percent
 
             if size_percent > 0:
-                total = int(size * 100 / size_percent)
+                total = self.base + int((size - self.base) * 100 / size_percent)
                 self.percent = percent
-                delta = size - self.size
             else:
                 percent = total = 0
 
-            self.size = size
             if not total:
                 total = self.total
-            else:
-                self.total = total
 
             # print(
             #   f'({self.id}) {line} total={total} size={size} '
             #   f'percent={percent}%({size_percent:4.2f}%) '
-            #   f'delta={delta} scan={ndone}/{ntotal}'
+            #   f'scan={ndone}/{ntotal}'
             # )
 
-            self.progress.update(
-                self.task,
-                total=total,
-                completed=size,
-                rate=self.rate,
-                eta=elapsed_time(total, size, self.rate),
-            )
-
-            # Update progress on current file
-            self.callback(delta, self)
+            self.set_progress(size, total, rate)
         else:
-            self.file = line
-            self.progress.console.print(
-                f"[color({self.color})]{line}",
-                highlight=False,
-            )
-            self.progress.update(self.task, filename=self.file)
+            self.nfiles += 1
+            self.complete(os.fsencode(line))
+            self.show_file(line)
 
     def process_error(self, err):
         self.error_buf += err
@@ -137,31 +251,186 @@ class Job:
         errors = self.error_buf.split('\n')
         self.error_buf = errors.pop()  # last part - not finished line, keep it
 
+        if self.restarting:
+            # complaints of rsync killed on purpose
+            return
+
         for e in errors:
-            self.progress.console.print(f"[red][bold]{self.id}[/bold][/red] Error: {e}")
+            self.bus.publish(JobError(self.id, e))
+
+    async def transfer_files(self, files):
+        """Transfer files by rsync, entries of other engine (if configured) go by it first"""
+
+        if self.native:
+            own, rest = self.native.split(files)
+            parts = [(own, self.native), (rest, None)]
+        elif self.tar_threshold is not None and TarEngine.usable(self.rsync):
+            small, rest = split_small(files, self.tar_threshold)
+            parts = [(small, TarEngine(self.rsync)), (rest, None)]
+        else:
+            return await self.rsync_files(files)
+
+        parts = [(p, engine) for p, engine in parts if len(p)]
+        for n, (part, engine) in enumerate(parts):
+            try:
+                await self.rsync_files(part, engine)
+            except Exception:
+                # entries of next parts are not done either
+                self.failed.extend(p for p, _ in parts[n + 1 :])
+                raise
+            self.base = self.size
+
+    async def rsync_files(self, files, engine=None):
+        """Run rsync (or engine with its interface) over files,
+        progress is accounted on top of previous batches"""
+
+        while True:
+            self.transferred = self.skipped = 0
+            self.current = None
+            self.completed = Completion(files) if self.track else None
+            if self.parser == 'records':
+                self.set_progress(self.size, self.base + batch_size(files), self.rate)
+
+            extra = list(self.extra)
+            if self.budget and engine is None:
+                self.bwlimit = self.budget.limit(self)
+                self.limited = time.monotonic()
+                extra.append(f'--bwlimit={max(1, self.bwlimit // 1024)}')
+
+            started = time.monotonic()
+            try:
+                usage = await (engine or self.rsync).transfer(
+                    files,
+                    self.make_parser(),
+                    self.process_error,
+                    extra=extra,
+                    process_callback=self.set_process,
+                )
+
+            except Exception:
+                if self.restarting:
+                    # killed for new limit, entries it has done are not transferred again
+                    self.restarting = False
+                    files = self.remaining(files)
+                    self.base = self.size
+                    continue
+
+                # the last reported entry could be interrupted, it is not done
+                self.failed.append(self.remaining(files))
+                raise
+
+            finally:
+                self.proc = None
+                self.bus.publish(
+                    Span('rsync', self.id, started, time.monotonic(), {'bytes': batch_size(files)})
+                )
+
+            self.restarting = False
+            break
+
+        if usage.latency is not None:
+            self.bus.publish(Span('startup', self.id, started, started + usage.latency))
+        self.bus.publish(Span('feed', self.id, started, started + usage.feed))
+
+        self.nrsyncs += 1
+        self.wall += usage.wall
+        self.user += usage.user or 0
+        self.sys += usage.sys or 0
+        if usage.latency is not None:
+            self.latencies.append(usage.latency)
+
+        if self.endpoints:
+            self.endpoints.record(self.endpoint, batch_size(files), time.monotonic() - started)
+
+        if self.journal:
+            self.journal.done(self.remaining(files).names())
+            self.journal.flush()
+
+        if self.parser == 'records':
+            # rsync succeeded - everything is done, including entries it did not report
+            self.skipped = self.total - self.base - self.transferred
+            self.update()
+
+    def set_process(self, proc):
+        self.proc = proc
+
+    def restart(self):
+        """Restart current rsync (with new bandwidth limit), done entries are kept"""
+
+        if self.proc and self.proc.returncode is None:
+            self.restarting = True
+            self.proc.terminate()
+
+    def select_endpoint(self):
+        """Move to the endpoint with better throughput, if there is one"""
+
+        host = self.endpoints.choose(self.endpoint)
+        if host != self.endpoint:
+            self.bus.message('Endpoints', f'job #{self.id} moves from {self.endpoint} to {host}')
+            self.endpoint = host
+            self.rsync = self.endpoints.rsync_for(host, self.id - 1)
+
+    async def run(self):
+        """Transfer batches from the queue until it is drained"""
+
+        nerrors = 0
+        if self.endpoints:
+            self.endpoints.join(self.endpoint)
+
+        while not self.retired and not self.lost and (batch := await self.queue.get()) is not None:
+            self.nbatches += 1
+            if self.endpoints:
+                self.select_endpoint()
+
+            base, nfailed = self.base, len(self.failed)
+            try:
+                await self.transfer_files(batch)
+
+            except WorkerLost as e:
+                # entries not done are in failed, they go to other jobs
+                self.lost = True
+                self.bus.publish(JobError(self.id, f'batch #{self.nbatches}: {e}'))
+
+            except Exception as e:
+                nerrors += 1
+                self.bus.publish(JobError(self.id, f'batch #{self.nbatches}: {e}'))
+
+            # account batch as done, rsync does not report unchanged files
+            self.base = base + self.done_size(batch, nfailed)
+            self.set_progress(self.base, self.base, 0)
+            if self.lost:
+                break
+
+        self.running = False
+        if self.endpoints:
+            self.endpoints.leave(self.endpoint)
+
+        if nerrors:
+            error = f'{nerrors} of {self.nbatches} batches failed'
+            self.bus.publish(JobFinished(self.id, error))
+            raise Exception(error)
+
+        self.bus.publish(JobFinished(self.id, 'agent is lost' if self.lost else None))
 
     async def transfer(self):
+        if self.queue is not None:
+            return await self.run()
+
         if not self.files:
-            self.progress.console.print(
-                f"[bright_red]Job {self.id}: Nothing to do - no files",
-                highlight=False,
-            )
+            self.bus.message(f'Job {self.id}', 'Nothing to do - no files', 'warning')
+            self.running = False
+            self.bus.publish(JobFinished(self.id))
             return
 
         try:
-            await self.rsync.transfer(
-                self.files,
-                progress_callback=self.process_progress,
-                error_callback=self.process_error,
-            )
-
-            self.progress.update(self.task, filename='done', rate=None, eta='')
+            await self.transfer_files(self.files)
+            self.set_progress(self.size, self.total, 0)
+            self.bus.publish(JobFinished(self.id))
 
         except Exception as e:
-            self.progress.update(
-                self.task,
-                filename=f'rsync error: {e}',
-                rate=None,
-                eta='-failed-',
-            )
+            self.set_progress(self.done_size(self.files, 0), self.total, 0)
+            self.bus.publish(JobFinished(self.id, f'rsync error: {e}'))
             raise
+
+        finally:
+            self.running = False
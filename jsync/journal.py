@@ -0,0 +1,109 @@
+"""Checkpoint journal of a run for retries and resume"""
+
+import os
+
+from .filelist import FileList
+
+
+class Journal:
+    """Append-only log of planned and completed entries
+
+    Records are NUL-terminated (names can not contain NUL):
+        P<attr>\\t<size>\\t<name>   - entry itemized for transfer
+        X<name>                    - extraneous entry itemized for deletion
+        E                          - itemize is complete, plan is known
+        D<name>                    - entry transferred
+        R                          - extraneous entries are deleted
+    With complete plan the run can be resumed without dry run:
+    only entries not marked as done are transferred (and deleted).
+    """
+
+    path: str
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self.file = None
+
+    def load(self, memory_limit=None):
+        """(remaining entries, names to delete, number of done entries)
+        or None if there is no complete plan"""
+
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+
+        planned = FileList(memory_limit)
+        done = set()
+        deletions = []
+        complete = False
+        # last record can be truncated by a crash
+        for r in data.split(b'\0')[:-1]:
+            kind = r[:1]
+            if kind == b'D':
+                done.add(r[1:])
+            elif kind == b'P':
+                attr, size, name = r[1:].split(b'\t', 2)
+                planned.append((name, attr.decode(), int(size)))
+            elif kind == b'X':
+                deletions.append(r[1:])
+            elif kind == b'R':
+                deletions = []
+            elif kind == b'E':
+                complete = True
+
+        if not complete:
+            return None
+
+        remaining = FileList(memory_limit)
+        for i in planned[:].without(done).indexes:
+            remaining.append((planned.name(i), planned.attr(i), planned.sizes[i]))
+
+        return remaining, deletions, len(done)
+
+    def open(self, append=False):
+        self.file = open(self.path, 'ab' if append else 'wb')
+
+    def close(self, remove=False):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+        if remove and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def track(self, files):
+        """wraps files container to record every appended entry as planned (or to delete)"""
+        return _Planner(files, self.file)
+
+    def complete(self):
+        self.file.write(b'E\0')
+        self.file.flush()
+
+    def done(self, names):
+        self.file.write(b''.join(b'D' + n + b'\0' for n in names))
+
+    def deleted(self):
+        self.file.write(b'R\0')
+        self.file.flush()
+
+    def flush(self):
+        self.file.flush()
+
+
+class _Planner:
+    def __init__(self, files, file) -> None:
+        self.files = files
+        self.file = file
+
+    def __len__(self):
+        return len(self.files)
+
+    def append(self, entry):
+        name, attr, size = entry
+        if attr[0] == '*':
+            self.file.write(b'X%s\0' % os.fsencode(name))
+        else:
+            self.file.write(b'P%s\t%d\t%s\0' % (attr.encode(), size, os.fsencode(name)))
+        self.files.append(entry)
@@ -2,8 +2,13 @@ import asyncio
 import sys
 import traceback
 
+from .agent import Agent
+from .events import EventBus
+from .parser import PARSERS
+from .partition import PARTITIONERS
 from .rsync import RSync
 from .syncer import Syncer
+from .utils import dehumanize_size
 
 
 def usage(e=''):
@@ -12,7 +17,76 @@ def usage(e=''):
 
 USAGE:
 
---job=<num-jobs> -j<n>  - Parallelize rsync run in number of jobs
+--jobs=<num-jobs> -j<n>         - Parallelize rsync run in number of jobs, default: 6
+--jobs=auto                     - Start with --min-jobs and add or retire jobs by observed
+                                  throughput (implies --schedule=queue)
+--min-jobs=<n>                  - Min number of jobs for --jobs=auto, default: 2
+--max-jobs=<n>                  - Max number of jobs for --jobs=auto, default: 16
+--partition=<count|size>        - Split list of files between jobs by number of files (count)
+                                  or by amount of bytes to transfer (size), default: count
+--schedule=<static|queue>       - Give every job its part of files up front (static) or let jobs
+                                  pull batches of files from a shared queue (queue), default: static
+--batch-files=<n>               - Max number of files in a batch for queue schedule, default: 1000
+--batch-size=<size>             - Max amount of bytes in a batch for queue schedule (like 1G)
+--stream                        - Start transfer of batches while list of files is still calculated
+                                  (implies --schedule=queue)
+--scan-jobs=<n>                 - Calculate list of files running <n> dry runs in parallel over
+                                  subdirectories of the source, default: 1 (single dry run)
+--scan-depth=<n>                - Levels of subdirectories to split parallel dry runs, default: 1
+--manifest=<file>               - Keep state of local source in <file> (SQLite), next runs check
+                                  only entries changed since previous successful run
+--rescan                        - Ignore manifest content, run full dry run (and update manifest)
+--verify-manifest               - Compare manifest with full dry run, report missed changes and exit
+--list-memory=<size>            - Spill names of itemized files to temporary file when they take
+                                  more than <size> of memory
+--parser=<records|progress>     - Track progress by per-file records and exact sizes (records)
+                                  or estimate it from rsync progress percentage (progress),
+                                  default: records
+--journal=<file>                - Record planned and transferred entries in <file>, it is removed
+                                  after successful run
+--resume                        - Transfer only entries not done according to --journal,
+                                  without dry run (if previous run has finished it)
+--retries=<n>                   - Retry entries not done by failed rsyncs up to <n> times,
+                                  with exponential backoff, default: 0
+--ssh-masters=<n>               - Number of multiplexed SSH connections shared by rsyncs to remote
+                                  host, 0 - every rsync connects on its own, default: one per job
+--endpoints=<host,...>          - Equivalent hosts (addresses) of the remote side, jobs are spread
+                                  over them and move to ones with better throughput between batches
+--total-bwlimit=<rate>          - Limit total transfer rate of all jobs (bytes/s, like 100M),
+                                  split between running jobs by their needs
+--metrics=<file|unix:path>      - Write metrics (JSON line per 5s) to file or unix socket
+--metrics-http=<[host:]port>    - Serve metrics in Prometheus text format over HTTP
+--engine=<rsync|native|auto>    - Copy entries of local-to-local sync by threads of jsync (native),
+                                  rsync is used for options native copy does not support
+                                  (auto - silently), default: rsync
+--tar-threshold=<size>          - Transfer regular files smaller than <size> (like 64K) by a tar
+                                  stream (local or over remote shell), larger ones by rsync
+--skeleton                      - Create all directories by a single rsync before jobs start,
+                                  jobs transfer files only, directory metadata is set at the end
+                                  (not with --stream)
+--delete-phase=<phase>          - With --delete remove extraneous destination entries by parallel
+                                  rsyncs (sharded by directory) before, after or concurrently
+                                  with transfer (before|after|concurrent), default: before
+--order=<name|inode|extent>     - Order files of every job (batch) of local source by inode or
+                                  physical extent (FIEMAP) for less seeks of native and tar
+                                  engines (rsync sorts by name), default: name
+--by-device                     - Jobs (batches) of local source read from a single device each
+--watch                         - After synchronization keep transferring changes of local source
+                                  reported by inotify, until interrupted (Linux)
+--watch-delay=<seconds>         - Transfer changes after no new ones for <seconds>, default: 1
+--reconcile=<seconds>           - Full scan of watch mode every <seconds>, default: 3600
+--agents=<host:port,...>        - Jobs run their rsyncs on mover hosts by jsync agents (--agent),
+                                  spread over them, share of a lost agent goes to others
+--agent=<[host:]port>           - Run agent: serve transfers of coordinators (--agents) on
+                                  <port>, rsync options running programs (--rsh) are refused
+--agent-token=<file>            - Shared secret of agent and coordinators (first line of <file>),
+                                  required by --agent and --agents
+--fast-path=<files>[,<size>]    - Run a single rsync without dry run first, if it reports more
+                                  than <files> entries (or <size> bytes of files) it is stopped
+                                  and parallel synchronization of the rest follows
+--trace=<file>                  - Record timeline of the run (phases, rsyncs, files, errors)
+                                  in Chrome trace format, open it in ui.perfetto.dev
+--no-echo                       - Do not print names of transferred files, show progress only
 ... rsync options ...
 
 """,
@@ -21,43 +95,227 @@ USAGE:
     sys.exit(1)
 
 
-async def main(argv):
-    jobs_num = 6
-    verbose = False
+def choice(*values):
+    def convert(v):
+        if v not in values:
+            raise Exception(f"Wrong value '{v}', expected one of: {', '.join(values)}")
+        return v
+
+    return convert
+
+
+def jobs_count(v):
+    return v if v == 'auto' else int(v)
+
+
+def host_list(v):
+    return [h for h in v.split(',') if h]
+
+
+def token_file(path):
+    with open(path) as f:
+        return f.readline().strip()
 
-    try:
-        cut = None
-        for i in range(len(argv)):
-            a = argv[i]
-            if a == '-j' or a == '--jobs':
-                jobs_num = int(argv[i + 1])
-                cut = (i, i + 2)
-                break
-            elif a.startswith('-j'):
-                jobs_num = int(argv[i][2:])
-                cut = (i, i + 1)
-            elif a.startswith('--jobs='):
-                jobs_num = int(argv[i][7:])
-                cut = (i, i + 1)
-            elif a == '--help' or a == '-h':
-                usage()
 
+def change_limits(v):
+    files, _, size = v.partition(',')
+    return int(files), dehumanize_size(size) if size else None
+
+
+# jsync own options: name -> (key, value converter or None for a flag)
+OPTIONS = {
+    '--jobs': ('jobs', jobs_count),
+    '--min-jobs': ('min_jobs', int),
+    '--max-jobs': ('max_jobs', int),
+    '--partition': ('partition', choice(*PARTITIONERS)),
+    '--schedule': ('schedule', choice('static', 'queue')),
+    '--batch-files': ('batch_files', int),
+    '--batch-size': ('batch_bytes', dehumanize_size),
+    '--stream': ('stream', None),
+    '--scan-jobs': ('scan_jobs', int),
+    '--scan-depth': ('scan_depth', int),
+    '--manifest': ('manifest', str),
+    '--rescan': ('rescan', None),
+    '--verify-manifest': ('verify', None),
+    '--list-memory': ('memory_limit', dehumanize_size),
+    '--parser': ('parser', choice(*PARSERS)),
+    '--journal': ('journal', str),
+    '--resume': ('resume', None),
+    '--retries': ('retries', int),
+    '--ssh-masters': ('ssh_masters', int),
+    '--endpoints': ('endpoints', host_list),
+    '--total-bwlimit': ('total_bwlimit', dehumanize_size),
+    '--metrics': ('metrics', str),
+    '--metrics-http': ('metrics_http', str),
+    '--engine': ('engine', choice('rsync', 'native', 'auto')),
+    '--tar-threshold': ('tar_threshold', dehumanize_size),
+    '--skeleton': ('skeleton', None),
+    '--delete-phase': ('delete_phase', choice('before', 'after', 'concurrent')),
+    '--order': ('order', choice('name', 'inode', 'extent')),
+    '--by-device': ('by_device', None),
+    '--watch': ('watch', None),
+    '--watch-delay': ('watch_delay', float),
+    '--reconcile': ('reconcile', float),
+    '--agents': ('agents', host_list),
+    '--agent': ('agent', str),
+    '--agent-token': ('agent_token', token_file),
+    '--fast-path': ('fast_path', change_limits),
+    '--trace': ('trace', str),
+    '--no-echo': ('quiet', None),
+}
+
+
+def parse_args(argv):
+    """Separate jsync options from rsync ones"""
+
+    opts = {
+        'jobs': 6,
+        'min_jobs': 2,
+        'max_jobs': 16,
+        'partition': 'count',
+        'schedule': 'static',
+        'batch_files': 1000,
+        'batch_bytes': None,
+        'stream': False,
+        'scan_jobs': 1,
+        'scan_depth': 1,
+        'manifest': None,
+        'rescan': False,
+        'verify': False,
+        'memory_limit': None,
+        'parser': 'records',
+        'journal': None,
+        'resume': False,
+        'retries': 0,
+        'ssh_masters': None,
+        'endpoints': None,
+        'total_bwlimit': None,
+        'metrics': None,
+        'metrics_http': None,
+        'engine': 'rsync',
+        'tar_threshold': None,
+        'skeleton': False,
+        'delete_phase': 'before',
+        'order': 'name',
+        'by_device': False,
+        'watch': False,
+        'watch_delay': 1.0,
+        'reconcile': 3600.0,
+        'agents': None,
+        'agent': None,
+        'agent_token': None,
+        'fast_path': None,
+        'trace': None,
+        'quiet': False,
+        'verbose': False,
+    }
+    rest = []
+
+    i = 0
+    while i < len(argv):
+        a = argv[i]
+        name, eq, value = a.partition('=')
+        if a == '-j':
+            name, eq, value = '--jobs', '=', argv[i + 1]
+            i += 1
+        elif a.startswith('-j'):
+            name, eq, value = '--jobs', '=', a[2:]
+        elif a == '--help' or a == '-h':
+            usage()
+
+        if name in OPTIONS:
+            key, convert = OPTIONS[name]
+            if convert is None:
+                # flag without value
+                if eq:
+                    raise Exception(f"Option {name} does not take a value")
+                opts[key] = True
+            else:
+                if not eq:
+                    i += 1
+                    value = argv[i]
+                opts[key] = convert(value)
+        else:
             if len(a) > 1 and a[0] == '-' and a[1] != '-' and 'v' in a:
-                verbose = True
+                opts['verbose'] = True
+            rest.append(a)
+
+        i += 1
+
+    if opts['resume'] and not opts['journal']:
+        raise Exception("Option --resume requires --journal")
 
-        if cut:
-            argv = argv[0 : cut[0]] + argv[cut[1] :]
+    if len(rest) < 2 and not opts['agent']:
+        raise Exception("Not enough rsync options provided")
 
-        if len(argv) < 2:
-            raise Exception("Not enough rsync options provided")
+    return opts, rest
+
+
+def make_syncer(opts, argv, bus):
+    return Syncer(
+        opts['jobs'],
+        RSync(*argv),
+        partition=opts['partition'],
+        schedule=opts['schedule'],
+        batch_files=opts['batch_files'],
+        batch_bytes=opts['batch_bytes'],
+        stream=opts['stream'],
+        scan_jobs=opts['scan_jobs'],
+        scan_depth=opts['scan_depth'],
+        manifest=opts['manifest'],
+        rescan=opts['rescan'],
+        verify=opts['verify'],
+        memory_limit=opts['memory_limit'],
+        parser=opts['parser'],
+        bus=bus,
+        min_jobs=opts['min_jobs'],
+        max_jobs=opts['max_jobs'],
+        journal=opts['journal'],
+        resume=opts['resume'],
+        retries=opts['retries'],
+        ssh_masters=opts['ssh_masters'],
+        endpoints=opts['endpoints'],
+        total_bwlimit=opts['total_bwlimit'],
+        metrics=opts['metrics'],
+        metrics_http=opts['metrics_http'],
+        trace=opts['trace'],
+        delete_phase=opts['delete_phase'],
+        skeleton=opts['skeleton'],
+        tar_threshold=opts['tar_threshold'],
+        engine=opts['engine'],
+        fast_path=opts['fast_path'],
+        order=opts['order'],
+        by_device=opts['by_device'],
+        watch=opts['watch'],
+        watch_delay=opts['watch_delay'],
+        reconcile=opts['reconcile'],
+        agents=opts['agents'],
+        agent_token=opts['agent_token'],
+    )
+
+
+async def main(argv):
+    verbose = False
+
+    try:
+        opts, argv = parse_args(argv)
+        verbose = opts['verbose']
 
     except Exception as e:
         usage(e)
 
+    # rich is only needed for console output, headless users of events() do not load it
+    from .render import ConsoleRenderer
+
+    bus = EventBus()
     try:
-        with Syncer(jobs_num, RSync(*argv)) as s:
-            await s.itemize()
-            await s.transfer()
+        if opts['agent']:
+            with ConsoleRenderer(bus, quiet=opts['quiet']):
+                await Agent(opts['agent'], opts['agent_token'], bus).serve()
+            return
+
+        with ConsoleRenderer(bus, quiet=opts['quiet']), make_syncer(opts, argv, bus) as s:
+            await s.synchronize()
 
     except Exception as e:
         print(f'Error: {e}', file=sys.stderr)
@@ -65,6 +323,34 @@ async def main(argv):
             print(*traceback.format_exception(e), file=sys.stderr)
 
 
+async def events(*argv):
+    """Run synchronization without console output, yield events (see jsync.events)
+
+    Takes the same arguments as command line, exception of synchronization
+    is raised after all events are delivered.
+    """
+
+    opts, argv = parse_args(argv)
+    bus = EventBus()
+    queue = asyncio.Queue()
+    bus.subscribe(queue.put_nowait)
+
+    async def run():
+        with make_syncer(opts, argv, bus) as s:
+            await s.synchronize()
+
+    task = asyncio.ensure_future(run())
+    task.add_done_callback(lambda _: queue.put_nowait(None))
+    try:
+        while (event := await queue.get()) is not None:
+            yield event
+    finally:
+        if not task.done():
+            task.cancel()
+
+    task.result()
+
+
 def synchronize(*argv):
     try:
         asyncio.run(main(argv or sys.argv[1:]))
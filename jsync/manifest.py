@@ -0,0 +1,109 @@
+"""Persistent cache of the source tree state for incremental re-synchronization"""
+
+import os
+import sqlite3
+
+
+class Manifest:
+    """SQLite manifest of a local source: path, size, mtime and last itemize outcome
+
+    Manifest is stored per source/destination pair after successful synchronization,
+    next run compares it with fast local stat walk of the source and itemizes
+    only new and changed entries. Changes made on destination side out of jsync
+    are not noticed - use full rescan (or verification) for that.
+    """
+
+    path: str
+    pair: str
+    outcome: dict
+
+    def __init__(self, path, source, destination) -> None:
+        self.path = path
+        self.pair = f'{source}\0{destination}'
+        self.outcome = {}
+        self.db = sqlite3.connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            ' pair TEXT, path TEXT, size INTEGER, mtime INTEGER, attr TEXT,'
+            ' PRIMARY KEY (pair, path))'
+        )
+
+    def close(self):
+        self.db.close()
+
+    def empty(self):
+        row = self.db.execute('SELECT 1 FROM entries WHERE pair = ? LIMIT 1', (self.pair,))
+        return row.fetchone() is None
+
+    @staticmethod
+    def walk(root, prefix=''):
+        """path -> (size, mtime) for every entry of the local tree, names as rsync reports them"""
+
+        ret = {}
+        stack = [(root, prefix)]
+        while stack:
+            top, rel = stack.pop()
+            try:
+                it = os.scandir(top)
+            except OSError:
+                continue
+
+            with it:
+                for e in it:
+                    name = f'{rel}/{e.name}' if rel else e.name
+                    try:
+                        st = e.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+
+                    ret[name] = (st.st_size, st.st_mtime_ns)
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append((e.path, name))
+
+        return ret
+
+    def changes(self, snapshot):
+        """(changed, deleted) - names new or changed since last run and names gone from source"""
+
+        known = set()
+        changed = []
+        deleted = []
+        rows = self.db.execute('SELECT path, size, mtime FROM entries WHERE pair = ?', (self.pair,))
+        for path, size, mtime in rows:
+            if (cur := snapshot.get(path)) is None:
+                deleted.append(path)
+            else:
+                known.add(path)
+                if cur != (size, mtime):
+                    changed.append(path)
+
+        changed.extend(p for p in snapshot if p not in known)
+        return sorted(changed), deleted
+
+    def track(self, files):
+        """wraps files container to remember itemize outcome of every entry"""
+        return _Recorder(files, self.outcome)
+
+    def save(self, snapshot):
+        with self.db:
+            self.db.execute('DELETE FROM entries WHERE pair = ?', (self.pair,))
+            self.db.executemany(
+                'INSERT INTO entries VALUES (?, ?, ?, ?, ?)',
+                (
+                    (self.pair, path, size, mtime, self.outcome.get(path, ''))
+                    for path, (size, mtime) in snapshot.items()
+                ),
+            )
+
+
+class _Recorder:
+    def __init__(self, files, outcome) -> None:
+        self.files = files
+        self.outcome = outcome
+
+    def __len__(self):
+        return len(self.files)
+
+    def append(self, entry):
+        self.outcome[os.fsdecode(entry[0])] = entry[1]
+        self.files.append(entry)
@@ -0,0 +1,173 @@
+"""Machine-readable metrics of a run: JSON lines and Prometheus text endpoint"""
+
+import asyncio
+import io
+import json
+import time
+
+
+class Metrics:
+    """Periodic snapshots of Syncer and Job counters
+
+    Snapshots are written as JSON lines to a file or unix socket (unix:PATH)
+    every interval and served in Prometheus text format over HTTP.
+    """
+
+    interval: float
+
+    def __init__(self, syncer, path=None, http=None, interval=5.0) -> None:
+        self.syncer = syncer
+        self.path = path
+        self.http = http  # [host:]port
+        self.interval = interval
+        self.started = time.monotonic()
+        self.writer = None
+        self.server = None
+        self.task = None
+        # consumer (JSON lines, HTTP scrapes) -> (time, {job: files}) of its previous snapshot
+        self.last = {}
+
+    def job(self, j, dt, last):
+        files = j.nfiles - last.get(j.id, j.nfiles)
+        return {
+            'id': j.id,
+            'active': j.active(),
+            'bytes': j.size,
+            'total': j.total,
+            'rate': j.rate,
+            'files': j.nfiles,
+            'files_rate': files / dt if dt else 0,
+            'rsyncs': j.nrsyncs,
+            'wall': j.wall,
+            'user': j.user,
+            'sys': j.sys,
+        }
+
+    def snapshot(self, consumer='json'):
+        """Counters of the run, rates are measured since previous snapshot of consumer"""
+
+        s = self.syncer
+        now = time.monotonic()
+        prev = self.last.get(consumer)
+        dt, last = (now - prev[0], prev[1]) if prev else (0, {})
+
+        jobs = [self.job(j, dt, last) for j in s.jobs]
+        files = sum(j['files'] for j in jobs)
+        self.last[consumer] = (now, {j.id: j.nfiles for j in s.jobs})
+
+        queue = s.queue
+        return {
+            'time': time.time(),
+            'elapsed': now - self.started,
+            'total': {
+                'bytes': s.size,
+                'total': s.total + (queue.nbytes if queue else 0),
+                'rate': s.rate,
+                'files': files,
+                'files_rate': sum(j['files_rate'] for j in jobs),
+            },
+            'queue': {
+                'batches': queue.qsize() if queue else 0,
+                'bytes': queue.nbytes if queue else 0,
+                'files': queue.nfiles if queue else 0,
+            },
+            'phases': {name: (end or now) - start for name, (start, end) in s.phases.items()},
+            'jobs': jobs,
+        }
+
+    def prometheus(self):
+        """Current snapshot in Prometheus text exposition format"""
+
+        m = self.snapshot('prometheus')
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f'# HELP jsync_{name} {help}')
+            lines.append(f'# TYPE jsync_{name} {kind}')
+            for labels, value in samples:
+                lbl = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f'jsync_{name}{{{lbl}}} {value}' if lbl else f'jsync_{name} {value}')
+
+        jobs = m['jobs']
+        metric('bytes', 'counter', 'Bytes done', [({}, m['total']['bytes'])])
+        metric('bytes_planned', 'gauge', 'Bytes to transfer', [({}, m['total']['total'])])
+        metric('rate_bytes', 'gauge', 'Transfer rate, bytes/s', [({}, m['total']['rate'])])
+        metric('files', 'counter', 'Files reported by rsync', [({}, m['total']['files'])])
+        metric('queue_batches', 'gauge', 'Batches waiting in queue', [({}, m['queue']['batches'])])
+        metric('queue_bytes', 'gauge', 'Bytes waiting in queue', [({}, m['queue']['bytes'])])
+        metric(
+            'phase_seconds',
+            'gauge',
+            'Duration of run phases',
+            [({'phase': p}, d) for p, d in m['phases'].items()],
+        )
+        for key, kind, help in (
+            ('bytes', 'counter', 'Bytes done by job'),
+            ('rate', 'gauge', 'Transfer rate of job, bytes/s'),
+            ('files', 'counter', 'Files reported by rsyncs of job'),
+            ('files_rate', 'gauge', 'Files per second of job'),
+            ('rsyncs', 'counter', 'Successful rsyncs of job'),
+            ('wall', 'counter', 'Wall time of rsyncs of job, seconds'),
+            ('user', 'counter', 'User CPU time of rsyncs of job, seconds'),
+            ('sys', 'counter', 'System CPU time of rsyncs of job, seconds'),
+        ):
+            metric(f'job_{key}', kind, help, [({'job': j['id']}, j[key]) for j in jobs])
+
+        return '\n'.join(lines) + '\n'
+
+    async def serve(self, reader, writer):
+        try:
+            # request line and headers, only GET is expected
+            while await reader.readline() not in (b'\r\n', b'\n', b''):
+                pass
+
+            body = self.prometheus().encode()
+            writer.write(
+                b'HTTP/1.0 200 OK\r\n'
+                b'Content-Type: text/plain; version=0.0.4\r\n'
+                b'Content-Length: %d\r\n\r\n%s' % (len(body), body)
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def open(self):
+        if self.path and self.path.startswith('unix:'):
+            _, self.writer = await asyncio.open_unix_connection(self.path[5:])
+        elif self.path:
+            self.writer = open(self.path, 'ab')
+
+        if self.http:
+            host, _, port = str(self.http).rpartition(':')
+            self.server = await asyncio.start_server(self.serve, host or '127.0.0.1', int(port))
+
+    def write(self):
+        if self.writer:
+            self.writer.write(json.dumps(self.snapshot()).encode() + b'\n')
+            if isinstance(self.writer, io.IOBase):
+                self.writer.flush()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.write()
+
+    async def start(self):
+        await self.open()
+        self.task = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+
+        # final state of the run
+        self.write()
+
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+
+        if self.server:
+            self.server.close()
+            self.server = None
@@ -0,0 +1,277 @@
+"""Native copy engine for local-to-local synchronization"""
+
+import asyncio
+import errno
+import os
+import resource
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .parser import EngineOutput
+from .rsync import RSync, Usage, re_cluster
+
+# rsync options the engine implements (or which do not change transfer of itemized entries)
+SHORT_OPTIONS = set('arlptgoDOvhqxi')
+LONG_FLAGS = {
+    '--archive': 'a',
+    '--recursive': 'r',
+    '--links': 'l',
+    '--perms': 'p',
+    '--times': 't',
+    '--group': 'g',
+    '--owner': 'o',
+    '--devices': 'D',
+    '--specials': 'D',
+    '--omit-dir-times': 'O',
+}
+LONG_OPTIONS = {
+    '--verbose',
+    '--human-readable',
+    '--quiet',
+    '--one-file-system',
+    '--itemize-changes',
+    '--no-implied-dirs',
+}
+# filters are applied by the dry run already, deletion is done by own phase
+LONG_PREFIXES = ('--delete', '--exclude', '--include', '--filter', '--info=', '--out-format=')
+
+
+def implied(opts):
+    """set of short options (flags) in effect"""
+
+    flags = set()
+    for o in opts:
+        if o.startswith('--no-'):
+            # --no-perms or by short name: --no-p
+            name = o[5:]
+            flags.discard(name if len(name) == 1 else LONG_FLAGS.get('--' + name))
+            continue
+
+        if o.startswith('--'):
+            new = LONG_FLAGS.get(o, '')
+        else:
+            # rest of a cluster after an option with value (-e, -f, ...) is the value
+            new = re_cluster.match(o[1:]).group()
+
+        flags.update(new)
+        if 'a' in new:
+            flags.update('rlptgoD')
+
+    return flags
+
+
+def current_umask():
+    mask = os.umask(0)
+    os.umask(mask)
+    return mask
+
+
+class NativeEngine:
+    """Copies itemized entries by threads with copy_file_range (sendfile, read/write)
+
+    Regular files, directories and symlinks are done, devices and specials
+    stay on rsync. Files are written to a temporary name and renamed, like
+    rsync does, metadata is preserved according to -p, -t, -o, -g (-a).
+    Interface of transfer is the one of RSync.transfer.
+    """
+
+    chunk = 8 * 1024 * 1024
+    kinds = ('f', 'd', 'L')
+
+    def __init__(self, rsync: RSync, njobs) -> None:
+        self.rsync = rsync
+        self.flags = implied(rsync.opts)
+        self.umask = current_umask()
+        self.pool = ThreadPoolExecutor(max_workers=njobs, thread_name_prefix='copy')
+        self.copy = self.copy_range
+
+    @staticmethod
+    def unsupported(rsync):
+        """reasons the engine can not be used for rsync (empty if it can)"""
+
+        ret = [a for a in rsync.args if RSync.is_remote(a)]
+        if len(rsync.sources()) != 1:
+            ret.append('multiple sources')
+
+        for o in rsync.opts:
+            if o.startswith('--'):
+                name = '--' + o[5:] if o.startswith('--no-') else o
+                if len(name) == 3 and name[2] in SHORT_OPTIONS:
+                    continue
+                if name not in LONG_FLAGS and name not in LONG_OPTIONS:
+                    if not o.startswith(LONG_PREFIXES):
+                        ret.append(o)
+            elif not set(o[1:]) <= SHORT_OPTIONS:
+                ret.append(o)
+
+        return ret
+
+    def split(self, files):
+        """views of entries done by the engine and of the rest"""
+        attr = files.files.attr
+        if 'l' not in self.flags:
+            # rsync skips symlinks without -l
+            return files.split(lambda i: attr(i)[1] in 'fd')
+        return files.split(lambda i: attr(i)[1] in self.kinds)
+
+    def copy_range(self, src, dst, count):
+        try:
+            return os.copy_file_range(src, dst, count)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+            self.copy = self.copy_sendfile
+            return self.copy(src, dst, count)
+
+    def copy_sendfile(self, src, dst, count):
+        try:
+            return os.sendfile(dst, src, None, count)
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL):
+                raise
+            self.copy = self.copy_rw
+            return self.copy(src, dst, count)
+
+    def copy_rw(self, src, dst, count):
+        return os.write(dst, os.read(src, min(count, self.chunk)))
+
+    def new_mode(self, st):
+        """mode of a new entry without -p: mode of source masked by umask, like rsync"""
+        return stat.S_IMODE(st.st_mode) & ~self.umask
+
+    def metadata(self, path, st, link=False, times=True, mode=None):
+        """mode - permissions to set without -p (None keeps them)"""
+        flags = self.flags
+        if 'o' in flags or 'g' in flags:
+            uid = st.st_uid if 'o' in flags else -1
+            gid = st.st_gid if 'g' in flags else -1
+            try:
+                os.chown(path, uid, gid, follow_symlinks=not link)
+            except PermissionError:
+                pass  # not root - like rsync, ownership is kept silently
+
+        if 'p' in flags and not link:
+            os.chmod(path, stat.S_IMODE(st.st_mode))
+        elif mode is not None and not link:
+            os.chmod(path, mode)
+        if times and 't' in flags and (not link or os.utime in os.supports_follow_symlinks):
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns), follow_symlinks=not link)
+
+    def temporary(self, dst):
+        head, tail = os.path.split(dst)
+        return os.path.join(head, b'.%s.jsync%d' % (tail, os.getpid()))
+
+    def copy_file(self, src, dst, st, progress):
+        try:
+            old = os.lstat(dst).st_mode
+        except FileNotFoundError:
+            old = 0
+        # replaced file keeps its permissions without -p
+        mode = stat.S_IMODE(old) if stat.S_ISREG(old) else self.new_mode(st)
+
+        tmp = self.temporary(dst)
+        fi = os.open(src, os.O_RDONLY)
+        try:
+            fo = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                done = 0
+                while done < st.st_size:
+                    n = self.copy(fi, fo, min(st.st_size - done, self.chunk))
+                    if n == 0:
+                        break  # file is truncated while copied
+                    done += n
+                    progress(done)
+            finally:
+                os.close(fo)
+
+            self.metadata(tmp, st, mode=mode)
+            os.replace(tmp, dst)
+        except BaseException:
+            if os.path.lexists(tmp):
+                os.unlink(tmp)
+            raise
+        finally:
+            os.close(fi)
+
+    def copy_link(self, src, dst, st):
+        tmp = self.temporary(dst)
+        os.symlink(os.readlink(src), tmp)
+        self.metadata(tmp, st, link=True)
+        os.replace(tmp, dst)
+
+    def copy_all(self, names, call, progress, report, error):
+        """Copy names (in thread)
+
+        call(f, *args) runs f in the event loop thread. Returns number of failed
+        entries, user and system CPU time of the thread.
+        """
+
+        usage = resource.getrusage(resource.RUSAGE_THREAD)
+
+        source = self.rsync.source()
+        destination = self.rsync.destination()
+        dirs = []
+        nerrors = 0
+        for name in names:
+            src = os.path.join(os.fsencode(source), name)
+            dst = os.path.join(os.fsencode(destination), name)
+            try:
+                st = os.lstat(src)
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                if stat.S_ISDIR(st.st_mode):
+                    mode = None
+                    if not os.path.isdir(dst):
+                        os.mkdir(dst, 0o700)
+                        mode = self.new_mode(st)
+                    # times and mode after files are written into it
+                    dirs.append((dst, st, mode))
+                elif stat.S_ISLNK(st.st_mode):
+                    self.copy_link(src, dst, st)
+                else:
+                    self.copy_file(src, dst, st, lambda n: call(progress, n))
+            except OSError as e:
+                nerrors += 1
+                call(error, f'{os.fsdecode(name)}: {e.strerror}')
+                continue
+
+            call(report, name)
+
+        for dst, st, mode in reversed(dirs):
+            try:
+                self.metadata(dst, st, times='O' not in self.flags, mode=mode)
+            except OSError as e:
+                nerrors += 1
+                call(error, f'{os.fsdecode(dst)}: {e.strerror}')
+
+        end = resource.getrusage(resource.RUSAGE_THREAD)
+        return nerrors, end.ru_utime - usage.ru_utime, end.ru_stime - usage.ru_stime
+
+    async def transfer(self, files, parser, error_callback, extra=(), process_callback=None):
+        """Copy files, rsync options of extra do not apply"""
+
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        output = EngineOutput(parser, files.by_name(), started)
+        nerrors, user, sys = await loop.run_in_executor(
+            self.pool,
+            self.copy_all,
+            list(files.names()),
+            loop.call_soon_threadsafe,
+            output.progress,
+            output.report,
+            error_callback,
+        )
+        if nerrors:
+            raise Exception(f'{nerrors} entries failed')
+
+        return Usage(
+            output.first - started if output.first else None,
+            time.monotonic() - started,
+            user,
+            sys,
+            0,
+        )
+
+    def close(self):
+        self.pool.shutdown(wait=False)
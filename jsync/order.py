@@ -0,0 +1,152 @@
+"""Ordering of the file list by location of entries on disks of local source"""
+
+import errno
+import fcntl
+import os
+import struct
+from array import array
+from itertools import chain, zip_longest
+
+from .filelist import FileList, FileListView
+
+# linux/fiemap.h: struct fiemap with room for a single struct fiemap_extent
+FS_IOC_FIEMAP = 0xC020660B
+FIEMAP = struct.Struct('=QQLLLL')  # start, length, flags, mapped extents, extent count, reserved
+EXTENT = struct.Struct('=QQQ16xL12x')  # logical, physical, length, flags
+
+
+def physical_offset(fd):
+    """Physical offset of the first extent of open file (0 for files without data)
+
+    Raises OSError when filesystem does not support FIEMAP.
+    """
+
+    buf = bytearray(FIEMAP.pack(0, 2**64 - 1, 0, 0, 1, 0) + bytes(EXTENT.size))
+    fcntl.ioctl(fd, FS_IOC_FIEMAP, buf)
+    if not FIEMAP.unpack_from(buf)[3]:
+        return 0
+
+    return EXTENT.unpack_from(buf, FIEMAP.size)[1]
+
+
+class DiskOrder:
+    """Location (device, position on it) of every entry of FileList under root
+
+    Position is the physical offset of the first extent with extents=True
+    (on filesystems supporting FIEMAP) or inode number - allocators keep
+    inodes of files created together close to each other and their data.
+    """
+
+    def __init__(self, root, files: FileList, extents=False) -> None:
+        self.root = os.fsencode(root)
+        self.files = files
+        self.extents = extents
+        self.devs = array('Q')
+        self.pos = array('Q')
+        self.inode_only = set()  # devices without FIEMAP
+
+    def position(self, path, st):
+        if not self.extents or st.st_dev in self.inode_only:
+            return st.st_ino
+
+        try:
+            fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW)
+        except OSError:
+            return st.st_ino
+
+        try:
+            return physical_offset(fd)
+        except OSError as e:
+            if e.errno in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL):
+                self.inode_only.add(st.st_dev)
+            return st.st_ino
+        finally:
+            os.close(fd)
+
+    def locate(self):
+        """stat (and map) every entry, entries missing on source go first"""
+
+        attr = self.files.attr
+        for i in range(len(self.devs), len(self.files)):
+            path = os.path.join(self.root, self.files.name(i))
+            try:
+                st = os.lstat(path)
+            except OSError:
+                self.devs.append(0)
+                self.pos.append(0)
+                continue
+
+            self.devs.append(st.st_dev)
+            self.pos.append(self.position(path, st) if attr(i)[1] == 'f' else st.st_ino)
+
+    def key(self, i):
+        return self.devs[i], self.pos[i]
+
+    def devices(self):
+        return set(self.devs)
+
+    def sort(self, files: FileListView):
+        """view of files in order of location"""
+        return FileListView(self.files, array('I', sorted(files.indexes, key=self.key)))
+
+    def groups(self, files):
+        """views of files on every device, largest first"""
+
+        if isinstance(files, FileList):
+            files = files[:]
+
+        devs = {}
+        for i in files.indexes:
+            devs.setdefault(self.devs[i], array('I')).append(i)
+
+        return sorted((FileListView(self.files, g) for g in devs.values()), key=lambda g: -g.nbytes)
+
+    def sequential(self, parts):
+        """Share of successive regular files of parts read in ascending order on the same device"""
+
+        attr = self.files.attr
+        forward = total = 0
+        for part in parts:
+            prev = None
+            for i in part.indexes:
+                if attr(i)[1] != 'f':
+                    continue
+                if prev is not None:
+                    total += 1
+                    forward += self.devs[i] == self.devs[prev] and self.pos[i] >= self.pos[prev]
+                prev = i
+
+        return forward / total if total else 1.0
+
+
+def split_jobs(groups, njobs, partitioner):
+    """Parts of per-device groups (views) for njobs, a device is read by its own jobs
+
+    Jobs are shared between devices proportionally to bytes, every device
+    gets at least one; with more devices than jobs devices are given to
+    the least loaded job, largest first.
+    """
+
+    if len(groups) >= njobs:
+        parts = [[] for _ in range(njobs)]
+        loads = [0] * njobs
+        for g in groups:
+            n = loads.index(min(loads))
+            parts[n].append(g.indexes)
+            loads[n] += g.nbytes
+        return [FileListView(groups[0].files, array('I', chain(*p))) for p in parts]
+
+    total = sum(g.nbytes for g in groups) or 1
+    counts = [1] * len(groups)
+    for _ in range(njobs - len(groups)):
+        # next job to the device with the most bytes per job
+        n = max(range(len(groups)), key=lambda n: groups[n].nbytes / total / counts[n])
+        counts[n] += 1
+
+    return [p for g, n in zip(groups, counts) for p in partitioner(g, n)]
+
+
+def interleave(batches):
+    """Batches of every device (list of iterables) in turn, running jobs read different devices"""
+
+    return [b for b in chain.from_iterable(zip_longest(*batches)) if b is not None]
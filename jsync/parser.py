@@ -0,0 +1,157 @@
+"""Parsers of rsync transfer output"""
+
+import os
+import re
+import time
+
+from .utils import dehumanize_rate
+
+# output lines are separated by \n, progress updates by \r
+re_lines = re.compile(rb'[\r\n]+')
+
+# record printed by --out-format='%i %l %n': changes, file size, file name
+re_record = re.compile(rb'([<>ch.][^\s]{7,10}|\*deleting)\s+(\d+) (.*)')
+
+# rsync escapes non-printable characters in names as \#ooo
+re_escape = re.compile(rb'\\#([0-7]{3})')
+
+
+def unescape(name):
+    """raw name from name escaped in rsync output"""
+    if b'\\#' not in name:
+        return name
+
+    return re_escape.sub(lambda m: bytes([int(m.group(1), 8)]), name)
+
+
+class OutputParser:
+    """Splits chunks of rsync output into lines, partial line is kept for the next chunk"""
+
+    args = []
+
+    def __init__(self) -> None:
+        self.rest = b''
+        self.first = None  # time of first output
+
+    def feed(self, chunk):
+        if self.first is None:
+            self.first = time.monotonic()
+
+        lines = re_lines.split(self.rest + chunk)
+        self.rest = lines.pop()
+        for line in lines:
+            if line:
+                self.line(line)
+
+    def close(self):
+        if self.rest:
+            self.line(self.rest)
+            self.rest = b''
+
+    def line(self, line):
+        raise NotImplementedError
+
+
+class ProgressParser(OutputParser):
+    """Legacy parser: -v file names and --info=progress2 lines passed to callback as text"""
+
+    args = ['-v']
+
+    skip = (
+        b"sending incremental file list",
+        b"building file list ... done",
+        b"receiving file list ... done",
+    )
+    re_skip = re.compile(
+        rb'created directory |sent \S+ bytes  received \S+ bytes  \S+ bytes/sec'
+        rb'|total size is \S+  speedup is \S+'
+    )
+
+    def __init__(self, callback) -> None:
+        super().__init__()
+        self.callback = callback
+
+    def line(self, line):
+        if line in self.skip or self.re_skip.match(line):
+            return
+
+        self.callback(line.decode(errors='replace'))
+
+
+class RecordParser(OutputParser):
+    """Machine-friendly parser: per-file records and progress counters
+
+    record_callback(attr, size, name) is called for every --out-format record,
+    progress_callback(size, rate) for every --info=progress2 line.
+    """
+
+    args = ['--out-format=%i %l %n']
+
+    def __init__(self, record_callback, progress_callback) -> None:
+        super().__init__()
+        self.record_callback = record_callback
+        self.progress_callback = progress_callback
+
+    def line(self, line):
+        if line[0] == 0x20:
+            #  123455332   0%  263.33MB/s    0:00:00 (xfr#2, to-chk=22854/22861)
+            size, _, rate = line.split(None, 3)[:3]
+            self.progress_callback(int(size), dehumanize_rate(rate.decode()))
+        elif m := re_record.match(line):
+            attr, size, name = m.groups()
+            self.record_callback(attr.decode(), int(size), unescape(name))
+
+
+class EngineOutput(OutputParser):
+    """Names of entries done by other engine (tar, native) reported to rsync output parser
+
+    entries - raw name -> (attr, size) from the file list, listed names come
+    as lines (fed output) or by report(). Data bytes of files are progress.
+    """
+
+    def __init__(self, parser, entries, started) -> None:
+        super().__init__()
+        self.parser = parser
+        self.entries = entries
+        self.started = started
+        self.done = 0  # bytes of files done
+        self.nfiles = 0
+
+    def rate(self, size):
+        return size / max(time.monotonic() - self.started, 1e-3)
+
+    def progress(self, partial):
+        """partial bytes of the current file are done"""
+        if isinstance(self.parser, RecordParser):
+            size = self.done + partial
+            self.parser.progress_callback(size, self.rate(size))
+
+    def line(self, line):
+        attr, size = self.entries.get(line, ('>f+++++++++', 0))
+        self.nfiles += 1
+        if attr[1] == 'f':
+            self.done += size
+
+        if isinstance(self.parser, RecordParser):
+            self.parser.record_callback(attr, size, line)
+            self.parser.progress_callback(self.done, self.rate(self.done))
+        else:
+            total = len(self.entries)
+            self.parser.callback(os.fsdecode(line))
+            self.parser.callback(
+                f'{self.done:>15} {100 * self.nfiles // total:3d}% '
+                f'{self.rate(self.done) / 1000:.2f}kB/s    0:00:00 '
+                f'(xfr#{self.nfiles}, to-chk={total - self.nfiles}/{total})'
+            )
+
+    def report(self, name):
+        """entry name is done"""
+        if self.first is None:
+            self.first = time.monotonic()
+        self.line(name)
+
+
+PARSERS = {
+    'records': RecordParser,
+    'progress': ProgressParser,
+}
@@ -0,0 +1,63 @@
+"""Splitting of the itemized file list between parallel jobs"""
+
+import heapq
+from array import array
+
+from .filelist import FileList
+
+# Per-file cost (in bytes) added to every entry by the size partitioner,
+# accounts for rsync per-file overhead (stat, checksum exchange, open/close),
+# so a job with a million of empty files is not considered as "free"
+FILE_OVERHEAD = 64 * 1024
+
+
+def partition_count(files, njobs):
+    """Split files into njobs contiguous slices with the same number of entries"""
+
+    size = len(files) // njobs
+    parts = []
+    for i in range(njobs):
+        fstart = i * size
+        fend = fstart + size if i < njobs - 1 else len(files)
+        parts.append(files[fstart:fend])
+
+    return parts
+
+
+def partition_size(files, njobs, overhead=FILE_OVERHEAD):
+    """Split files (FileList or its view) into njobs parts with (approximately) equal amount of work
+
+    Largest-first greedy: every entry, starting from the biggest ones, goes to
+    the least loaded job, where load is number of bytes plus per-file overhead.
+    Only the largest entries are sorted, the rest is distributed in original
+    (rsync) order, which is kept within every part.
+    """
+
+    if isinstance(files, FileList):
+        files = files[:]
+
+    sizes = files.files.sizes
+    heap = [(0, n) for n in range(njobs)]
+
+    def assign(size):
+        load, n = heapq.heappop(heap)
+        heapq.heappush(heap, (load + size + overhead, n))
+        return n
+
+    largest = heapq.nlargest(njobs * 64, files.indexes, key=sizes.__getitem__)
+    owner = {i: assign(sizes[i]) for i in largest}
+
+    parts = [array('I') for _ in range(njobs)]
+    for i in files.indexes:
+        n = owner.get(i)
+        if n is None:
+            n = assign(sizes[i])
+        parts[n].append(i)
+
+    return [files.files.view(p) for p in parts]
+
+
+PARTITIONERS = {
+    'count': partition_count,
+    'size': partition_size,
+}
@@ -0,0 +1,231 @@
+"""Rich console rendering of synchronization events"""
+
+import asyncio
+import random
+from types import TracebackType
+from typing import Optional
+
+from humanize import naturalsize
+from rich.console import Console
+from rich.markup import escape
+from rich.progress import (
+    BarColumn,
+    Progress,
+    SpinnerColumn,
+    TaskID,
+    TaskProgressColumn,
+)
+from rich.text import Text
+
+from .columns import FlexiColumn
+from .events import (
+    EventBus,
+    FileDone,
+    JobAdded,
+    JobError,
+    JobFinished,
+    JobProgress,
+    JobStarted,
+    Message,
+    TotalProgress,
+)
+from .utils import elapsed_time, transfer_rate
+
+
+class ConsoleRenderer:
+    """Draws progress bars and echoes transferred files
+
+    Events only update latest state of the bars and buffer echoed names,
+    screen is redrawn once per tick - cost of rendering does not depend on
+    how fast rsync reports files. Messages and errors are printed immediately.
+    """
+
+    bus: EventBus
+    quiet: bool
+    tick: float
+    max_echo: int
+    progress: Progress
+    master: TaskID
+    tasks: dict
+    colors: dict
+    counters: dict
+    files: dict
+    echo: list
+    dropped: int
+
+    def __init__(self, bus: EventBus, quiet=False, tick=0.1, max_echo=1000) -> None:
+        self.bus = bus
+        self.quiet = quiet
+        self.tick = tick
+        self.max_echo = max_echo  # names echoed per tick, the rest is only counted
+        self.tasks = {}
+        self.colors = {}
+        self.counters = {}  # task -> latest counters to apply on next tick
+        self.files = {}  # job -> latest file to show on next tick
+        self.echo = []
+        self.dropped = 0
+        self.ticker = None
+
+        def sz(size):
+            return naturalsize(size, gnu=True)
+
+        self.progress = Progress(
+            "{task.description}",
+            SpinnerColumn(),
+            BarColumn(),
+            TaskProgressColumn(text_format='[bright_magenta]{task.percentage:>3.0f}%'),
+            FlexiColumn(
+                lambda t: f'{sz(t.completed):>8} / {sz(t.total or 0):<8}',
+                style="progress.download",
+            ),
+            FlexiColumn(lambda t: f'{t.fields["eta"]:>10}', style='cyan'),
+            FlexiColumn(lambda t: f'{transfer_rate(t.fields["rate"]):>12}', style='bright_green'),
+            FlexiColumn(lambda t: f'  {t.fields["style"]}{escape(t.fields["filename"]):<64}'),
+            console=Console(),
+            auto_refresh=False,
+        )
+        self.console = self.progress.console
+        self.master = self.progress.add_task(
+            "total",
+            rate=0,
+            filename='',
+            percent='',
+            style='',
+            eta='',
+            total=None,
+        )
+
+    def print(self, text):
+        self.console.print(text, highlight=False)
+
+    def __call__(self, event):
+        if handler := self.handlers.get(type(event)):
+            handler(self, event)
+
+    def on_total(self, e: TotalProgress):
+        self.counters[self.master] = e
+
+    def on_progress(self, e: JobProgress):
+        self.counters[self.tasks[e.job]] = e
+
+    def on_file(self, e: FileDone):
+        self.files[e.job] = e.name
+        if self.quiet:
+            return
+
+        if len(self.echo) < self.max_echo:
+            self.echo.append(Text(e.name, style=f'color({self.colors[e.job]})'))
+        else:
+            self.dropped += 1
+
+    def on_added(self, e: JobAdded):
+        self.colors[e.job] = random.randint(20, 230)
+        self.tasks[e.job] = self.progress.add_task(
+            f"rsync [bold yellow]#{e.job}",
+            rate=0,
+            filename='',
+            percent='',
+            eta='',
+            total=0,
+            style=f'[color({self.colors[e.job]})]',
+        )
+
+    def on_started(self, e: JobStarted):
+        self.flush()
+        self.print(f"[bright_cyan]Starting job #{e.job}:[/bright_cyan] {escape(e.command)}")
+
+    def on_error(self, e: JobError):
+        self.flush()
+        self.print(f"[red][bold]{e.job}[/bold][/red] Error: {escape(e.text)}")
+
+    def on_finished(self, e: JobFinished):
+        task = self.tasks[e.job]
+        self.flush()
+        if e.error is None:
+            self.progress.update(task, filename='done', rate=None, eta='')
+        else:
+            self.progress.update(task, filename=e.error, rate=None, eta='-failed-')
+
+    def on_message(self, e: Message):
+        self.flush()
+        self.message(e.title, e.text, e.level)
+
+    handlers = {
+        TotalProgress: on_total,
+        JobProgress: on_progress,
+        FileDone: on_file,
+        JobAdded: on_added,
+        JobStarted: on_started,
+        JobError: on_error,
+        JobFinished: on_finished,
+        Message: on_message,
+    }
+
+    def message(self, title, text, level):
+        text = escape(text)
+        if level == 'error':
+            self.print(f"[red][bold]{escape(title)}[/bold][/red]: {text}")
+        elif level == 'warning':
+            self.print(f"[bright_red]{escape(title)}: {text}" if title else f"[bright_red]{text}")
+        elif title:
+            self.print(f"[bright_cyan]{escape(title)}:[/bright_cyan] {text}")
+        else:
+            self.print(text)
+
+    def flush(self):
+        """Print buffered names and apply latest state of the bars"""
+
+        if self.echo:
+            self.console.print(*self.echo, sep='\n', highlight=False)
+            self.echo = []
+
+        if self.dropped:
+            self.print(f"[bright_black]... and {self.dropped} more files")
+            self.dropped = 0
+
+        for task, c in self.counters.items():
+            self.progress.update(
+                task,
+                total=c.total,
+                completed=c.size,
+                rate=c.rate,
+                eta=elapsed_time(c.total, c.size, c.rate),
+            )
+        self.counters = {}
+
+        for job, name in self.files.items():
+            self.progress.update(self.tasks[job], filename=name)
+        self.files = {}
+
+        self.progress.refresh()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            self.flush()
+
+    def start(self):
+        self.bus.subscribe(self)
+        self.progress.start()
+        self.ticker = asyncio.ensure_future(self.run())
+
+    def stop(self):
+        if self.ticker:
+            self.ticker.cancel()
+            self.ticker = None
+
+        self.flush()
+        self.progress.stop()
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[type[BaseException]],
+        exc_val: Optional[BaseException],
+        exc_tb: Optional[TracebackType],
+    ):
+        self.stop()
@@ -1,27 +1,113 @@
 """Python class to wrap running of rsync binary in asynchroneous way"""
 
 import asyncio
+import os
 import re
+import time
+from typing import NamedTuple, Optional
+
+from .filelist import FileListView
+from .parser import re_record, unescape
+from .utils import process_times
+
+# flags of a short options cluster, up to and including the one taking a value
+re_cluster = re.compile(r'[^eBfMT@]*[eBfMT@]?')
+
+# filter rules merged from files: rsync reads them NUL-separated with --from0
+re_merge_rule = re.compile(r'(merge|dir-merge|\.|:)')
+FILTER_FILES = {'--exclude-from=': '--exclude=', '--include-from=': '--include='}
+
+
+def check_merge_rules(o):
+    """raises if option o merges filter rules from files"""
+
+    if o.startswith('--filter='):
+        rule = o[9:]
+    elif o.startswith('--'):
+        return
+    else:
+        flags = re_cluster.match(o[1:]).group()
+        if 'F' in flags:
+            raise Exception(f'rsync option {o} is not supported: -F merges filter files')
+        rule = o[1 + len(flags) :] if flags[-1:] == 'f' else ''
+
+    if re_merge_rule.match(rule):
+        raise Exception(f'rsync option {o} is not supported: use --exclude-from instead')
+
+
+def inline_filters(opts):
+    """opts with rules of --exclude-from and --include-from files given inline
+
+    Names are fed to rsync with --from0, which makes rsync read filter files
+    NUL-separated as well. Merge rules (-F, --filter='merge ...') can not be
+    given inline and are refused.
+    """
+
+    ret = []
+    for o in opts:
+        prefix = next((p for p in FILTER_FILES if o.startswith(p)), None)
+        if prefix is None:
+            check_merge_rules(o)
+            ret.append(o)
+            continue
+
+        path = o[len(prefix) :]
+        if path == '-':
+            raise Exception(f'rsync option {o} is not supported: stdin is used for names')
+        try:
+            with open(path, 'rb') as f:
+                lines = f.read().splitlines()
+        except OSError as e:
+            raise Exception(f'rsync option {o}: {e.strerror}') from e
+
+        # like rsync: empty lines and comments are skipped
+        ret.extend(
+            FILTER_FILES[prefix] + os.fsdecode(ln) for ln in lines if ln and ln[:1] not in b';#'
+        )
+
+    return ret
+
+
+class Usage(NamedTuple):
+    """Resources used by rsync run, CPU times are None when not known"""
+
+    latency: Optional[float]
+    wall: float
+    user: Optional[float]
+    sys: Optional[float]
+    feed: float  # seconds to write list of files to stdin
 
 
 class RSync:
     rsync_cmd = 'rsync'
     args_transfer = [
         '--files-from=-',
+        '--from0',
         '--info=progress2',
         '--no-v',
         '--no-h',
-        '-v',
     ]
 
     args_itemize = [
         '--dry-run',
         '--itemize-changes',
+        '--out-format=%i %l %n',
         '--no-v',
         '--no-h',
         '--info=progress2',
     ]
 
+    args_list = [
+        '--list-only',
+        '--no-h',
+        '--dirs',
+        '--no-recursive',
+    ]
+
+    # feed_input: size of a chunk written at once and stdin buffer size to wait for drain
+    feed_chunk = 256 * 1024
+    feed_high_water = 1024 * 1024
+
     def __init__(self, *args) -> None:
         self.opts = list(filter(lambda x: x[0] == '-', args))
         self.args = list(filter(lambda x: x[0] != '-', args))
@@ -53,62 +139,176 @@ class RSync:
 
         return '.'
 
-    def get_readlinecr(self):
-        async def readlinecr(self):
-            """overrides StreamReader.readline to make \r delimiter"""
-            sep = b'\r'
-            seplen = len(sep)
-            try:
-                line = await self.readuntil(sep)
-            except asyncio.exceptions.IncompleteReadError as e:
-                return e.partial
-            except asyncio.exceptions.LimitOverrunError as e:
-                if self._buffer.startswith(sep, e.consumed):
-                    del self._buffer[: e.consumed + seplen]
-                else:
-                    self._buffer.clear()
-                self._maybe_resume_transport()
-                raise ValueError(e.args[0]) from e
-            return line
-
-        return readlinecr
-
-    def itemize_command(self):
-        return [self.rsync_cmd] + self.args + self.args_itemize
+    def relative_source(self):
+        """path of the (single) source argument relative to common source"""
+        src, base = self.sources()[0], self.source()
+        if src.startswith(base):
+            src = src[len(base) :]
+
+        return src.strip('/')
+
+    @staticmethod
+    def is_remote(path):
+        """path is on remote host (host:path, host::module or rsync://)"""
+        return path.startswith('rsync://') or ':' in path.split('/')[0]
+
+    def remote_shell(self):
+        """(host, remote shell command) when rsync runs over remote shell, else (None, None)"""
+
+        remote = [p for p in self.args if self.is_remote(p)]
+        if not remote or remote[0].startswith('rsync://') or '::' in remote[0]:
+            return None, None
+
+        rsh = os.environ.get('RSYNC_RSH', 'ssh')
+        for o in self.opts:
+            if o.startswith('--rsh='):
+                rsh = o[6:]
+            elif o.startswith('-e') and len(o) > 2:
+                rsh = o[2:]
+
+        return remote[0].split(':')[0], rsh
+
+    def with_inline_filters(self):
+        """copy with filter files given inline (see inline_filters), self if there are none"""
+        opts = inline_filters(self.opts)
+        return self if opts == self.opts else type(self)(*opts, *self.args)
+
+    def with_rsh(self, rsh):
+        """copy running rsh as remote shell"""
+        opts = [o for o in self.opts if not o.startswith(('--rsh=', '-e'))]
+        return type(self)(*opts, f'--rsh={rsh}', *self.args)
+
+    def with_host(self, host):
+        """copy with host of remote arguments replaced (host can include user@)"""
+
+        def replace(path):
+            if not self.is_remote(path):
+                return path
+
+            if path.startswith('rsync://'):
+                m = re.match(r'(rsync://)([^/]*@)?([^/:]*)(.*)', path)
+            else:
+                m = re.match(r'()([^/:]*@)?([^/:]*)(:.*)', path)
+
+            scheme, user, _, rest = m.groups()
+            return scheme + ('' if '@' in host else user or '') + host + rest
+
+        return type(self)(*self.opts, *map(replace, self.args))
+
+    def itemize_command(self, source=None, extra=(), listed=False):
+        if listed:
+            # only names fed to stdin
+            return (
+                [self.rsync_cmd, self.source(), self.destination()]
+                + self.args_itemize
+                + ['--files-from=-', '--from0']
+                + list(extra)
+            )
+
+        if source is None:
+            return [self.rsync_cmd] + self.args + self.args_itemize
+
+        # shard: source is "<common source>/./<path>", -R keeps names relative to common source
+        return (
+            [self.rsync_cmd, source, self.destination()]
+            + self.args_itemize
+            + ['--relative']
+            + list(extra)
+        )
+
+    def direct_command(self):
+        """transfer of the whole tree with entries itemized like by dry run"""
+        args = [a for a in self.args_itemize if a != '--dry-run']
+        return [self.rsync_cmd] + self.args + args
+
+    def list_command(self, path):
+        return [self.rsync_cmd] + self.opts + RSync.args_list + [path.rstrip('/') + '/']
+
+    async def list_dirs(self, path):
+        """names of subdirectories of path (on source side)"""
+        proc = await asyncio.create_subprocess_exec(
+            *self.list_command(path),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+
+        stdout, _ = await proc.communicate()
+        if proc.returncode != 0:
+            raise Exception(f'Error listing {path}: rc={proc.returncode}')
+
+        dirs = []
+        for line in stdout.decode().split('\n'):
+            # drwxr-xr-x           4096 2024/03/10 12:00:00 name
+            parts = line.split(None, 4)
+            if len(parts) == 5 and parts[0][0] == 'd' and parts[4] != '.':
+                dirs.append(parts[4])
+
+        return dirs
+
+    async def shards(self, depth):
+        """(source, extra options) for every shard of itemize down to depth levels"""
+        base = self.source()
+        ret = []
+
+        async def walk(rel, level):
+            path = f'{base}/./{rel}' if rel else f'{base}/./'
+            if level == 0:
+                ret.append((path, []))
+                return
+
+            # directory itself and its direct entries, subdirectories are own shards
+            ret.append((path.rstrip('/') + '/', ['--dirs', '--no-recursive']))
+            for name in await self.list_dirs(f'{base}/{rel}'):
+                await walk(f'{rel}/{name}' if rel else name, level - 1)
+
+        await walk(self.relative_source(), depth)
+        return ret
 
     async def read_listing(self, proc, files, callback):
+        cdir = b'created directory '
         while buf := await proc.stdout.readline():
-            for line in re.split(r'[\r\n]+', buf.decode()):
+            for line in re.split(rb'[\r\n]+', buf):
                 if line:
-                    cdir = 'created directory '
-                    if line[0] == ' ':
-                        callback(line)
-                    elif line.startswith(cdir):
-                        callback(line)
-                    else:
-                        attr, filename = line[:12], line[13:]
+                    if line[0] == 0x20 or line.startswith(cdir):  # progress
+                        callback(line.decode(errors='replace'))
+                    elif m := re_record.match(line):
+                        attr, size, filename = m.groups()
 
                         # cut trailing slash
                         # (due to different meaning in rsync files-from)
-                        if filename[-1] == '/':
+                        if filename[-1] == 0x2F:
                             filename = filename[0:-1]
 
-                        files.append((filename, attr))
+                        files.append((unescape(filename), attr.decode(), int(size)))
 
         proc._transport.get_pipe_transport(1).close()
 
-    async def itemize(self, progress_callback, error_callback):
+    async def itemize(
+        self, progress_callback, error_callback, files=None, source=None, extra=(), names=None
+    ):
+        """Collect list of files to transfer, files - list or other container with append()
+
+        When names are given only those entries (relative to common source) are checked.
+        """
+
         proc = await asyncio.create_subprocess_exec(
-            *self.itemize_command(),
+            *self.itemize_command(source, extra, listed=names is not None),
+            stdin=asyncio.subprocess.PIPE if names is not None else None,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
 
-        files = []
-        await asyncio.gather(
+        if files is None:
+            files = []
+
+        tasks = [
             self.read_listing(proc, files, progress_callback),
             self.read_errors(proc, error_callback),
-        )
+        ]
+        if names is not None:
+            tasks.append(self.feed_input(proc, map(os.fsencode, names)))
+
+        await asyncio.gather(*tasks)
 
         await proc.wait()
 
@@ -119,32 +319,89 @@ class RSync:
 
         return files
 
-    async def feed_input(self, proc, files):
-        for f in files:
-            proc.stdin.write((f[0] + '\n').encode('utf-8'))
-            await proc.stdin.drain()
+    async def itemize_sharded(
+        self, progress_callback, error_callback, files=None, depth=1, njobs=4, shard_callback=None
+    ):
+        """Collect list of files running concurrent itemize over subtrees of the source
+
+        Returns files and scan statistics: number of shards, wall time and
+        cumulative time of all itemize runs.
+        """
+        started = time.monotonic()
+        shards = await self.shards(depth)
+
+        seen = set()  # directories are reported by both parent and own shard
+        durations = []
+        sem = asyncio.Semaphore(njobs)
+
+        async def run(source, extra):
+            async with sem:
+                t = time.monotonic()
+                ret = await self.itemize(
+                    progress_callback,
+                    error_callback,
+                    files=ShardSink([] if files is None else files, seen),
+                    source=source,
+                    extra=extra,
+                )
+                durations.append(time.monotonic() - t)
+                if shard_callback:
+                    shard_callback(len(durations), len(shards))
+                return ret.files
+
+        results = await asyncio.gather(
+            *[run(source, extra) for source, extra in shards], return_exceptions=True
+        )
+
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
 
-        proc.stdin.close()
+        if files is None:
+            # merge in order of shards
+            files = [f for r in results for f in r]
 
-    async def read_progress(self, proc, callback):
-        while buf := await proc.stdout.readlinecr():
-            for line in re.split(r'[\r\n]+', buf.decode()):
-                if line in (
-                    "sending incremental file list",
-                    "building file list ... done",
-                    "receiving file list ... done",
-                ) or line.startswith('created directory '):
-                    continue
+        return files, (len(shards), time.monotonic() - started, sum(durations))
 
-                if re.match(r'sent \S+ bytes  received \S+ bytes  \S+ bytes/sec', line):
-                    continue
+    @staticmethod
+    def names(files):
+        """raw names of entries"""
+        if isinstance(files, FileListView):
+            return files.names()
 
-                if re.match(r'total size is \S+  speedup is \S+', line):
-                    continue
+        return (os.fsencode(f[0]) for f in files)
 
-                if line:
-                    callback(line)
+    async def feed_input(self, proc, names):
+        """write NUL-terminated names to rsync stdin in large chunks"""
+
+        transport = proc.stdin.transport
+        transport.set_write_buffer_limits(high=self.feed_high_water)
 
+        chunk = []
+        size = 0
+        for name in names:
+            chunk.append(name)
+            size += len(name) + 1
+            if size >= self.feed_chunk:
+                chunk.append(b'')
+                proc.stdin.write(b'\0'.join(chunk))
+                chunk = []
+                size = 0
+                if transport.get_write_buffer_size() >= self.feed_high_water:
+                    await proc.stdin.drain()
+
+        if chunk:
+            chunk.append(b'')
+            proc.stdin.write(b'\0'.join(chunk))
+
+        await proc.stdin.drain()
+        proc.stdin.close()
+
+    async def read_progress(self, proc, parser):
+        while buf := await proc.stdout.read(65536):
+            parser.feed(buf)
+
+        parser.close()
         proc._transport.get_pipe_transport(1).close()
 
     async def read_errors(self, proc, callback):
@@ -156,30 +413,87 @@ class RSync:
 
         proc._transport.get_pipe_transport(2).close()
 
-    def transfer_command(self):
-        return [self.rsync_cmd] + self.args_transfer + [self.source(), self.destination()]
+    def transfer_command(self, extra=()):
+        return (
+            [self.rsync_cmd]
+            + self.args_transfer
+            + list(extra)
+            + [self.source(), self.destination()]
+        )
+
+    async def sample_times(self, proc, usage, interval=0.5):
+        """keep CPU times of running proc in usage (dict)"""
+        while proc.returncode is None:
+            if times := process_times(proc.pid):
+                usage['user'], usage['sys'] = times
+            await asyncio.sleep(interval)
 
-    async def transfer(self, files, progress_callback, error_callback):
-        asyncio.StreamReader.readlinecr = self.get_readlinecr()
+    async def transfer(self, files, parser, error_callback, extra=(), process_callback=None):
+        """Transfer files, output of rsync is fed to parser
 
+        process_callback is called with the started rsync process.
+        Returns Usage of the rsync: setup latency (seconds from start to first output),
+        wall time, CPU times and time of feeding list of files.
+        """
+
+        started = time.monotonic()
         proc = await asyncio.create_subprocess_exec(
-            *self.transfer_command(),
+            *self.transfer_command(parser.args + list(extra)),
             stdin=asyncio.subprocess.PIPE,
             stdout=asyncio.subprocess.PIPE,
             stderr=asyncio.subprocess.PIPE,
         )
+        if process_callback:
+            process_callback(proc)
 
-        await asyncio.gather(
-            self.feed_input(proc, files),
-            self.read_progress(proc, progress_callback),
-            self.read_errors(proc, error_callback),
-        )
+        usage = {'user': None, 'sys': None}
+        sampler = asyncio.ensure_future(self.sample_times(proc, usage))
 
-        await proc.wait()
+        async def feed():
+            await self.feed_input(proc, self.names(files))
+            usage['feed'] = time.monotonic() - started
+
+        try:
+            await asyncio.gather(
+                feed(),
+                self.read_progress(proc, parser),
+                self.read_errors(proc, error_callback),
+            )
+
+            # output is closed - rsync is exiting, take its final times before it is reaped
+            if times := process_times(proc.pid):
+                usage['user'], usage['sys'] = times
+
+            await proc.wait()
+        finally:
+            sampler.cancel()
 
         if proc.returncode > 0:
-            print(f'rsync processes exited with rc={proc.returncode}')
             raise Exception(f'Error running rsync: rc={proc.returncode}')
         elif proc.returncode < 0:
-            print(f'rsync processes exited due to signal {-proc.returncode}')
             raise Exception(f'Error running rsync: signal {-proc.returncode}')
+
+        return Usage(
+            parser.first - started if parser.first else None,
+            time.monotonic() - started,
+            usage['user'],
+            usage['sys'],
+            usage['feed'],
+        )
+
+
+class ShardSink:
+    """Passes entries to files, skipping directories already reported by another shard"""
+
+    def __init__(self, files, seen) -> None:
+        self.files = files
+        self.seen = seen
+
+    def append(self, entry):
+        filename, attr, _ = entry
+        if attr[1] == 'd' and attr[0] != '*':
+            if filename in self.seen:
+                return
+            self.seen.add(filename)
+
+        self.files.append(entry)
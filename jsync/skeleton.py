@@ -0,0 +1,42 @@
+"""Directory skeleton of destination created before parallel transfer of files"""
+
+from .parser import RecordParser
+
+# skeleton pass: directories only, metadata is set by the final pass
+SKELETON_OPTIONS = ['--omit-dir-times', '--no-perms', '--no-owner', '--no-group']
+
+# jobs: parent directories exist, they are not sent (and updated) by every rsync
+JOB_OPTIONS = ['--no-implied-dirs']
+
+
+class DirectorySink:
+    """Passes entries to files, directories are collected apart into dirs"""
+
+    def __init__(self, files, dirs) -> None:
+        self.files = files
+        self.dirs = dirs
+
+    def __len__(self):
+        return len(self.files)
+
+    def append(self, entry):
+        attr = entry[1]
+        if attr[1] == 'd' and attr[0] != '*':
+            self.dirs.append(entry)
+        else:
+            self.files.append(entry)
+
+
+async def sync_dirs(rsync, dirs, error_callback, extra=()):
+    """Transfer only directories (FileList) by a single rsync, returns number of created ones"""
+
+    ncreated = 0
+
+    def record(attr, size, name):
+        nonlocal ncreated
+        if attr[0] == 'c':
+            ncreated += 1
+
+    parser = RecordParser(record, lambda size, rate: None)
+    await rsync.transfer(dirs[:], parser, error_callback, extra=extra)
+    return ncreated
@@ -0,0 +1,124 @@
+"""Pool of multiplexed SSH connections shared by rsync processes"""
+
+import asyncio
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+
+
+class SSHPool:
+    """SSH control masters to the remote host of rsync
+
+    Every master is an authenticated connection, rsync processes started with
+    its control path open a session over it without new TCP and SSH handshake.
+    Jobs are spread over masters, so with a master per job every job still
+    has own TCP stream.
+    """
+
+    rsh: list
+    host: str
+    size: int
+    masters: list
+    latency: dict
+
+    # master exits by itself when jsync is gone and nobody uses it
+    persist = 60
+
+    def __init__(self, rsync, size) -> None:
+        self.rsync = rsync
+        self.host, rsh = rsync.remote_shell()
+        self.rsh = shlex.split(rsh or 'ssh')
+        self.size = size
+        self.dir = None
+        self.masters = []  # control paths of running masters
+        self.latency = {}  # control path -> seconds to connect
+
+    @staticmethod
+    def usable(rsync):
+        """rsync runs over ssh, so its connections can be multiplexed"""
+        host, rsh = rsync.remote_shell()
+        return host is not None and os.path.basename(shlex.split(rsh)[0]) == 'ssh'
+
+    def master_command(self, path):
+        return self.rsh + [
+            '-o',
+            f'ControlPath={path}',
+            '-o',
+            'ControlMaster=yes',
+            '-o',
+            f'ControlPersist={self.persist}',
+            '-f',
+            '-N',
+            self.host,
+        ]
+
+    def client_command(self, path):
+        return shlex.join(self.rsh + ['-o', f'ControlPath={path}', '-o', 'ControlMaster=no'])
+
+    async def connect(self, path):
+        started = time.monotonic()
+        # not a pipe: master goes to background with stderr inherited, pipe would not be closed
+        with tempfile.TemporaryFile() as err:
+            proc = await asyncio.create_subprocess_exec(
+                *self.master_command(path),
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=err,
+            )
+            await proc.wait()
+            if proc.returncode != 0:
+                err.seek(0)
+                msg = err.read().decode(errors='replace').strip()
+                raise Exception(f'ssh master to {self.host}: {msg}')
+
+        self.latency[path] = time.monotonic() - started
+        return path
+
+    async def start(self):
+        """Start masters, returns errors of those failed to start"""
+
+        # short path - unix socket path length is limited
+        self.dir = tempfile.mkdtemp(prefix='jsync-')
+        paths = [os.path.join(self.dir, f'{i}') for i in range(self.size)]
+
+        # first one alone: interactive authentication (if any) is not mixed with others
+        results = await asyncio.gather(self.connect(paths[0]), return_exceptions=True)
+        if not isinstance(results[0], Exception):
+            results += await asyncio.gather(*map(self.connect, paths[1:]), return_exceptions=True)
+
+        errors = []
+        for r in results:
+            if isinstance(r, Exception):
+                errors.append(r)
+            else:
+                self.masters.append(r)
+
+        return errors
+
+    def rsync_for(self, n):
+        """RSync of n-th job running over one of masters"""
+        if not self.masters:
+            return self.rsync
+
+        return self.rsync.with_rsh(self.client_command(self.masters[n % len(self.masters)]))
+
+    def close(self):
+        for path in self.masters:
+            try:
+                subprocess.run(
+                    self.rsh + ['-o', f'ControlPath={path}', '-O', 'exit', self.host],
+                    stdin=subprocess.DEVNULL,
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    timeout=10,
+                )
+            except subprocess.TimeoutExpired:
+                pass  # master exits by itself after ControlPersist
+        self.masters = []
+
+        if self.dir:
+            shutil.rmtree(self.dir, ignore_errors=True)
+            self.dir = None
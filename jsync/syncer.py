@@ -1,151 +1,926 @@
 import asyncio
+import os
 import re
+import time
+from array import array
+from itertools import chain
 from types import TracebackType
-from typing import Optional
-
-from humanize import naturalsize
-from rich.console import Console
-from rich.progress import (
-    BarColumn,
-    Progress,
-    SpinnerColumn,
-    TaskID,
-    TaskProgressColumn,
-)
-
-from .columns import FlexiColumn
+from typing import TYPE_CHECKING, Optional
+
+from .agent import AgentRSync, check_options
+from .bandwidth import BandwidthBudget
+from .batches import BatchBuilder, BatchQueue, make_batches
+from .delete import DeletionSink, delete
+from .endpoints import Endpoints
+from .events import EventBus, Span, TotalProgress
+from .fastpath import LimitSink, fast_path
+from .filelist import FileList
 from .job import Job
+from .journal import Journal
+from .native import NativeEngine
+from .order import DiskOrder, interleave, split_jobs
+from .partition import PARTITIONERS
 from .rsync import RSync
-from .utils import elapsed_time, transfer_rate
+from .skeleton import JOB_OPTIONS, SKELETON_OPTIONS, DirectorySink, sync_dirs
+from .ssh import SSHPool
+from .tar import TarEngine
+from .tuner import JobTuner
+from .utils import natural_size, peak_rss, transfer_rate
+
+if TYPE_CHECKING:
+    # optional components are imported when used: short runs start faster
+    from .manifest import Manifest
+    from .metrics import Metrics
+    from .trace import Tracer
 
 
 class Syncer:
     jobs: list[Job]
+    tasks: dict[int, asyncio.Task]
     njobs: int
+    tuner: Optional[JobTuner]
+    partition: str
+    schedule: str
+    stream: bool
+    scan_jobs: int
+    scan_depth: int
+    manifest: Optional['Manifest']
+    snapshot: Optional[dict]
+    batch_files: int
+    batch_bytes: Optional[int]
+    queue: Optional[BatchQueue]
+    journal: Optional[Journal]
+    resumed: Optional[FileList]
+    retries: int
+    retry_delay: float
+    ssh_masters: Optional[int]
+    ssh: list[SSHPool]
+    endpoints: Optional[Endpoints]
+    budget: Optional[BandwidthBudget]
+    delete_phase: str
+    deletions: list
+    dirs: Optional[FileList]
+    tar_threshold: Optional[int]
+    native: Optional[NativeEngine]
+    fast_path: Optional[tuple]
+    order: str
+    by_device: bool
+    agents: list[str]
+    agent_token: Optional[str]
+    connections: list[AgentRSync]
+    watch: bool
+    watch_delay: float
+    reconcile: float
+    phases: dict
+    metrics: Optional['Metrics']
+    tracer: Optional['Tracer']
+    size: int
     total: int
-    progress: Optional[Progress]
-    master: TaskID
+    rate: float
+    bus: EventBus
     rsync: RSync
 
-    def __init__(self, njobs, rsync=None) -> None:
-        self.rsync = rsync or RSync()
+    def __init__(
+        self,
+        njobs,
+        rsync=None,
+        partition='count',
+        schedule='static',
+        batch_files=1000,
+        batch_bytes=None,
+        stream=False,
+        scan_jobs=1,
+        scan_depth=1,
+        manifest=None,
+        rescan=False,
+        verify=False,
+        memory_limit=None,
+        parser='records',
+        bus=None,
+        min_jobs=2,
+        max_jobs=16,
+        journal=None,
+        resume=False,
+        retries=0,
+        retry_delay=2.0,
+        ssh_masters=None,
+        endpoints=None,
+        total_bwlimit=None,
+        metrics=None,
+        metrics_http=None,
+        trace=None,
+        delete_phase='before',
+        skeleton=False,
+        tar_threshold=None,
+        engine='rsync',
+        fast_path=None,
+        order='name',
+        by_device=False,
+        watch=False,
+        watch_delay=1.0,
+        reconcile=3600.0,
+        agents=None,
+        agent_token=None,
+    ) -> None:
+        # names are fed NUL-separated, filter files are not read that way
+        self.rsync = (rsync or RSync()).with_inline_filters()
+        self.bus = bus or EventBus()
+        self.size = 0
         self.total = 0
+        self.rate = 0
+        self.partition = partition
+        self.agents = agents or []  # addresses of agents running transfers of jobs
+        self.agent_token = agent_token
+        self.connections = []
+        if self.agents:
+            self.check_agents(engine != 'rsync' or tar_threshold is not None or endpoints)
+            # a lost agent leaves its entries to others: jobs share the queue
+            schedule = 'queue'
+        self.tuner = None
+        if njobs == 'auto':
+            # workers are added and retired at batch boundaries
+            self.tuner = JobTuner(min_jobs, max_jobs)
+            njobs = min_jobs
+            schedule = 'queue'
+        self.schedule = 'queue' if stream else schedule
+        self.stream = stream
+        self.scan_jobs = scan_jobs
+        self.scan_depth = scan_depth
+        self.manifest_path = manifest
+        self.manifest = None
+        self.snapshot = None
+        self.rescan = rescan
+        self.verify = verify
+        self.memory_limit = memory_limit
+        self.parser = parser
+        self.batch_files = batch_files
+        self.batch_bytes = batch_bytes
+        self.queue = None
+        self.journal = Journal(journal) if journal else None
+        self.resume = resume
+        self.resumed = None
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.ssh_masters = ssh_masters  # None - master per job, 0 - no multiplexing
+        self.ssh = []
+        self.endpoints = None
+        if endpoints:
+            if not any(RSync.is_remote(a) for a in self.rsync.args):
+                raise Exception('Endpoints require remote source or destination')
+            self.endpoints = Endpoints(self.rsync, endpoints)
 
         self.jobs = []
+        self.tasks = {}  # job id -> task of its last run
+        self.budget = BandwidthBudget(total_bwlimit, self.jobs) if total_bwlimit else None
+        self.delete_phase = delete_phase  # before, after or concurrent with transfer
+        self.deletions = []  # names of extraneous destination entries
+        self.dirs = None  # directories created by skeleton pre-pass
+        self.tar_threshold = tar_threshold
+        if tar_threshold is not None and (unsupported := TarEngine.unsupported(self.rsync)):
+            self.bus.message(
+                'Tar',
+                f'tar stream does not support {", ".join(unsupported)}, rsync is used',
+                'warning',
+            )
+        self.native = None
+        if engine != 'rsync':
+            if not (unsupported := NativeEngine.unsupported(self.rsync)):
+                # jobs are threads of the pool, at most max_jobs with --jobs=auto
+                self.native = NativeEngine(self.rsync, self.tuner.max_jobs if self.tuner else njobs)
+            elif engine == 'native':
+                self.bus.message(
+                    'Engine',
+                    f'native copy does not support {", ".join(unsupported)}, rsync is used',
+                    'warning',
+                )
+        self.fast_path = fast_path  # (max files, max bytes) of change set for single rsync
+        self.order = order  # of entries within parts (batches): name, inode or extent
+        self.by_device = by_device  # parts (batches) of jobs do not mix source devices
+        if stream and (order != 'name' or by_device):
+            raise Exception('Ordering requires complete list of files, not --stream')
+        self.watch = watch  # keep synchronizing changes of local source until interrupted
+        self.watch_delay = watch_delay  # seconds without changes before they are transferred
+        self.reconcile = reconcile  # seconds between full scans of watch mode
+        if watch and (stream or skeleton or journal or manifest):
+            raise Exception('Watch mode does not support stream, skeleton, journal or manifest')
+        if skeleton:
+            if stream:
+                raise Exception('Skeleton requires complete list of directories, not --stream')
+            self.dirs = FileList(memory_limit)
+        self.phases = {}  # name -> [start, end]
+        self.metrics = None
+        if metrics or metrics_http:
+            from .metrics import Metrics
+
+            self.metrics = Metrics(self, metrics, metrics_http)
+        self.tracer = None
+        if trace:
+            from .trace import Tracer
+
+            self.tracer = Tracer(trace, self.bus)
         self.njobs = njobs
-        self.console = Console()
-        self.progress = None
-
-    def init_progress(self):
-        def sz(size):
-            return naturalsize(size, gnu=True)
-
-        self.progress = Progress(
-            "{task.description}",
-            SpinnerColumn(),
-            BarColumn(),
-            TaskProgressColumn(text_format='[bright_magenta]{task.percentage:>3.0f}%'),
-            FlexiColumn(
-                lambda t: f'{sz(t.completed):>8} / {sz(t.total):<8}',
-                style="progress.download",
-            ),
-            FlexiColumn(lambda t: f'{t.fields["eta"]:>10}', style='cyan'),
-            FlexiColumn(lambda t: f'{transfer_rate(t.fields["rate"]):>12}', style='bright_green'),
-            FlexiColumn(lambda t: f'  {t.fields["style"]}{t.fields["filename"]:<64}'),
-        )
-
-        self.master = self.progress.add_task(
-            "total",
-            rate=0,
-            filename='',
-            percent='',
-            style='',
-            eta='',
-        )
-
-        self.progress.start()
-
-    def process_progress(self, advance, job):
-        if not self.progress:
-            self.init_progress()
-
-        rate = sum([j.rate for j in self.jobs])
-        size = sum([j.size for j in self.jobs])
-        total = sum([j.total for j in self.jobs])
-
-        self.progress.update(
-            self.master,
-            rate=rate,
-            total=total,
-            completed=size,
-            eta=elapsed_time(total, size, rate),
-        )
+
+    def process_progress(self, dsize=0, dtotal=0, drate=0):
+        """Account changes of job counters, total is kept incrementally"""
+
+        self.size += dsize
+        self.total += dtotal
+        self.rate += drate
+
+        total = self.total
+        if self.queue:
+            total += self.queue.nbytes
+
+        self.bus.publish(TotalProgress(self.size, total, self.rate))
 
     def process_itemize_progress(self, line):
-        if not self.progress:
-            self.init_progress()
+        if self.stream:
+            # total is growing with queued batches
+            return
 
         if '%' in line:
-            ndone = ntotal = None
             if m := re.search(r'\(xfr#(\d+), ir-chk=(\d+)/(\d+)\)', line):
-                size, percent, rate, eta, _, rest = line.split(None, 6)
-                ndone = int(m.group(1))
-                ntotal = int(m.group(3))
-            else:
-                return
-
-            task = self.progress._tasks[self.master]
-            if task.total != ntotal:
-                self.progress.update(self.master, total=ntotal, completed=ndone)
-            else:
-                self.progress.advance(self.master, advance=(ndone - task.completed))
+                self.bus.publish(TotalProgress(int(m.group(1)), int(m.group(3)), 0))
 
     def process_itemize_error(self, err):
-        if not self.progress:
-            self.init_progress()
+        self.bus.message('Error', err, 'error')
 
-        self.progress.console.print(f"[red][bold]Error[/bold][/red]: {err}")
+    def process_scan_progress(self, done, total):
+        if not self.stream:
+            self.bus.publish(TotalProgress(done, total, 0))
 
-    async def itemize(self):
-        cmd = ' '.join(self.rsync.itemize_command())
-        self.console.print("Calculating list of files for synchronization")
-        self.console.print(
-            f"[bright_cyan]Executing:[/bright_cyan] {cmd}",
-            highlight=False,
+    def open_manifest(self):
+        """Open manifest and take snapshot of the source, if manifest can be used"""
+
+        srcs = self.rsync.sources()
+        if len(srcs) != 1 or RSync.is_remote(srcs[0]):
+            self.bus.message('Manifest', 'requires single local source - not used', 'warning')
+            return
+
+        from .manifest import Manifest
+
+        self.manifest = Manifest(self.manifest_path, srcs[0], self.rsync.destination())
+
+        prefix = self.rsync.relative_source()
+        self.snapshot = Manifest.walk(srcs[0], prefix)
+        st = os.lstat(srcs[0])
+        self.snapshot[prefix or '.'] = (st.st_size, st.st_mtime_ns)
+
+    def manifest_candidates(self):
+        """names to itemize according to manifest or None for full scan"""
+
+        if self.rescan or self.manifest.empty():
+            return None
+
+        changed, deleted = self.manifest.changes(self.snapshot)
+        if deleted and self.deleting():
+            self.bus.message(
+                'Manifest', f'{len(deleted)} entries deleted on source, full scan is required'
+            )
+            return None
+
+        self.bus.message(
+            'Manifest', f'{len(changed)} of {len(self.snapshot)} entries changed since last run'
         )
+        return changed
+
+    def save_manifest(self):
+        if self.manifest:
+            self.manifest.save(self.snapshot)
+
+    async def list_files(self, files):
+        """Run itemize, files - container for entries"""
+
+        if not self.manifest:
+            return await self.scan(files)
+
+        names = self.manifest_candidates()
+        if names is None:
+            await self.scan(self.manifest.track(files))
+        else:
+            await self.rsync.itemize(
+                progress_callback=self.process_itemize_progress,
+                error_callback=self.process_itemize_error,
+                files=self.manifest.track(files),
+                names=names,
+            )
+
+        return files
 
-        files = await self.rsync.itemize(
-            progress_callback=self.process_itemize_progress,
+    async def scan(self, files):
+        """Run itemize (sharded if configured), files - container for entries"""
+
+        if self.scan_jobs <= 1 or len(self.rsync.sources()) != 1:
+            cmd = ' '.join(self.rsync.itemize_command())
+            self.bus.message('Executing', cmd)
+            return await self.rsync.itemize(
+                progress_callback=self.process_itemize_progress,
+                error_callback=self.process_itemize_error,
+                files=files,
+            )
+
+        self.bus.message(
+            f'Scanning {self.rsync.sources()[0]}',
+            f'in {self.scan_jobs} parallel itemize runs, depth {self.scan_depth}',
+        )
+        _, (nshards, wall, cumulative) = await self.rsync.itemize_sharded(
+            # progress of concurrent runs is meaningless, shards completion is shown instead
+            progress_callback=lambda line: None,
             error_callback=self.process_itemize_error,
+            files=files,
+            depth=self.scan_depth,
+            njobs=self.scan_jobs,
+            shard_callback=self.process_scan_progress,
+        )
+        self.bus.message(
+            'Scan',
+            f'{nshards} shards in {wall:.1f}s, '
+            f'cumulative {cumulative:.1f}s, saved {max(cumulative - wall, 0):.1f}s',
         )
 
+        return files
+
+    def open_journal(self):
+        """Open journal, load entries remaining from previous run if it can be resumed"""
+
+        if self.resume:
+            if (loaded := self.journal.load(self.memory_limit)) is None:
+                self.bus.message('Journal', 'no complete plan to resume, full scan is required')
+            else:
+                self.resumed, self.deletions, ndone = loaded
+                deletions = f', {len(self.deletions)} to delete' if self.deletions else ''
+                self.bus.message(
+                    'Journal',
+                    f'resuming: {ndone} entries done, {len(self.resumed)} remaining{deletions}',
+                )
+
+        self.journal.open(append=self.resumed is not None)
+
+    async def plan(self, files):
+        """Itemize into files, every entry is recorded in the journal as planned"""
+
+        sink = files if self.dirs is None else DirectorySink(files, self.dirs)
+        if not self.journal:
+            await self.list_files(DeletionSink(sink, self.deletions))
+            return files
+
+        # deletions are journaled apart: they are done by own phase, not by jobs
+        await self.list_files(self.journal.track(DeletionSink(sink, self.deletions)))
+        self.journal.complete()
+        return files
+
+    async def itemize(self):
+        if self.resumed is not None:
+            files = self.resumed
+            if self.dirs is not None:
+                # directories are planned, but never done by jobs
+                files = FileList(self.memory_limit)
+                sink = DirectorySink(files, self.dirs)
+                for i in range(len(self.resumed)):
+                    r = self.resumed
+                    sink.append((r.name(i), r.attr(i), r.sizes[i]))
+        else:
+            self.bus.message('', 'Calculating list of files for synchronization')
+
+        if self.stream and self.resumed is None:
+            # jobs are already running - feed them as soon as batch of files is collected
+            sink = BatchBuilder(
+                self.queue,
+                FileList(self.memory_limit),
+                self.batch_files,
+                self.batch_bytes,
+                callback=self.process_progress,
+            )
+            # itemize may stall (slow source), collected entries go to jobs meanwhile
+            timer = asyncio.ensure_future(sink.flush_waiting())
+            try:
+                await self.plan(sink)
+                sink.flush()
+            finally:
+                timer.cancel()
+                self.queue.close()
+
+            if not sink and not self.deletions:
+                self.bus.message('', 'Nothing to do - no files to sync', 'warning')
+            return
+
+        if self.resumed is None:
+            files = await self.plan(FileList(self.memory_limit))
+            deletions = f'{len(self.deletions)} to delete, ' if self.deletions else ''
+            self.bus.message(
+                'Itemized',
+                f'{len(files)} entries, {deletions}'
+                f'list takes {natural_size(files.memory())} of memory',
+            )
+
+        if self.dirs is not None:
+            self.bus.message('Skeleton', f'{len(self.dirs)} directories')
+
         if not files:
+            if self.deletions or self.dirs:
+                return
+            self.save_manifest()
             raise Exception('Nothing to do - no files to sync')
 
-        if not self.progress:
-            self.init_progress()
+        self.bus.publish(TotalProgress(0, len(files), 0))
+
+        disk = None
+        if self.order != 'name' and not self.reads_in_order():
+            self.bus.message(
+                'Order',
+                f'rsync sorts entries it gets by name, --order={self.order} is applied to '
+                'native and tar engines only - not used',
+                'warning',
+            )
+            self.order = 'name'
+        if self.order != 'name' or self.by_device:
+            disk = await self.timed('locate', self.locate(files))
+        groups = disk.groups(files) if disk and self.by_device else [files]
 
-        size = len(files) // self.njobs
-        self.progress.update(self.master, total=len(files))
+        if self.schedule == 'queue':
+            # jobs pull batches from the shared queue when they are done with previous one
+            self.queue = BatchQueue()
+            batches = [make_batches(g, self.batch_files, self.batch_bytes) for g in groups]
+            for batch in self.arrange(interleave(batches), disk):
+                self.queue.put(batch)
+            self.queue.close()
+            parts = [None] * self.njobs
+        elif len(groups) > 1:
+            parts = self.arrange(split_jobs(groups, self.njobs, PARTITIONERS[self.partition]), disk)
+        else:
+            parts = self.arrange(PARTITIONERS[self.partition](files, self.njobs), disk)
 
-        for i in range(self.njobs):
-            fstart = i * size
-            fend = fstart + size if i < self.njobs - 1 else len(files)
+        self.create_jobs(parts)
+
+    async def locate(self, files):
+        """DiskOrder of files, None if source is not local"""
+
+        srcs = self.rsync.sources()
+        if len(srcs) != 1 or RSync.is_remote(srcs[0]):
+            self.bus.message('Order', 'requires single local source - not used', 'warning')
+            return None
+
+        started = time.monotonic()
+        disk = DiskOrder(self.rsync.source(), files, extents=self.order == 'extent')
+        # stat of every entry, the event loop keeps serving progress and metrics
+        await asyncio.to_thread(disk.locate)
+        inode = f', no FIEMAP on {len(disk.inode_only)} (inode order)' if disk.inode_only else ''
+        self.bus.message(
+            'Order',
+            f'{len(files)} entries located on {len(disk.devices())} devices{inode} '
+            f'in {time.monotonic() - started:.1f}s',
+        )
+        return disk
+
+    def reads_in_order(self):
+        """Entries are copied in order of the list (by native or tar engine, not by rsync)"""
+        return self.native is not None or (
+            self.tar_threshold is not None and TarEngine.usable(self.rsync)
+        )
+
+    def arrange(self, parts, disk):
+        """Sort entries of every part (batch) by location on disk, report sequential reads
+        (of native and tar engines, rsync reads entries in name order)"""
+
+        if disk is None or self.order == 'name':
+            return parts
+
+        ordered = [disk.sort(p) for p in parts]
+        self.bus.message(
+            'Order',
+            f'by {self.order}: {disk.sequential(ordered):.0%} of successive files '
+            f'are read forward on disk (name order: {disk.sequential(parts):.0%})',
+        )
+        return ordered
+
+    def create_jobs(self, parts):
+        # entries not done are needed by journal, retries, restarts and recovery of agents
+        track = bool(self.journal or self.retries or self.budget or self.agents)
+        for part in parts:
+            n = len(self.jobs)
+            endpoint = self.endpoints.assign(n) if self.endpoints else None
             self.jobs.append(
                 Job(
-                    i + 1,
-                    files[fstart:fend],
-                    progress=self.progress,
-                    rsync=self.rsync,
+                    n + 1,
+                    part,
+                    bus=self.bus,
+                    rsync=self.rsync_for(n, endpoint),
                     callback=self.process_progress,
+                    queue=self.queue,
+                    parser=self.parser,
+                    journal=self.journal,
+                    endpoints=self.endpoints,
+                    endpoint=endpoint,
+                    budget=self.budget,
+                    extra=JOB_OPTIONS if self.dirs is not None else (),
+                    tar_threshold=self.tar_threshold,
+                    native=self.native,
+                    track=track,
+                )
+            )
+
+    async def start_pool(self, rsync, size):
+        """SSH control masters to the remote host of rsync, None if none has started"""
+
+        pool = SSHPool(rsync, size)
+        for e in await pool.start():
+            self.bus.message('SSH', str(e), 'warning')
+
+        if not pool.masters:
+            self.bus.message('SSH', 'no control masters, rsyncs connect on their own', 'warning')
+            return None
+
+        latency = pool.latency.values()
+        self.bus.message(
+            'SSH',
+            f'{len(pool.masters)} control masters to {pool.host}, '
+            f'connected in {min(latency):.2f}-{max(latency):.2f}s',
+        )
+        self.ssh.append(pool)
+        return pool
+
+    async def open_transport(self):
+        """Start SSH control masters to be shared by itemize and jobs"""
+
+        if self.ssh_masters == 0 or not SSHPool.usable(self.rsync):
+            return
+
+        size = self.ssh_masters or (self.tuner.max_jobs if self.tuner else self.njobs)
+        if not self.endpoints:
+            if pool := await self.start_pool(self.rsync, size):
+                self.rsync = pool.rsync_for(0)
+            return
+
+        # jobs are spread over endpoints
+        size = -(-size // len(self.endpoints.hosts))
+        for host, rsync in self.endpoints.rsyncs.items():
+            if pool := await self.start_pool(rsync, size):
+                self.endpoints.pools[host] = pool
+
+        self.rsync = self.endpoints.rsync_for(self.endpoints.hosts[0], 0)
+
+    def check_agents(self, other_engines):
+        """Raise for options agents do not run"""
+
+        if other_engines:
+            raise Exception('Agents run rsync only: not with engine, tar-threshold, endpoints')
+        if not self.agent_token:
+            raise Exception('Agents require a token (--agent-token)')
+        # agents reject the rest (remote shell, programs, files of mover hosts)
+        check_options(self.rsync.opts)
+
+    def rsync_for(self, n, endpoint=None):
+        """RSync for n-th job"""
+        if self.agents:
+            # own connection, jobs are spread over agents round-robin
+            address = self.agents[n % len(self.agents)]
+            rsync = AgentRSync(address, self.agent_token, *self.rsync.opts, *self.rsync.args)
+            self.connections.append(rsync)
+            return rsync
+
+        if endpoint is not None:
+            return self.endpoints.rsync_for(endpoint, n)
+
+        return self.ssh[0].rsync_for(n) if self.ssh else self.rsync
+
+    def report_latency(self):
+        for j in self.jobs:
+            if lat := j.latencies:
+                self.bus.message(
+                    'Setup latency',
+                    f'job #{j.id}: first rsync {lat[0]:.2f}s, '
+                    f'mean {sum(lat) / len(lat):.2f}s over {len(lat)} rsyncs',
                 )
+
+    def start_job(self, job):
+        if (t := self.tasks.get(job.id)) is not None and t.done():
+            # result of previous run is superseded, its entries are requeued
+            t.exception()
+        job.start()
+        self.tasks[job.id] = asyncio.ensure_future(job.transfer())
+
+    def errors(self):
+        """Exceptions of the last runs of jobs by job"""
+
+        return {j: e for j in self.jobs if (t := self.tasks.get(j.id)) and (e := t.exception())}
+
+    async def tune(self, interval=5.0, sample=0.5):
+        """Add or retire queue workers according to the tuner, until queue is drained"""
+
+        started = time.monotonic()
+        while not (self.queue and self.queue.closed and not self.queue.qsize()):
+            rates = []
+            for _ in range(int(interval / sample)):
+                await asyncio.sleep(sample)
+                rates.append(self.rate)
+
+            running = [j for j in self.jobs if j.active() and not j.retired]
+            target = self.tuner.decide(
+                time.monotonic() - started,
+                len(running),
+                sum(rates) / len(rates),
+                self.queue.qsize() if self.queue else 1,
             )
 
-    def start(self):
-        if not self.progress:
-            self.init_progress()
+            for _ in range(len(running), target):
+                self.create_jobs([None])
+                self.start_job(self.jobs[-1])
+
+            for j in running[target:]:
+                j.retire()
+
+    async def verify_manifest(self):
+        """Compare manifest with full dry run and report entries manifest has missed"""
+
+        if not self.manifest or self.manifest.empty():
+            raise Exception('No manifest to verify')
+
+        changed, deleted = self.manifest.changes(self.snapshot)
+        expected = set(changed) | set(deleted) | {'.'}
+        files = await self.scan(FileList(self.memory_limit))
+
+        stale = [f for f in files if f[0] not in expected]
+        for f in stale[:20]:
+            self.bus.message('', f'  {f[1]} {f[0]}')
+
+        if stale:
+            self.bus.message(
+                'Manifest',
+                f'stale: {len(stale)} of {len(files)} changes are not known to it, '
+                'run with --rescan',
+                'warning',
+            )
+        else:
+            self.bus.message('Manifest', f'consistent: all {len(files)} changes are known')
 
-        self.progress.start()
+    async def synchronize(self):
+        """Calculate list of files and transfer them"""
+
+        if self.manifest_path:
+            self.open_manifest()
+
+        if self.verify:
+            await self.verify_manifest()
+            return
+
+        if self.metrics:
+            await self.metrics.start()
+
+        if not self.agents:
+            # agents connect on their own
+            await self.open_transport()
+
+        if self.watch:
+            await self.synchronize_watch()
+            return
+
+        # manifest and resume have own ways to skip the full dry run
+        if self.fast_path and not (self.manifest or self.resume):
+            if await self.timed('fast-path', self.run_fast_path()):
+                self.finish()
+                return
+
+        if self.journal:
+            self.open_journal()
+
+        if self.resumed is not None and not self.resumed and not self.deletions:
+            self.bus.message('Journal', 'all entries are done')
+            self.journal.close(remove=True)
+            self.save_manifest()
+            return
+
+        if not self.stream or self.resumed is not None:
+            await self.timed('itemize', self.itemize())
+            if self.dirs:
+                await self.timed('skeleton', self.create_skeleton())
+            await self.transfer_phases()
+            if self.dirs:
+                await self.timed('directories', self.update_dirs())
+            self.finish()
+            return
+
+        await self.synchronize_stream()
+
+    async def synchronize_stream(self):
+        """Transfer batches while itemize is still producing them"""
+
+        self.queue = BatchQueue()
+        self.create_jobs([None] * self.njobs)
+
+        async def itemize():
+            await self.timed('itemize', self.itemize())
+            if self.delete_phase != 'after' and self.deletions:
+                # deletions are known when itemize is done
+                await self.timed('delete', self.delete())
+
+        results = await asyncio.gather(
+            itemize(),
+            self.timed('transfer', self.transfer()),
+            return_exceptions=True,
+        )
+        itemized = not isinstance(results[0], Exception)
+        if itemized and self.deletions and self.delete_phase == 'after':
+            results += await asyncio.gather(
+                self.timed('delete', self.delete()), return_exceptions=True
+            )
+
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+
+        self.finish()
+
+    async def synchronize_watch(self):
+        """Transfer changes of local source reported by inotify by persistent jobs
+
+        Full scan is done first, every reconcile seconds and when inotify has
+        lost events. Runs until cancelled (interrupted).
+        """
+
+        srcs = self.rsync.sources()
+        if len(srcs) != 1 or RSync.is_remote(srcs[0]):
+            raise Exception('Watch mode requires single local source')
+
+        from .watch import Watcher
+
+        # watches are set before the first scan: changes made during it are not lost
+        watcher = Watcher(srcs[0], self.rsync.relative_source(), self.watch_delay)
+        watcher.start()
+        self.bus.message('Watch', f'{len(watcher.dirs)} directories of {srcs[0]} are watched')
+
+        self.queue = BatchQueue()
+        self.create_jobs([None] * self.njobs)
+        workers = asyncio.ensure_future(self.run_jobs())
+        try:
+            full = 0
+            while not workers.done():
+                if time.monotonic() >= full:
+                    await self.timed('reconcile', self.queue_changes())
+                    full = time.monotonic() + self.reconcile
+
+                if (changes := await watcher.changes(full - time.monotonic())) is not None:
+                    names, overflow = changes
+                    if overflow:
+                        self.bus.message('Watch', 'inotify queue overflow, full scan', 'warning')
+                        full = 0
+                    else:
+                        await self.queue_changes(names)
+
+            workers.result()
+        finally:
+            watcher.close()
+            self.queue.close()
+            workers.cancel()
+
+    async def queue_changes(self, names=None):
+        """Itemize names (whole source with None), queue batches for jobs, delete extraneous"""
+
+        started = time.monotonic()
+        files = FileList(self.memory_limit)
+        self.deletions = []
+        sink = DeletionSink(files, self.deletions)
+        if names is None:
+            await self.scan(sink)
+        else:
+            # names are deleted on source (with --delete) or have gone since the event
+            missing = '--delete-missing-args' if self.deleting() else '--ignore-missing-args'
+            await self.rsync.itemize(
+                progress_callback=lambda line: None,
+                error_callback=self.process_itemize_error,
+                files=sink,
+                names=sorted(map(os.fsdecode, names)),
+                extra=[missing],
+            )
+
+        for batch in make_batches(files, self.batch_files, self.batch_bytes):
+            self.queue.put(batch)
+        self.process_progress()
+
+        changed = 'full scan' if names is None else f'{len(names)} changed paths'
+        self.bus.message(
+            'Watch',
+            f'{changed}: {len(files)} entries queued in {time.monotonic() - started:.1f}s',
+        )
+        await self.delete()
+
+    def deleting(self):
+        return any(o.startswith('--delete') for o in self.rsync.opts)
+
+    async def run_fast_path(self):
+        """Single rsync without dry run, True if change set is within limits and it is done"""
+
+        started = time.monotonic()
+        sink = LimitSink(*self.fast_path)
+        self.bus.message('Executing', ' '.join(self.rsync.direct_command()))
+        done = await fast_path(
+            self.rsync, sink, self.process_itemize_progress, self.process_itemize_error
+        )
+
+        elapsed = time.monotonic() - started
+        if done:
+            self.bus.message(
+                'Fast path',
+                f'{sink.nfiles} entries, {natural_size(sink.nbytes)} '
+                f'synchronized by single rsync in {elapsed:.1f}s',
+            )
+        else:
+            self.bus.message(
+                'Fast path',
+                f'change set is over the limit, single rsync stopped after {sink.nfiles} '
+                f'entries in {elapsed:.1f}s - running parallel synchronization',
+            )
+        return done
+
+    async def transfer_phases(self):
+        """Transfer and deletion in order of delete_phase, failure of one does not stop another"""
+
+        if not self.deletions:
+            await self.timed('transfer', self.transfer())
+            return
+
+        if self.delete_phase == 'concurrent':
+            results = await asyncio.gather(
+                self.timed('transfer', self.transfer()),
+                self.timed('delete', self.delete()),
+                return_exceptions=True,
+            )
+        else:
+            phases = {'transfer': self.transfer, 'delete': self.delete}
+            order = ['delete', 'transfer'] if self.delete_phase == 'before' else list(phases)
+            results = []
+            for phase in order:
+                try:
+                    await self.timed(phase, phases[phase]())
+                except Exception as e:
+                    results.append(e)
+
+        for r in results:
+            if isinstance(r, Exception):
+                raise r
+
+    async def create_skeleton(self):
+        """Create all directories by a single rsync, before jobs transfer files into them"""
+
+        started = time.monotonic()
+        ncreated = await sync_dirs(
+            self.rsync_for(0), self.dirs, self.process_itemize_error, SKELETON_OPTIONS
+        )
+        self.bus.message(
+            'Skeleton',
+            f'{ncreated} of {len(self.dirs)} directories created '
+            f'in {time.monotonic() - started:.1f}s',
+        )
+
+    async def update_dirs(self):
+        """Set metadata (times, permissions) of directories, after files are transferred"""
+
+        started = time.monotonic()
+        await sync_dirs(self.rsync_for(0), self.dirs, self.process_itemize_error)
+        self.bus.message(
+            'Skeleton',
+            f'metadata of {len(self.dirs)} directories updated '
+            f'in {time.monotonic() - started:.1f}s',
+        )
+
+    async def delete(self):
+        """Delete entries extraneous on destination, sharded by directory between rsyncs"""
+
+        if not self.deletions:
+            return
+
+        started = time.monotonic()
+        rsyncs = [
+            self.rsync_for(n, self.endpoints.assign(n) if self.endpoints else None)
+            for n in range(self.njobs)
+        ]
+        ndeleted, nshards = await delete(
+            rsyncs, self.deletions, lambda err: self.bus.message('Delete', err, 'error')
+        )
+        if self.journal:
+            self.journal.deleted()
+        self.bus.message(
+            'Deleted',
+            f'{len(self.deletions)} entries ({ndeleted} top-level) '
+            f'in {time.monotonic() - started:.1f}s by {nshards} rsyncs',
+        )
+
+    async def timed(self, phase, aw):
+        """await aw accounting its duration as phase"""
+
+        self.phases[phase] = span = [time.monotonic(), None]
+        try:
+            return await aw
+        finally:
+            span[1] = time.monotonic()
+            self.bus.publish(Span(phase, 0, *span))
+
+    def finish(self):
+        """Run is complete - nothing to resume"""
+
+        if self.journal:
+            self.journal.close(remove=True)
+
+        self.save_manifest()
 
     def __enter__(self):
         return self
@@ -156,33 +931,158 @@ class Syncer:
         exc_val: Optional[BaseException],
         exc_tb: Optional[TracebackType],
     ):
-        if self.progress:
-            self.progress.stop()
+        if self.manifest:
+            self.manifest.close()
+
+        for pool in self.ssh:
+            pool.close()
+
+        for c in self.connections:
+            c.close()
+
+        if self.metrics:
+            self.metrics.stop()
+
+        if self.native:
+            self.native.close()
+
+        if self.journal and self.journal.file:
+            self.journal.close()
+            self.bus.message(
+                'Journal',
+                f'{self.journal.path} is kept, run with --resume to transfer remaining entries',
+            )
+
+        self.bus.message('Peak RSS', natural_size(peak_rss()))
+
+        if self.tracer:
+            self.tracer.close()
 
     def active(self):
         return any(j.active() for j in self.jobs)
 
-    async def transfer(self):
-        if not self.progress:
-            self.init_progress()
+    async def run_jobs(self):
+        for j in self.jobs:
+            if not j.lost and not j.retired:
+                self.start_job(j)
 
-        self.progress.start_task(self.master)
+        helpers = []
+        if self.tuner:
+            helpers.append(asyncio.ensure_future(self.tune()))
+        if self.budget:
+            helpers.append(asyncio.ensure_future(self.balance()))
 
-        for j in self.jobs:
-            j.start()
+        try:
+            # tuner may add jobs while others are running
+            while pending := [t for t in self.tasks.values() if not t.done()]:
+                await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for h in helpers:
+                h.cancel()
 
-        result = await asyncio.gather(
-            *[job.transfer() for job in self.jobs], return_exceptions=True
-        )
+        if self.tuner:
+            self.bus.message(
+                'Auto jobs',
+                f'{len(self.tuner.decisions)} decisions, {len(self.jobs)} jobs started',
+            )
+            for line in self.tuner.report():
+                self.bus.message('', line)
+            # retries and recovery run as many jobs as decided last
+            self.njobs = self.tuner.target
+            self.tuner = None
 
-        nerrors = 0
-        for r, j in zip(result, self.jobs):
-            if isinstance(r, Exception):
-                nerrors += 1
-                self.progress.console.print(
-                    f'[bright_red][bold]Job #{j.id} Error: {r}[/bold][/bright_red]\n',
-                    j.error_buf,
+    async def balance(self, interval=2.0):
+        """Restart rsyncs which share of total bandwidth limit has changed"""
+
+        while True:
+            await asyncio.sleep(interval)
+            for j in self.budget.retune():
+                self.bus.message(
+                    'Bandwidth',
+                    f'job #{j.id}: limit {transfer_rate(j.bwlimit)} -> '
+                    f'{transfer_rate(self.budget.limit(j))}, restarting rsync',
                 )
+                j.restart()
+
+    def take_failed(self, jobs=None):
+        """Entries not done by failed rsyncs of jobs (all by default) as single view or None"""
+
+        jobs = self.jobs if jobs is None else jobs
+        views = [v for j in jobs for v in j.failed if len(v)]
+        for j in jobs:
+            j.failed = []
+
+        if not views:
+            return None
+
+        return views[0].files.view(array('I', chain.from_iterable(v.indexes for v in views)))
+
+    def requeue(self, failed):
+        """Entries not done are shared by all jobs through a new queue"""
+
+        self.queue = BatchQueue()
+        for batch in make_batches(failed, self.batch_files, self.batch_bytes):
+            self.queue.put(batch)
+        self.queue.close()
+        for j in self.jobs:
+            # bytes not done are accounted again by the queue
+            j.base = j.size
+            j.set_progress(j.size, j.size, 0)
+            j.queue = self.queue
+
+        # jobs the tuner has retired stay retired, result of their last run is superseded
+        for n, j in enumerate(j for j in self.jobs if not j.lost):
+            j.retired = n >= self.njobs
+            if j.retired and (t := self.tasks.pop(j.id, None)) is not None:
+                t.exception()
+
+    async def recover_lost(self):
+        """Entries not done by jobs which agents are lost (and by failed rsyncs of others)
+        are transferred by remaining jobs"""
+
+        while any(j.lost and j.failed for j in self.jobs):
+            failed = self.take_failed()
+            if all(j.lost for j in self.jobs):
+                raise Exception(f'All agents are lost, {len(failed)} entries are not done')
+
+            self.bus.message(
+                'Agents',
+                f'{len(failed)} entries not done go to {sum(not j.lost for j in self.jobs)} '
+                'jobs of remaining agents',
+                'warning',
+            )
+            self.requeue(failed)
+            await self.run_jobs()
+
+    async def transfer(self):
+        await self.run_jobs()
+        await self.recover_lost()
+
+        for attempt in range(1, self.retries + 1):
+            if not self.errors() or (failed := self.take_failed()) is None:
+                break
+
+            delay = self.retry_delay * 2 ** (attempt - 1)
+            self.bus.message(
+                'Retry',
+                f'{len(failed)} entries are not done, attempt {attempt} of {self.retries} '
+                f'in {delay:.0f}s',
+                'warning',
+            )
+            await asyncio.sleep(delay)
+
+            self.requeue(failed)
+            await self.run_jobs()
+            await self.recover_lost()
+
+        self.report_latency()
+        if self.endpoints:
+            for line in self.endpoints.report():
+                self.bus.message('Endpoints', line)
+
+        errors = self.errors()
+        for j, e in errors.items():
+            self.bus.message(f'Job #{j.id} Error', f'{e}\n{j.error_buf}', 'error')
 
-        if nerrors:
-            raise Exception(f'{nerrors} rsyncs failed')
+        if errors:
+            raise Exception(f'{len(errors)} rsyncs failed')
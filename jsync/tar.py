@@ -0,0 +1,252 @@
+"""Tar stream transport for batches of small files"""
+
+import asyncio
+import os
+import re
+import shlex
+import time
+
+from .native import LONG_FLAGS, implied
+from .native import LONG_OPTIONS as NATIVE_LONG_OPTIONS
+from .native import LONG_PREFIXES as NATIVE_LONG_PREFIXES
+from .parser import EngineOutput
+from .rsync import RSync, Usage, re_cluster
+from .utils import process_times
+
+# rsync options the tar stream implements (or which do not change transfer of itemized files):
+# metadata tar reproduces, rules the dry run applies already, options of the connection
+SHORT_OPTIONS = set('arlptgoDOvhqxizcuIWP')
+LONG_OPTIONS = (
+    set(LONG_FLAGS)
+    | NATIVE_LONG_OPTIONS
+    | {
+        '--numeric-ids',
+        '--compress',
+        '--checksum',
+        '--update',
+        '--ignore-times',
+        '--size-only',
+        '--whole-file',
+        '--partial',
+        '--progress',
+    }
+)
+LONG_PREFIXES = NATIVE_LONG_PREFIXES + (
+    '--rsh=',
+    '--rsync-path=',
+    '--bwlimit=',
+    '--timeout=',
+    '--contimeout=',
+    '--modify-window=',
+    '--max-size=',
+    '--min-size=',
+    '--compress-level=',
+)
+
+
+# tar --quoting-style=escape: C escapes and octal codes of other non-printable bytes
+re_escape = re.compile(rb'\\([0-7]{3}|.)', re.DOTALL)
+ESCAPES = {bytes([c]): bytes([ord(e)]) for c, e in zip(b'abfnrtv', '\a\b\f\n\r\t\v')}
+
+
+def unescape(name):
+    """raw name from name listed by tar"""
+
+    def char(m):
+        c = m.group(1)
+        return bytes([int(c, 8)]) if len(c) == 3 else ESCAPES.get(c, c)
+
+    return re_escape.sub(char, name)
+
+
+# owner is restored by root only, rsync silently skips it for others
+IF_ROOT = 'if [ "$(id -u)" = 0 ]; then echo {}; else echo {}; fi'
+
+
+class Shell(str):
+    """argument passed to the remote shell as it is, not quoted"""
+
+
+def split_small(files, threshold):
+    """Views of regular files smaller than threshold and of the rest of files (view)"""
+    attr = files.files.attr
+    sizes = files.files.sizes
+    return files.split(lambda i: attr(i)[1] == 'f' and sizes[i] < threshold)
+
+
+class TarEngine:
+    """Transfers regular files as a tar stream: tar on source side piped to tar on destination
+
+    Remote side is reached by the remote shell of rsync (and its ssh control
+    master, if any). Metadata is extracted according to -p, -t, -o, -g (-a).
+    Interface of transfer is the one of RSync.transfer.
+    """
+
+    tar_cmd = 'tar'
+
+    def __init__(self, rsync: RSync) -> None:
+        self.rsync = rsync
+        _, rsh = rsync.remote_shell()
+        self.rsh = shlex.split(rsh) if rsh else []
+
+    @staticmethod
+    def unsupported(rsync):
+        """reasons tar can not be used for rsync (empty if it can)"""
+
+        ret = []
+        remote = [a for a in rsync.args if RSync.is_remote(a)]
+        if remote and rsync.remote_shell()[0] is None:
+            ret.append('rsync daemon')
+
+        for o in rsync.opts:
+            if o.startswith('--'):
+                name = '--' + o[5:] if o.startswith('--no-') else o
+                if len(name) == 3 and name[2] in SHORT_OPTIONS:
+                    continue
+                if name not in LONG_OPTIONS and not o.startswith(LONG_PREFIXES):
+                    ret.append(o)
+            elif not set(re_cluster.match(o[1:]).group()) <= SHORT_OPTIONS | {'e'}:
+                # value of -e (remote shell) is used by tar stream as well
+                ret.append(o)
+
+        flags = implied(rsync.opts)
+        if ('o' in flags) != ('g' in flags):
+            # tar restores owner and group together
+            ret.append('-o without -g' if 'o' in flags else '-g without -o')
+
+        return ret
+
+    @staticmethod
+    def usable(rsync):
+        """source and destination are local or reachable by remote shell, metadata
+        options have tar equivalents"""
+        return not TarEngine.unsupported(rsync)
+
+    def extract_options(self, root):
+        """tar options of metadata rsync options ask for
+
+        root - extracting tar runs as root, None when it is decided by remote shell.
+        """
+
+        flags = implied(self.rsync.opts)
+        if 'o' not in flags or root is False:
+            owner = '--no-same-owner'
+        elif root:
+            owner = '--same-owner'
+        else:
+            owner = Shell(f'$({IF_ROOT.format("--same-owner", "--no-same-owner")})')
+
+        opts = ['--same-permissions' if 'p' in flags else '--no-same-permissions', owner]
+        if 't' not in flags:
+            opts.append('--touch')
+        if '--numeric-ids' in self.rsync.opts:
+            opts.append('--numeric-owner')
+
+        return opts
+
+    def side(self, path, make_cmd):
+        """command running in directory path on its side
+
+        make_cmd(directory, root) - tar command, root tells whether it runs as root
+        (None - not known: remote side).
+        """
+
+        if not RSync.is_remote(path):
+            return make_cmd(path, os.geteuid() == 0)
+
+        # remote shell runs the command by shell of the remote side
+        host, _, path = path.partition(':')
+        path = path or '.'
+        cmd = ' '.join(a if isinstance(a, Shell) else shlex.quote(a) for a in make_cmd(path, None))
+        return self.rsh + [host, f'mkdir -p {shlex.quote(path)} && {cmd}']
+
+    def commands(self):
+        def create(path, root):
+            return [self.tar_cmd, '-C', path, '--null', '--no-recursion', '-T', '-', '-cf', '-']
+
+        def extract(path, root):
+            # names listed by -v are escaped: a line per file, even with newline in its name
+            return [
+                self.tar_cmd,
+                '-C',
+                path,
+                '--quoting-style=escape',
+                *self.extract_options(root),
+                '-xvf',
+                '-',
+            ]
+
+        return self.side(self.rsync.source(), create), self.side(self.rsync.destination(), extract)
+
+    async def read_errors(self, stream, callback):
+        while line := await stream.readline():
+            if line := line.decode(errors='replace').rstrip('\n'):
+                callback(line)
+
+    async def transfer(self, files, parser, error_callback, extra=(), process_callback=None):
+        """Transfer files (regular files only), rsync options of extra do not apply"""
+
+        started = time.monotonic()
+        create, extract = self.commands()
+        if not RSync.is_remote(dst := self.rsync.destination()):
+            os.makedirs(dst, exist_ok=True)
+
+        r, w = os.pipe()
+        try:
+            packer = await asyncio.create_subprocess_exec(
+                *create,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=w,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            unpacker = await asyncio.create_subprocess_exec(
+                *extract,
+                stdin=r,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        finally:
+            os.close(r)
+            os.close(w)
+
+        output = EngineOutput(parser, files.by_name(), started)
+        fed = None
+
+        async def feed():
+            nonlocal fed
+            await self.rsync.feed_input(packer, files.names())
+            fed = time.monotonic() - started
+
+        async def read():
+            # names of extracted files, files tar create skipped are not listed
+            rest = b''
+            while buf := await unpacker.stdout.read(65536):
+                *lines, rest = (rest + buf).split(b'\n')
+                for line in lines:
+                    if (name := unescape(line)) in output.entries:
+                        output.report(name)
+
+        await asyncio.gather(
+            feed(),
+            read(),
+            self.read_errors(packer.stderr, error_callback),
+            self.read_errors(unpacker.stderr, error_callback),
+        )
+
+        user = sys = 0
+        for proc in (packer, unpacker):
+            if times := process_times(proc.pid):
+                user, sys = user + times[0], sys + times[1]
+            await proc.wait()
+
+        for name, proc in (('tar create', packer), ('tar extract', unpacker)):
+            if proc.returncode != 0:
+                raise Exception(f'Error running {name}: rc={proc.returncode}')
+
+        return Usage(
+            output.first - started if output.first else None,
+            time.monotonic() - started,
+            user,
+            sys,
+            fed,
+        )
@@ -0,0 +1,144 @@
+"""Timeline of a run in Chrome trace format (chrome://tracing, ui.perfetto.dev)"""
+
+import json
+import os
+import time
+
+from .events import (
+    EventBus,
+    FileDone,
+    JobAdded,
+    JobError,
+    JobFinished,
+    JobStarted,
+    Message,
+    Span,
+    TotalProgress,
+)
+
+
+class Tracer:
+    """Writes events of the bus as trace events, every job is a thread of the timeline
+
+    Spans are complete events, a file reported by rsync is a span from the
+    previous report of its job, errors of a job coming within burst seconds
+    of each other are one span. Events are written as they come (JSON array
+    format), so the trace of an interrupted run is still readable.
+    """
+
+    path: str
+    burst: float
+    counter_interval: float
+
+    def __init__(self, path, bus: EventBus, burst=1.0, counter_interval=0.5) -> None:
+        self.path = path
+        self.bus = bus
+        self.burst = burst  # seconds between errors of one burst
+        self.counter_interval = counter_interval  # seconds between total progress samples
+        self.started = time.monotonic()
+        self.pid = os.getpid()
+        self.file = open(path, 'w')
+        self.first = True
+        self.jobs = {}  # job -> time of JobStarted
+        self.mark = {}  # job -> time of the last file report or rsync end
+        self.errors = {}  # job -> [start, end, count, first text] of current error burst
+        self.counted = 0  # time of last progress counter
+
+        self.emit({'ph': 'M', 'name': 'process_name', 'tid': 0, 'args': {'name': 'jsync'}})
+        self.emit({'ph': 'M', 'name': 'thread_name', 'tid': 0, 'args': {'name': 'jsync'}})
+        bus.subscribe(self)
+
+    def ts(self, t):
+        """microseconds since start of tracing"""
+        return round((t - self.started) * 1e6)
+
+    def emit(self, event):
+        event['pid'] = self.pid
+        self.file.write(('[\n' if self.first else ',\n') + json.dumps(event))
+        self.first = False
+
+    def complete(self, name, job, start, end, args=None):
+        event = {
+            'ph': 'X',
+            'name': name,
+            'tid': job,
+            'ts': self.ts(start),
+            'dur': self.ts(end) - self.ts(start),
+        }
+        if args:
+            event['args'] = args
+        self.emit(event)
+
+    def flush_errors(self, job):
+        if burst := self.errors.pop(job, None):
+            start, end, count, text = burst
+            self.complete('errors', job, start, end, {'count': count, 'first': text})
+
+    def __call__(self, event):
+        now = time.monotonic()
+        kind = type(event)
+
+        if kind is FileDone:
+            start = self.mark.get(event.job, now)
+            self.mark[event.job] = now
+            self.complete('file', event.job, start, now, {'name': event.name, 'size': event.size})
+
+        elif kind is TotalProgress:
+            if now - self.counted >= self.counter_interval:
+                self.counted = now
+                self.emit(
+                    {
+                        'ph': 'C',
+                        'name': 'progress',
+                        'tid': 0,
+                        'ts': self.ts(now),
+                        'args': {'bytes': event.size, 'total': event.total},
+                    }
+                )
+
+        elif kind is Span:
+            self.complete(event.name, event.job, event.start, event.end, event.args)
+            if event.name == 'rsync':
+                self.mark[event.job] = event.end
+
+        elif kind is JobError:
+            burst = self.errors.get(event.job)
+            if burst and now - burst[1] <= self.burst:
+                burst[1] = now
+                burst[2] += 1
+            else:
+                self.flush_errors(event.job)
+                self.errors[event.job] = [now, now, 1, event.text]
+
+        elif kind is JobAdded:
+            name = {'name': f'job #{event.job}'}
+            self.emit({'ph': 'M', 'name': 'thread_name', 'tid': event.job, 'args': name})
+
+        elif kind is JobStarted:
+            self.jobs[event.job] = self.mark[event.job] = now
+
+        elif kind is JobFinished:
+            self.flush_errors(event.job)
+            start = self.jobs.pop(event.job, now)
+            self.complete('job', event.job, start, now, {'error': event.error})
+
+        elif kind is Message:
+            self.emit(
+                {
+                    'ph': 'i',
+                    's': 'p',
+                    'name': event.title,
+                    'tid': 0,
+                    'ts': self.ts(now),
+                    'args': {'text': event.text, 'level': event.level},
+                }
+            )
+
+    def close(self):
+        if self.file:
+            self.bus.unsubscribe(self)
+            for job in list(self.errors):
+                self.flush_errors(job)
+            self.file.write('\n]\n')
+            self.file.close()
+            self.file = None
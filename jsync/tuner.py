@@ -0,0 +1,90 @@
+"""Choice of the number of parallel jobs by observed throughput"""
+
+from .utils import transfer_rate
+
+
+class JobTuner:
+    """AIMD controller of the number of queue workers
+
+    Every interval aggregate rate of jobs is compared with the best one seen:
+    while adding a job gains throughput, one more job is added (additive
+    increase), when throughput drops noticeably, a quarter of jobs is retired
+    (multiplicative decrease). Without a change throughput is on a plateau,
+    number of jobs is kept and probed again after a few intervals.
+    """
+
+    min_jobs: int
+    max_jobs: int
+    gain: float
+    loss: float
+    probe: int
+    best: float
+    held: int
+    target: int
+    decisions: list
+    curve: list
+
+    def __init__(self, min_jobs=2, max_jobs=16, gain=0.05, loss=0.15, probe=6) -> None:
+        self.min_jobs = min_jobs
+        self.max_jobs = max(max_jobs, min_jobs)
+        self.gain = gain  # relative improvement considered as gain
+        self.loss = loss  # relative drop considered as loss
+        self.probe = probe  # intervals on plateau before probing one more job
+        self.best = 0
+        self.held = 0
+        self.target = min_jobs  # number of jobs decided last
+        self.decisions = []  # (time, njobs, new njobs, rate, reason)
+        self.curve = []  # (time, njobs, rate)
+
+    def decide(self, time, njobs, rate, backlog=1):
+        """New number of jobs given aggregate rate measured with njobs running"""
+
+        self.curve.append((time, njobs, rate))
+        target, reason = njobs, None
+
+        if rate >= self.best * (1 + self.gain):
+            self.best = rate
+            self.held = 0
+            if njobs < self.max_jobs and backlog:
+                target, reason = njobs + 1, 'throughput grows'
+
+        elif rate < self.best * (1 - self.loss):
+            self.best = rate
+            self.held = 0
+            if njobs > self.min_jobs:
+                target = max(self.min_jobs, njobs - max(1, njobs // 4))
+                reason = 'throughput drops'
+
+        else:
+            self.held += 1
+            if self.held >= self.probe and njobs < self.max_jobs and backlog:
+                # conditions may have changed since plateau was found
+                self.best = rate
+                self.held = 0
+                target, reason = njobs + 1, 'probe after plateau'
+
+        if reason:
+            self.decisions.append((time, njobs, target, rate, reason))
+
+        self.target = target
+        return target
+
+    def report(self):
+        """Lines describing decisions and throughput by number of jobs"""
+
+        lines = [
+            f'{t:8.1f}s  {n:>3} -> {m:<3} jobs at {transfer_rate(rate):>10}  {reason}'
+            for t, n, m, rate, reason in self.decisions
+        ]
+
+        rates = {}
+        for _, n, rate in self.curve:
+            rates.setdefault(n, []).append(rate)
+
+        for n, r in sorted(rates.items()):
+            lines.append(
+                f'{n:>4} jobs: {transfer_rate(sum(r) / len(r)):>10} mean, '
+                f'{transfer_rate(max(r)):>10} max over {len(r)} intervals'
+            )
+
+        return lines
@@ -1,12 +1,17 @@
+import functools
+import os
 import re
+import resource
+import sys
 
-from humanize import naturalsize
+re_rate = re.compile(r'([\d\.]+)([BKMGTPEZY]?)B/s+$', flags=re.IGNORECASE)
 
 
+@functools.lru_cache(maxsize=4096)
 def dehumanize_rate(ssize):
     """Converts rate string to number (like 231.89MB/s) of bytes per second"""
 
-    m = re.match(r'([\d\.]+)([BKMGTPEZY]?)B/s+$', ssize, flags=re.IGNORECASE)
+    m = re_rate.match(ssize)
 
     if not m:
         raise Exception(f'Wrong rate format {ssize}')
@@ -23,6 +28,27 @@ def dehumanize_rate(ssize):
     return ret
 
 
+def dehumanize_size(ssize):
+    """Converts size string (like 100M or 1.5GiB) to number of bytes"""
+
+    m = re.match(r'([\d\.]+)([KMGTPEZY]?)(i?)B?$', ssize, flags=re.IGNORECASE)
+
+    if not m:
+        raise Exception(f'Wrong size format {ssize}')
+
+    u = m.group(2)
+    ret = float(m.group(1))
+    base = 1024 if m.group(3) else 1000
+
+    if u != '':
+        for unit in "KMGTPEZY":
+            ret *= base
+            if unit == u.upper():
+                break
+
+    return int(ret)
+
+
 def elapsed_time(total, size, rate):
     eta = '  -:--:--'
 
@@ -35,9 +61,39 @@ def elapsed_time(total, size, rate):
     return eta
 
 
+def natural_size(size):
+    """Size in short GNU form (like 1.5M), humanize is imported on first use"""
+    from humanize import naturalsize
+
+    return naturalsize(size, gnu=True)
+
+
 def transfer_rate(size):
     if size is None:
         return '-'
 
-    ret = naturalsize(size, gnu=True)
+    ret = natural_size(size)
     return ret + ("/s" if ret[-1].lower() == 'b' else "B/s")
+
+
+def process_times(pid):
+    """(user, system) CPU seconds of running process and its finished children, None if unknown"""
+
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            stat = f.read()
+    except OSError:
+        return None
+
+    # fields after "(comm)", comm can contain spaces
+    fields = stat[stat.rindex(b')') + 2 :].split()
+    utime, stime, cutime, cstime = map(int, fields[11:15])
+    tick = os.sysconf('SC_CLK_TCK')
+    return (utime + cutime) / tick, (stime + cstime) / tick
+
+
+def peak_rss():
+    """Peak resident set size of the process in bytes"""
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
@@ -0,0 +1,187 @@
+"""Changed entries of local source tree reported by inotify (Linux)"""
+
+import asyncio
+import ctypes
+import ctypes.util
+import errno
+import os
+import struct
+import time
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+)
+
+# struct inotify_event: wd, mask, cookie, len, name[len]
+EVENT = struct.Struct('iIII')
+
+
+class Inotify:
+    """Watches of directories on inotify descriptor (non-blocking)"""
+
+    def __init__(self) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+
+    def add(self, path):
+        """watch descriptor of directory path, None if it has gone"""
+
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return None
+            # ENOSPC - fs.inotify.max_user_watches is reached
+            raise OSError(err, f'inotify_add_watch {path}: {os.strerror(err)}')
+
+        return wd
+
+    def remove(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """(wd, mask, name) of pending events"""
+
+        try:
+            buf = os.read(self.fd, 256 * 1024)
+        except BlockingIOError:
+            return
+
+        pos = 0
+        while pos < len(buf):
+            wd, mask, _, size = EVENT.unpack_from(buf, pos)
+            pos += EVENT.size
+            yield wd, mask, buf[pos : pos + size].rstrip(b'\0')
+            pos += size
+
+    def close(self):
+        os.close(self.fd)
+
+
+class Watcher:
+    """Names (as rsync reports them, raw bytes) of changed entries under root
+
+    Every directory of the tree is watched, directories created or moved in
+    are watched (and their entries reported) when noticed. Changes are
+    coalesced until nothing happens for delay seconds (at most max_delay).
+    """
+
+    def __init__(self, root, prefix='', delay=1.0, max_delay=None) -> None:
+        self.root = os.fsencode(root)
+        self.prefix = os.fsencode(prefix)
+        self.delay = delay
+        self.max_delay = max_delay or 10 * delay
+        self.inotify = Inotify()
+        self.dirs = {}  # wd -> directory name relative to root
+        self.changed = set()
+        self.overflow = False  # events are lost, full reconcile is required
+        self.first = self.last = None
+        self.event = asyncio.Event()
+
+    def name(self, rel):
+        if not self.prefix:
+            return rel or b'.'
+        return os.path.join(self.prefix, rel) if rel else self.prefix
+
+    def watch(self, rel, report=False):
+        """watch directory rel and its subdirectories, optionally reporting their entries"""
+
+        for top, _, files in os.walk(os.path.join(self.root, rel) if rel else self.root):
+            top_rel = os.path.relpath(top, self.root)
+            top_rel = b'' if top_rel == b'.' else top_rel
+            if (wd := self.inotify.add(top)) is not None:
+                self.dirs[wd] = top_rel
+
+            if report:
+                self.changed.add(self.name(top_rel))
+                self.changed.update(self.name(os.path.join(top_rel, f)) for f in files)
+
+    def unwatch(self, rel):
+        """stop watching directory rel (moved away) and its subdirectories"""
+
+        inside = rel + b'/'
+        for wd, d in list(self.dirs.items()):
+            if d == rel or d.startswith(inside):
+                self.inotify.remove(wd)
+                del self.dirs[wd]
+
+    def start(self):
+        self.watch(b'')
+        asyncio.get_running_loop().add_reader(self.inotify.fd, self.process)
+
+    def process(self):
+        for wd, mask, name in self.inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self.overflow = True
+                continue
+
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+
+            if (d := self.dirs.get(wd)) is None:
+                continue
+
+            rel = os.path.join(d, name) if d else name
+            if mask & IN_ISDIR and mask & IN_MOVED_FROM:
+                self.unwatch(rel)
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # entries created before the watch is set are reported by the walk
+                self.watch(rel, report=True)
+
+            # parent: its mtime changes with entries
+            self.changed.add(self.name(d))
+            self.changed.add(self.name(rel))
+
+        now = time.monotonic()
+        if self.first is None:
+            self.first = now
+        self.last = now
+        self.event.set()
+
+    async def changes(self, timeout=None):
+        """Coalesced changed names (set) and overflow flag, None if nothing is changed in timeout"""
+
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+        except asyncio.TimeoutError:  # noqa: UP041 - not the builtin one before Python 3.11
+            return None
+
+        while (now := time.monotonic()) - self.last < self.delay:
+            if now - self.first >= self.max_delay:
+                break
+            left = min(self.last + self.delay, self.first + self.max_delay) - now
+            await asyncio.sleep(left)
+
+        changed, overflow = self.changed, self.overflow
+        self.changed, self.overflow = set(), False
+        self.first = self.last = None
+        self.event.clear()
+        return changed, overflow
+
+    def close(self):
+        asyncio.get_running_loop().remove_reader(self.inotify.fd)
+        self.inotify.close()
@@ -0,0 +1,17 @@
+from itertools import cycle
+
+import pytest
+
+from jsync.filelist import FileList
+
+
+@pytest.fixture
+def file_list():
+    """Factory of file lists: entry per size, attrs are repeated over entries"""
+
+    def make(sizes, name='f{:04d}', attrs=('>f+++++++++',), memory_limit=None):
+        files = FileList(memory_limit)
+        files.extend((name.format(n), a, s) for n, (s, a) in enumerate(zip(sizes, cycle(attrs))))
+        return files
+
+    return make
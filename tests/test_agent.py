@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from jsync.agent import Agent, check_options
+from jsync.events import EventBus
+from jsync.rsync import RSync
+from jsync.syncer import Syncer
+
+# rsync stand-in: dry run reports the source tree, transfer copies names of --files-from
+FAKE_RSYNC = '''#!{python}
+import os, shutil, sys
+
+src, dst = [a for a in sys.argv[1:] if not a.startswith('-')][-2:]
+src = src.rstrip('/')
+
+def report(attr, size, name):
+    print(attr, size, name, flush=True)
+
+if '--dry-run' in sys.argv:
+    report('cd+++++++++', 0, './')
+    for top, dirs, files in os.walk(src):
+        rel = os.path.relpath(top, src)
+        for n in sorted(dirs):
+            report('cd+++++++++', 0, os.path.normpath(os.path.join(rel, n)) + '/')
+        for n in sorted(files):
+            size = os.path.getsize(os.path.join(top, n))
+            report('>f+++++++++', size, os.path.normpath(os.path.join(rel, n)))
+    sys.exit(0)
+
+for name in sys.stdin.buffer.read().split(b'\\0'):
+    if not name:
+        continue
+    name = os.fsdecode(name)
+    s, d = os.path.join(src, name), os.path.join(dst, name)
+    if os.path.isdir(s):
+        os.makedirs(d, exist_ok=True)
+        report('cd+++++++++', 0, name + '/')
+    else:
+        os.makedirs(os.path.dirname(d), exist_ok=True)
+        shutil.copyfile(s, d)
+        report('>f+++++++++', os.path.getsize(s), name)
+'''
+
+
+@pytest.fixture
+def fake_rsync(tmp_path, monkeypatch):
+    path = tmp_path / 'rsync'
+    path.write_text(FAKE_RSYNC.format(python=sys.executable))
+    path.chmod(0o755)
+    monkeypatch.setattr(RSync, 'rsync_cmd', str(path))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    for d in range(3):
+        (src / f'd{d}').mkdir(parents=True)
+        for f in range(20):
+            (src / f'd{d}' / f'f{f}').write_bytes(b'x' * (d * 100 + f))
+    dst.mkdir()
+    return src, dst
+
+
+def tree_files(root):
+    return {
+        os.path.relpath(os.path.join(top, f), root): open(os.path.join(top, f), 'rb').read()
+        for top, _, files in os.walk(root)
+        for f in files
+    }
+
+
+async def sync_by_agents(src, dst, tokens, dead=0):
+    """Run agents with tokens (and dead addresses nobody listens on), sync src to dst"""
+
+    bus = EventBus()
+    servers = [await Agent('127.0.0.1:0', t, bus).start() for t in tokens]
+    addresses = [f'127.0.0.1:{s.sockets[0].getsockname()[1]}' for s in servers]
+    for _ in range(dead):
+        server = await Agent('127.0.0.1:0', 'token', bus).start()
+        addresses.append(f'127.0.0.1:{server.sockets[0].getsockname()[1]}')
+        server.close()
+        await server.wait_closed()
+
+    try:
+        rsync = RSync('-a', f'{src}/', f'{dst}/')
+        with Syncer(4, rsync, agents=addresses, agent_token='token', batch_files=5, bus=bus) as s:
+            await s.synchronize()
+    finally:
+        for server in servers:
+            server.close()
+            await server.wait_closed()
+
+
+@pytest.mark.parametrize(
+    'opts',
+    [
+        ['-a'],
+        ['-avzH', '--delete', '--no-v', '--info=progress2'],
+        ['--files-from=-', '--from0', '--out-format=%i %l %n', '--bwlimit=100'],
+    ],
+)
+def test_check_options_allows(opts):
+    check_options(opts)
+
+
+@pytest.mark.parametrize(
+    'opt',
+    ['-e', '-ave', '--rsh=sh -c id', '--rsync-path=id', '--files-from=/etc/passwd', '--log-file=x'],
+)
+def test_check_options_rejects(opt):
+    with pytest.raises(Exception, match='not allowed'):
+        check_options(['-a', opt])
+
+
+def test_agents_transfer(fake_rsync, tree):
+    src, dst = tree
+    asyncio.run(sync_by_agents(src, dst, ['token', 'token']))
+    assert tree_files(dst) == tree_files(src)
+
+
+def test_lost_agent_share_is_done_by_others(fake_rsync, tree):
+    src, dst = tree
+    asyncio.run(sync_by_agents(src, dst, ['token'], dead=1))
+    assert tree_files(dst) == tree_files(src)
+
+
+def test_agent_rejects_wrong_token(fake_rsync, tree):
+    src, dst = tree
+    with pytest.raises(Exception, match='All agents are lost'):
+        asyncio.run(sync_by_agents(src, dst, ['other']))
+    assert tree_files(dst) == {}
+
+
+def test_agent_requires_token():
+    with pytest.raises(Exception, match='requires a token'):
+        asyncio.run(Agent('127.0.0.1:0', None, EventBus()).start())
+
+
+def test_agent_options_of_resolved_rsync(tmp_path):
+    rules = tmp_path / 'rules'
+    rules.write_text('*.o\n')
+    rsync = RSync('-a', f'--exclude-from={rules}', 'src/', 'dst/')
+    # rules of the file are sent to agents inline, the file is not read on movers
+    with Syncer(2, rsync, agents=['127.0.0.1:1'], agent_token='token', bus=EventBus()) as s:
+        assert '--exclude=*.o' in s.rsync.opts
+
+    with Syncer(2, None, agents=['127.0.0.1:1'], agent_token='token', bus=EventBus()) as s:
+        assert s.rsync.opts == []
@@ -0,0 +1,51 @@
+import time
+
+from jsync.bandwidth import BandwidthBudget
+
+
+class FakeJob:
+    def __init__(self, bwlimit=None, rate=0, running=True, age=60) -> None:
+        self.bwlimit = bwlimit
+        self.rate = rate
+        self.running = running
+        self.limited = time.monotonic() - age  # when rsync was started with bwlimit
+
+    def active(self):
+        return self.running
+
+
+def test_fair_share_of_new_jobs():
+    jobs = [FakeJob(), FakeJob(), FakeJob()]
+    budget = BandwidthBudget(900, jobs)
+    assert budget.limit(jobs[0]) == 300
+
+
+def test_leftover_of_jobs_not_bandwidth_bound():
+    jobs = [FakeJob(bwlimit=300, rate=100), FakeJob(bwlimit=300, rate=100), FakeJob()]
+    budget = BandwidthBudget(900, jobs)
+    assert budget.limit(jobs[2]) == 700
+
+
+def test_bound_and_recent_jobs_keep_their_limit():
+    jobs = [FakeJob(bwlimit=400, rate=390), FakeJob(bwlimit=300, rate=10, age=1), FakeJob()]
+    budget = BandwidthBudget(1000, jobs)
+    assert budget.limit(jobs[2]) == 333  # fair share, nothing is left
+
+
+def test_inactive_jobs_are_not_accounted():
+    jobs = [FakeJob(bwlimit=500, rate=500, running=False), FakeJob()]
+    assert BandwidthBudget(1000, jobs).limit(jobs[1]) == 1000
+
+
+def test_retune():
+    busy = FakeJob(bwlimit=200, rate=195)
+    idle = FakeJob(bwlimit=800, rate=50)
+    budget = BandwidthBudget(1000, [busy, idle])
+    # busy can get what idle leaves, idle keeps far more than it needs
+    assert budget.retune() == [busy]
+
+    greedy = FakeJob(bwlimit=1000, rate=1000)
+    new = FakeJob(bwlimit=500, rate=100, age=1)
+    budget = BandwidthBudget(1000, [greedy, new])
+    # new rsync holds its limit for a while, greedy gives its share back
+    assert budget.retune() == [greedy]
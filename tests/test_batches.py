@@ -0,0 +1,91 @@
+import asyncio
+
+from jsync.batches import BatchBuilder, BatchQueue, batch_size, make_batches
+from jsync.filelist import FileList
+
+
+def test_batches_by_count(file_list):
+    batches = list(make_batches(file_list([1] * 25), 10))
+    assert [len(b) for b in batches] == [10, 10, 5]
+    assert [i for b in batches for i in b.indexes] == list(range(25))
+
+
+def test_batches_by_bytes_first(file_list):
+    batches = list(make_batches(file_list([40, 40, 40, 1, 1]), 10, nbytes=80))
+    assert [len(b) for b in batches] == [2, 3]
+
+
+def test_batches_of_view(file_list):
+    files = file_list(range(30))
+    batches = list(make_batches(files[5:17], 5))
+    assert [list(b.indexes) for b in batches] == [
+        list(range(5, 10)),
+        list(range(10, 15)),
+        [15, 16],
+    ]
+
+
+def test_batch_size(file_list):
+    files = file_list([3, 4, 5])
+    assert batch_size(files[:]) == 12
+    assert batch_size([('a', '>f', 1), ('b', '>f', 2)]) == 3
+
+
+def test_queue_drains_to_none_for_every_consumer(file_list):
+    async def run():
+        queue = BatchQueue()
+        files = file_list([1, 2, 3])
+        for b in make_batches(files, 2):
+            queue.put(b)
+        assert (queue.qsize(), queue.nfiles, queue.nbytes) == (2, 3, 6)
+        queue.close()
+
+        got = [await queue.get(), await queue.get()]
+        assert [len(b) for b in got] == [2, 1]
+        assert (queue.qsize(), queue.nfiles, queue.nbytes) == (0, 0, 0)
+        assert await queue.get() is None
+        assert await queue.get() is None
+
+    asyncio.run(run())
+
+
+def test_builder_flushes_full_batches():
+    async def run():
+        queue = BatchQueue()
+        flushed = []
+        builder = BatchBuilder(queue, FileList(), 3, callback=lambda: flushed.append(1))
+        for n in range(7):
+            builder.append((f'f{n}', '>f+++++++++', 1))
+        assert queue.qsize() == 2
+        builder.flush()
+        assert [len(await queue.get()) for _ in range(3)] == [3, 3, 1]
+        assert len(flushed) == 3
+
+    asyncio.run(run())
+
+
+def test_builder_flushes_by_bytes():
+    async def run():
+        queue = BatchQueue()
+        builder = BatchBuilder(queue, FileList(), 100, nbytes=10)
+        for size in (4, 4, 4, 1):
+            builder.append(('f', '>f+++++++++', size))
+        assert queue.qsize() == 1
+        assert len(await queue.get()) == 3
+
+    asyncio.run(run())
+
+
+def test_builder_flushes_waiting_batch_without_new_entries():
+    async def run():
+        queue = BatchQueue()
+        builder = BatchBuilder(queue, FileList(), 100, timeout=0.05)
+        timer = asyncio.ensure_future(builder.flush_waiting())
+        builder.append(('f', '>f+++++++++', 1))
+        await asyncio.sleep(0.01)
+        assert queue.qsize() == 0
+        await asyncio.sleep(0.1)
+        timer.cancel()
+        assert queue.qsize() == 1
+
+    asyncio.run(run())
@@ -0,0 +1,41 @@
+import pytest
+
+from jsync.delete import DeletionSink, shard, top_entries
+
+
+def test_deletion_sink():
+    files, deletions = [], []
+    sink = DeletionSink(files, deletions)
+    sink.append((b'old', '*deleting', 0))
+    sink.append((b'new', '>f+++++++++', 1))
+
+    assert deletions == [b'old']
+    assert files == [(b'new', '>f+++++++++', 1)]
+    assert len(sink) == 1
+
+
+def test_top_entries():
+    names = [b'a', b'a/b', b'a/b/c', b'ab', b'x/y', b'x/y/z', b'x/w']
+    assert sorted(top_entries(names)) == [b'a', b'ab', b'x/w', b'x/y']
+
+
+@pytest.mark.parametrize('nshards', [1, 2, 3, 8])
+def test_shard(nshards):
+    names = [b'd%d/f%d' % (d, f) for d in range(5) for f in range(d + 1)]
+    names += [b'd4/f0/nested', b'top']
+    shards = shard(names, nshards)
+
+    assert 0 < len(shards) <= nshards
+    flat = [n for s in shards for n in s]
+    assert sorted(flat) == sorted(n for n in names if n != b'd4/f0/nested')
+
+    # entries of a directory go to one shard
+    owner = {}
+    for i, s in enumerate(shards):
+        for n in s:
+            assert owner.setdefault(n.rpartition(b'/')[0], i) == i
+
+
+def test_shard_balances_directories():
+    names = [b'big/%d' % i for i in range(6)] + [b'a/1', b'a/2', b'b/1', b'b/2', b'c/1']
+    assert [len(s) for s in shard(names, 2)] == [6, 5]
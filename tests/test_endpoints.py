@@ -0,0 +1,56 @@
+from jsync.endpoints import Endpoints
+from jsync.rsync import RSync
+
+
+def endpoints(**kw):
+    return Endpoints(RSync('-a', 'src/', 'user@a:/dst/'), ['a', 'b'], **kw)
+
+
+def test_hosts():
+    ep = endpoints()
+    assert ep.rsync_for('b', 0).args == ['src/', 'user@b:/dst/']
+    assert [ep.assign(n) for n in range(3)] == ['a', 'b', 'a']
+
+
+def test_record_ewma():
+    ep = endpoints(alpha=0.5)
+    ep.record('a', 1000, 1)
+    ep.record('a', 3000, 1)
+    assert ep.rate['a'] == 2000
+    assert (ep.nbatches['a'], ep.nbytes['a']) == (2, 4000)
+
+
+def test_choose_moves_to_faster_host():
+    ep = endpoints(margin=0.2)
+    ep.join('a')
+    ep.join('b')
+    assert ep.choose('a') == 'a'  # not measured yet
+
+    ep.record('a', 1000, 1)
+    ep.record('b', 1100, 1)
+    assert ep.choose('a') == 'a'  # within margin
+
+    ep.record('b', 3000, 1)
+    assert ep.choose('a') == 'b'
+    assert ep.active == {'a': 0, 'b': 2}
+
+
+def test_choose_probes_unused_host():
+    ep = endpoints()
+    ep.join('a')
+    ep.record('a', 1000, 1)
+    assert ep.choose('a') == 'b'
+
+    ep.record('b', 100, 1)
+    ep.leave('b')
+    ep.join('a')
+    assert ep.choose('a') == 'a'  # measured recently and slower
+
+    ep.measured['b'] -= ep.stale + 1
+    assert ep.choose('a') == 'b'
+
+
+def test_report():
+    ep = endpoints()
+    ep.record('a', 2000, 1)
+    assert ep.report()[0].startswith('a: 1 batches,')
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+import jsync
+from jsync.events import EventBus, FileDone, JobAdded, JobFinished, Message
+from jsync.syncer import Syncer
+
+RSYNC_ARGS = ['-a', 'src/', 'dst/']
+
+
+def test_publish_to_subscribers_in_order():
+    bus = EventBus()
+    first, second = [], []
+    bus.subscribe(first.append)
+    bus.subscribe(lambda e: second.append((len(first), e)))
+
+    bus.publish(JobAdded(1))
+    bus.message('Done', 'all files')
+
+    assert first == [JobAdded(1), Message('Done', 'all files', 'info')]
+    assert second == [(1, JobAdded(1)), (2, Message('Done', 'all files', 'info'))]
+
+
+def test_unsubscribe():
+    bus = EventBus()
+    got = []
+    bus.subscribe(got.append)
+    bus.publish(JobAdded(1))
+    bus.unsubscribe(got.append)
+    bus.publish(JobAdded(2))
+    assert got == [JobAdded(1)]
+
+
+@pytest.fixture
+def synchronize(monkeypatch):
+    """Replace synchronization with a coroutine publishing given events, then running tail"""
+
+    state = {}
+
+    def make(events, tail):
+        async def fake(self):
+            state['running'] = True
+            try:
+                for e in events:
+                    self.bus.publish(e)
+                    await asyncio.sleep(0)
+                await tail()
+            finally:
+                state['running'] = False
+
+        monkeypatch.setattr(Syncer, 'synchronize', fake)
+        return state
+
+    return make
+
+
+async def collect(limit=None):
+    got = []
+    async for e in jsync.events(*RSYNC_ARGS):
+        got.append(e)
+        if len(got) == limit:
+            break
+    return got
+
+
+def test_events_are_yielded(synchronize):
+    files = [FileDone(1, f'f{n}', '>f+++++++++', n) for n in range(3)]
+
+    async def done():
+        pass
+
+    synchronize([JobAdded(1), *files, JobFinished(1)], done)
+    got = asyncio.run(collect())
+    assert got[:5] == [JobAdded(1), *files, JobFinished(1)]  # then summary of syncer
+
+
+def test_break_stops_synchronization(synchronize):
+    async def forever():
+        await asyncio.sleep(3600)
+
+    async def run():
+        gen = jsync.events(*RSYNC_ARGS)
+        async for e in gen:
+            if e == JobAdded(1):
+                break
+        await gen.aclose()
+        await asyncio.sleep(0)  # let cancelled task finish
+        return state['running']
+
+    state = synchronize([JobAdded(1), JobAdded(2)], forever)
+    assert asyncio.run(asyncio.wait_for(run(), 5)) is False
+
+
+def test_exception_is_raised_after_events(synchronize):
+    async def fail():
+        raise RuntimeError('rsync failed')
+
+    synchronize([JobAdded(1), JobFinished(1, 'failed')], fail)
+    got = []
+
+    async def run():
+        async for e in jsync.events(*RSYNC_ARGS):
+            got.append(e)
+
+    with pytest.raises(RuntimeError, match='rsync failed'):
+        asyncio.run(run())
+    assert got[:2] == [JobAdded(1), JobFinished(1, 'failed')]
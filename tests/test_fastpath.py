@@ -0,0 +1,88 @@
+import asyncio
+import sys
+import time
+
+import pytest
+
+from jsync.fastpath import ChangeSetTooLarge, LimitSink, fast_path
+from jsync.rsync import RSync
+
+# rsync stand-in: reports files forever, on SIGTERM removes its temporary file (argv[1])
+FAKE_RSYNC = """#!{python}
+import os, signal, sys, time
+
+tmp = sys.argv[1]
+open(tmp, 'w').close()
+
+def cleanup(*_):
+    os.unlink(tmp)
+    sys.exit(20)
+
+signal.signal(signal.SIGTERM, signal.SIG_IGN if {ignore} else cleanup)
+n = 0
+while True:
+    print(f'>f+++++++++ 10 f{{n}}', flush=True)
+    n += 1
+    time.sleep(0.01)
+"""
+
+
+def test_counts_transferred_bytes():
+    sink = LimitSink(10, 100)
+    sink.append(('d/', 'cd+++++++++', 4096))
+    sink.append(('a', '>f+++++++++', 60))
+    sink.append(('b', '.f..t......', 1000))  # metadata only
+    sink.append(('c', 'hf+++++++++', 1000))  # hard link
+
+    assert (len(sink), sink.nbytes) == (4, 60)
+    with pytest.raises(ChangeSetTooLarge, match='more than 100 bytes'):
+        sink.append(('e', '>f.st......', 41))
+
+
+def test_max_files():
+    sink = LimitSink(2)
+    sink.append(('a', '>f+++++++++', 1))
+    sink.append(('b', '*deleting', 0))
+    with pytest.raises(ChangeSetTooLarge, match='more than 2 entries'):
+        sink.append(('c', '>f+++++++++', 1))
+
+
+def test_progress_of_large_file():
+    sink = LimitSink(10, 1000)
+    sink.progress('            500  50%  1.00MB/s    0:00:00 (xfr#0, to-chk=1/2)')
+    sink.progress('sent 10 bytes  received 20 bytes  60.00 bytes/sec')
+    with pytest.raises(ChangeSetTooLarge):
+        sink.progress('           1001  99%  1.00MB/s    0:00:01 (xfr#0, to-chk=1/2)')
+
+
+def test_progress_without_byte_limit():
+    LimitSink(10).progress(' 99999999999 100%  1.00GB/s    0:01:00 (xfr#9, to-chk=0/9)')
+
+
+def run_fast_path(tmp_path, monkeypatch, ignore, kill_timeout=10.0):
+    path = tmp_path / 'rsync'
+    path.write_text(FAKE_RSYNC.format(python=sys.executable, ignore=ignore))
+    path.chmod(0o755)
+    monkeypatch.setattr(RSync, 'rsync_cmd', str(path))
+    tmp = tmp_path / '.f0.XXXXXX'
+    rsync = RSync(str(tmp), 'dst/')
+
+    def noop(line):
+        pass
+
+    done = asyncio.run(fast_path(rsync, LimitSink(3), noop, noop, kill_timeout=kill_timeout))
+    return done, tmp
+
+
+def test_too_large_change_set_terminates_rsync(tmp_path, monkeypatch):
+    done, tmp = run_fast_path(tmp_path, monkeypatch, ignore=False)
+    assert done is False
+    assert not tmp.exists()  # rsync has cleaned up
+
+
+def test_rsync_ignoring_terminate_is_killed(tmp_path, monkeypatch):
+    started = time.monotonic()
+    done, tmp = run_fast_path(tmp_path, monkeypatch, ignore=True, kill_timeout=0.3)
+    assert done is False
+    assert tmp.exists()
+    assert time.monotonic() - started < 5
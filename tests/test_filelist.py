@@ -0,0 +1,97 @@
+from array import array
+
+import pytest
+
+from jsync.filelist import Completion, FileList
+
+
+@pytest.fixture
+def make(file_list):
+    """Directories at even and files at odd indexes, size is index"""
+
+    def make(n, memory_limit=None):
+        return file_list(range(n), 'dir/file-{}', ('cd+++++++++', '>f+++++++++'), memory_limit)
+
+    return make
+
+
+def test_append_and_entry():
+    files = FileList()
+    files.append((b'raw\xff', '>f+++++++++', 7))
+    files.append(('dir', 'cd+++++++++', 0))
+
+    assert len(files) == 2
+    assert files.name(0) == b'raw\xff'
+    assert files[1] == ('dir', 'cd+++++++++', 0)
+    assert files[-2][1:] == ('>f+++++++++', 7)
+    assert files.attrs == ['>f+++++++++', 'cd+++++++++']
+
+
+def test_spill_keeps_names(make):
+    files = make(100, memory_limit=64)
+
+    assert files.spill is not None
+    assert 0 < files.spilled <= files.offsets[-1]
+    assert len(files.arena) <= 64
+    assert [f[0] for f in files] == [f'dir/file-{i}' for i in range(100)]
+
+
+def test_memory(make):
+    files = make(10)
+    assert files.memory() >= len(files.arena) + 10 * (8 + 2)
+
+
+def test_slices_and_views(make):
+    files = make(10)
+
+    part = files[2:6]
+    assert isinstance(part.indexes, range)
+    assert [f[2] for f in part] == [2, 3, 4, 5]
+    assert part.nbytes == 14
+    assert part[1:3][0] == files[3]
+
+    view = files.view(array('I', [1, 7, 3]))
+    assert len(view) == 3
+    assert view.nbytes == 11
+    assert list(view.names()) == [b'dir/file-1', b'dir/file-7', b'dir/file-3']
+    assert view[-1] == files[3]
+
+
+def test_split_without_by_name(make):
+    files = make(6)
+    view = files[:]
+
+    dirs, rest = view.split(lambda i: files.attr(i)[0] == 'c')
+    assert [f[2] for f in dirs] == [0, 2, 4]
+    assert [f[2] for f in rest] == [1, 3, 5]
+
+    kept = view.without({b'dir/file-1', b'dir/file-4'})
+    assert [f[2] for f in kept] == [0, 2, 3, 5]
+
+    assert rest.by_name() == {
+        b'dir/file-1': ('>f+++++++++', 1),
+        b'dir/file-3': ('>f+++++++++', 3),
+        b'dir/file-5': ('>f+++++++++', 5),
+    }
+
+
+def test_completion(make):
+    files = make(50)
+    view = files.view(array('I', range(1, 50, 2)))
+    done = Completion(view)
+
+    assert done.find(b'dir/file-7') == 3
+    assert done.find(b'dir/file-8') is None
+
+    done.add(b'dir/file-7')
+    done.add(b'dir/file-49')
+    done.add(b'not/there')
+    assert 3 in done
+    assert 2 not in done
+    assert [f[2] for f in done.remaining()] == [i for i in range(1, 49, 2) if i != 7]
+
+
+def test_completion_of_empty_view():
+    done = Completion(FileList()[:])
+    assert done.find(b'x') is None
+    assert len(done.remaining()) == 0
@@ -0,0 +1,102 @@
+from jsync.delete import DeletionSink
+from jsync.events import EventBus
+from jsync.journal import Journal
+from jsync.rsync import RSync
+from jsync.syncer import Syncer
+
+
+def plan(path, names, done=()):
+    journal = Journal(str(path))
+    journal.open()
+    files = []
+    planner = journal.track(files)
+    for i, name in enumerate(names):
+        planner.append((name, '>f+++++++++', i))
+    journal.complete()
+    journal.done(done)
+    journal.close()
+    return journal
+
+
+def test_load_without_journal(tmp_path):
+    assert Journal(str(tmp_path / 'journal')).load() is None
+
+
+def test_load_incomplete_plan(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    journal.open()
+    journal.track([]).append(('a', '>f+++++++++', 1))
+    journal.close()
+
+    assert journal.load() is None
+
+
+def test_load_remaining(tmp_path):
+    journal = plan(tmp_path / 'journal', [b'a', b'b\n', b'c'], done=[b'a'])
+
+    remaining, deletions, ndone = journal.load()
+    assert (ndone, deletions) == (1, [])
+    assert list(remaining) == [('b\n', '>f+++++++++', 1), ('c', '>f+++++++++', 2)]
+
+
+def test_load_ignores_truncated_record(tmp_path):
+    path = tmp_path / 'journal'
+    journal = plan(path, [b'a', b'b'], done=[b'a'])
+    with open(path, 'ab') as f:
+        f.write(b'Db')  # crash while the record was written
+
+    remaining, deletions, ndone = journal.load()
+    assert ndone == 1
+    assert [e[0] for e in remaining] == ['b']
+
+
+def test_resume_appends(tmp_path):
+    path = tmp_path / 'journal'
+    journal = plan(path, [b'a', b'b'])
+    journal.open(append=True)
+    journal.done([b'b'])
+    journal.close()
+
+    remaining, deletions, ndone = journal.load()
+    assert (ndone, [e[0] for e in remaining]) == (1, ['a'])
+
+    journal.close(remove=True)
+    assert not path.exists()
+
+
+def test_deletions(tmp_path):
+    journal = Journal(str(tmp_path / 'journal'))
+    journal.open()
+    files, deletions = [], []
+    planner = journal.track(DeletionSink(files, deletions))
+    planner.append((b'a', '>f+++++++++', 1))
+    planner.append((b'old', '*deleting', 0))
+    planner.append((b'dir/gone', '*deleting', 0))
+    journal.complete()
+    journal.close()
+
+    assert deletions == [b'old', b'dir/gone']
+    remaining, deletions, _ = journal.load()
+    assert [e[0] for e in remaining] == ['a']
+    assert deletions == [b'old', b'dir/gone']
+
+    journal.open(append=True)
+    journal.deleted()
+    journal.close()
+    assert journal.load()[1] == []
+
+
+def test_resume_restores_deletions(tmp_path):
+    path = tmp_path / 'journal'
+    journal = Journal(str(path))
+    journal.open()
+    journal.track(DeletionSink([], [])).append((b'old', '*deleting', 0))
+    journal.complete()
+    journal.close()
+
+    rsync = RSync('-a', '--delete', 'src/', 'dst/')
+    with Syncer(2, rsync, journal=str(path), resume=True, bus=EventBus()) as s:
+        s.open_journal()
+        assert s.deletions == [b'old']
+        assert len(s.resumed) == 0
+        s.journal.close()
@@ -0,0 +1,78 @@
+import pytest
+
+from jsync.jsync import parse_args
+
+RSYNC_ARGS = ['-a', 'src/', 'dst/']
+
+
+@pytest.mark.parametrize(
+    ('argv', 'key', 'value'),
+    [
+        (['--partition=size'], 'partition', 'size'),
+        (['--schedule=queue'], 'schedule', 'queue'),
+        (['--batch-files', '50'], 'batch_files', 50),
+        (['--batch-size=64K'], 'batch_bytes', 64000),
+        (['--stream'], 'stream', True),
+        (['--scan-jobs=4', '--scan-depth=2'], 'scan_jobs', 4),
+        (['--scan-jobs=4', '--scan-depth=2'], 'scan_depth', 2),
+        (['--manifest=m.db', '--rescan'], 'manifest', 'm.db'),
+        (['--manifest=m.db', '--rescan'], 'rescan', True),
+        (['--verify-manifest'], 'verify', True),
+        (['--list-memory=1M'], 'memory_limit', 1000000),
+        (['--parser=progress'], 'parser', 'progress'),
+        (['-jauto', '--min-jobs=3', '--max-jobs=8'], 'jobs', 'auto'),
+        (['-j', '4'], 'jobs', 4),
+        (['-jauto', '--min-jobs=3', '--max-jobs=8'], 'max_jobs', 8),
+        (['--journal=j', '--resume'], 'resume', True),
+        (['--retries=3'], 'retries', 3),
+        (['--ssh-masters=0'], 'ssh_masters', 0),
+        (['--endpoints=h1,h2,'], 'endpoints', ['h1', 'h2']),
+        (['--total-bwlimit=100M'], 'total_bwlimit', 100000000),
+        (['--metrics=unix:/tmp/s'], 'metrics', 'unix:/tmp/s'),
+        (['--metrics-http=9100'], 'metrics_http', '9100'),
+        (['--trace=t.json'], 'trace', 't.json'),
+        (['--delete-phase=concurrent'], 'delete_phase', 'concurrent'),
+        (['--skeleton'], 'skeleton', True),
+        (['--tar-threshold=64K'], 'tar_threshold', 64000),
+        (['--engine=auto'], 'engine', 'auto'),
+        (['--fast-path=100'], 'fast_path', (100, None)),
+        (['--fast-path=100,1M'], 'fast_path', (100, 1000000)),
+        (['--order=extent', '--by-device'], 'order', 'extent'),
+        (['--order=extent', '--by-device'], 'by_device', True),
+        (['--watch', '--watch-delay=0.5'], 'watch_delay', 0.5),
+        (['--reconcile=60'], 'reconcile', 60.0),
+        (['--agents=a:1,b:2'], 'agents', ['a:1', 'b:2']),
+    ],
+)
+def test_option(argv, key, value):
+    opts, rest = parse_args([*argv, *RSYNC_ARGS])
+    assert opts[key] == value
+    assert rest == RSYNC_ARGS
+
+
+def test_rsync_options_are_passed():
+    opts, rest = parse_args(['-avz', '--delete', *RSYNC_ARGS])
+    assert opts['verbose']
+    assert rest == ['-avz', '--delete', *RSYNC_ARGS]
+
+
+def test_rsync_arguments_are_required():
+    with pytest.raises(Exception, match='Not enough rsync options'):
+        parse_args(['-a'])
+
+
+def test_wrong_choice():
+    with pytest.raises(Exception, match='Wrong value'):
+        parse_args(['--partition=random', *RSYNC_ARGS])
+
+
+def test_resume_requires_journal():
+    with pytest.raises(Exception, match='requires --journal'):
+        parse_args(['--resume', *RSYNC_ARGS])
+
+
+def test_agent_needs_no_rsync_arguments(tmp_path):
+    token = tmp_path / 'token'
+    token.write_text('secret\n')
+    opts, rest = parse_args(['--agent=9100', f'--agent-token={token}'])
+    assert (opts['agent'], opts['agent_token'], rest) == ('9100', 'secret', [])
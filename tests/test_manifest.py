@@ -0,0 +1,45 @@
+from jsync.manifest import Manifest
+
+
+def test_walk(tmp_path):
+    (tmp_path / 'd').mkdir()
+    (tmp_path / 'd' / 'f').write_bytes(b'xyz')
+    (tmp_path / 'g').write_bytes(b'')
+
+    snapshot = Manifest.walk(str(tmp_path), 'src')
+    assert set(snapshot) == {'src/d', 'src/d/f', 'src/g'}
+    assert snapshot['src/d/f'][0] == 3
+
+
+def test_changes(tmp_path):
+    m = Manifest(str(tmp_path / 'manifest.db'), 'src/', 'host:/dst/')
+    assert m.empty()
+
+    m.save({'a': (1, 10), 'b': (2, 20), 'c': (3, 30)})
+    assert not m.empty()
+    assert m.changes({'a': (1, 10), 'b': (2, 21), 'd': (4, 40)}) == (['b', 'd'], ['c'])
+    m.close()
+
+
+def test_changes_per_pair(tmp_path):
+    path = str(tmp_path / 'manifest.db')
+    m = Manifest(path, 'src/', 'host:/dst/')
+    m.save({'a': (1, 10)})
+    m.close()
+
+    other = Manifest(path, 'src/', 'host:/other/')
+    assert other.empty()
+    assert other.changes({'a': (1, 10)}) == (['a'], [])
+    other.close()
+
+
+def test_track_records_outcome(tmp_path):
+    m = Manifest(str(tmp_path / 'manifest.db'), 'src/', 'dst/')
+    files = []
+    m.track(files).append((b'a', '>f+++++++++', 1))
+    assert files == [(b'a', '>f+++++++++', 1)]
+
+    m.save({'a': (1, 10)})
+    row = m.db.execute('SELECT attr FROM entries WHERE path = ?', ('a',)).fetchone()
+    assert row == ('>f+++++++++',)
+    m.close()
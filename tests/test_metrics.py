@@ -0,0 +1,90 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from jsync.metrics import Metrics
+
+
+def job(id, nfiles):
+    return SimpleNamespace(
+        id=id,
+        active=lambda: True,
+        size=100 * id,
+        total=1000,
+        rate=10.0,
+        nfiles=nfiles,
+        nrsyncs=1,
+        wall=2.0,
+        user=0.5,
+        sys=0.25,
+    )
+
+
+def syncer():
+    return SimpleNamespace(
+        jobs=[job(1, 10), job(2, 20)],
+        queue=None,
+        size=300,
+        total=2000,
+        rate=20.0,
+        phases={'itemize': (0.0, 1.5)},
+    )
+
+
+def test_snapshot_files_rate():
+    s = syncer()
+    m = Metrics(s)
+    first = m.snapshot()
+    assert first['total']['files'] == 30
+    assert first['total']['files_rate'] == 0
+    assert first['phases'] == {'itemize': 1.5}
+    assert first['queue'] == {'batches': 0, 'bytes': 0, 'files': 0}
+
+    s.jobs[0].nfiles += 5
+    m.last['json'] = (m.last['json'][0] - 1, m.last['json'][1])
+    second = m.snapshot()
+    assert second['total']['files'] == 35
+    assert 4 < second['jobs'][0]['files_rate'] <= 5
+    assert second['jobs'][1]['files_rate'] == 0
+
+
+def test_scrapes_do_not_reset_json_rates():
+    s = syncer()
+    m = Metrics(s)
+    m.snapshot()
+    m.last['json'] = (m.last['json'][0] - 2, m.last['json'][1])
+
+    s.jobs[0].nfiles += 10
+    m.prometheus()
+    m.last['prometheus'] = (m.last['prometheus'][0] - 1, m.last['prometheus'][1])
+    s.jobs[0].nfiles += 10
+    text = m.prometheus()
+
+    # since the previous scrape: 10 files in about 1s
+    rate = next(ln for ln in text.splitlines() if ln.startswith('jsync_job_files_rate{job="1"}'))
+    assert 9 < float(rate.split()[1]) <= 10
+
+    # since the previous JSON lines snapshot: 20 files in about 2s
+    assert 9 < m.snapshot()['jobs'][0]['files_rate'] <= 10
+
+
+def test_prometheus():
+    text = Metrics(syncer()).prometheus()
+    lines = text.splitlines()
+    assert '# TYPE jsync_bytes counter' in lines
+    assert 'jsync_bytes 300' in lines
+    assert 'jsync_phase_seconds{phase="itemize"} 1.5' in lines
+    assert 'jsync_job_bytes{job="2"} 200' in lines
+    assert text.endswith('\n')
+
+
+def test_json_lines(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    m = Metrics(syncer(), path=str(path))
+    asyncio.run(m.open())
+    m.write()
+    m.stop()
+
+    lines = [json.loads(s) for s in path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert [j['id'] for j in lines[-1]['jobs']] == [1, 2]
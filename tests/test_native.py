@@ -0,0 +1,100 @@
+import asyncio
+import os
+import stat
+
+import pytest
+
+from jsync.filelist import FileList
+from jsync.native import NativeEngine, implied
+from jsync.parser import RecordParser
+from jsync.rsync import RSync
+
+
+@pytest.mark.parametrize(
+    ('opts', 'flags'),
+    [
+        (['-a'], 'Dagloprt'),
+        (['--archive'], 'Dagloprt'),
+        (['-avz'], 'Dagloprtvz'),
+        (['-a', '--no-p'], 'Daglort'),
+        (['-a', '--no-perms', '--no-D'], 'aglort'),
+        (['-rt', '--links', '--no-times'], 'lr'),
+        (['-essh -a', '-r'], 'er'),
+        (['--verbose', '--delete'], ''),
+    ],
+)
+def test_implied(opts, flags):
+    assert ''.join(sorted(implied(opts))) == flags
+
+
+@pytest.mark.parametrize(
+    ('args', 'reasons'),
+    [
+        (['-a', 'src/', 'dst/'], []),
+        (['-av', '--no-p', '--delete', '--exclude=*.o', 'src/', 'dst/'], []),
+        (['-a', 'src/', 'host:/dst/'], ['host:/dst/']),
+        (['-a', 'a/', 'b/', 'dst/'], ['multiple sources']),
+        (['-aH', '--checksum', 'src/', 'dst/'], ['-aH', '--checksum']),
+    ],
+)
+def test_unsupported(args, reasons):
+    assert NativeEngine.unsupported(RSync(*args)) == reasons
+
+
+def copy(opts, src, dst, names):
+    files = FileList()
+    files.extend((n, '>f+++++++++' if os.path.isfile(src / n) else 'cd+++++++++', 0) for n in names)
+    engine = NativeEngine(RSync(*opts, f'{src}/', f'{dst}/'), 2)
+    errors = []
+    try:
+        asyncio.run(
+            engine.transfer(files[:], RecordParser(lambda *r: None, lambda *p: None), errors.append)
+        )
+    finally:
+        engine.close()
+    assert errors == []
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+@pytest.fixture
+def umask():
+    old = os.umask(0o027)
+    yield 0o027
+    os.umask(old)
+
+
+def test_modes_without_perms(tmp_path, umask):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    (src / 'd').mkdir(parents=True)
+    (src / 'd' / 'new').write_bytes(b'new')
+    (src / 'old').write_bytes(b'old')
+    os.chmod(src / 'd', 0o775)
+    os.chmod(src / 'd' / 'new', 0o755)
+    os.chmod(src / 'old', 0o666)
+    dst.mkdir()
+    (dst / 'old').write_bytes(b'')
+    os.chmod(dst / 'old', 0o604)
+
+    copy(['-rt'], src, dst, ['d', 'd/new', 'old'])
+
+    assert mode(dst / 'd') == 0o750
+    assert mode(dst / 'd' / 'new') == 0o750
+    assert mode(dst / 'old') == 0o604
+    assert (dst / 'old').read_bytes() == b'old'
+
+
+def test_modes_with_perms(tmp_path, umask):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    (src / 'd').mkdir(parents=True)
+    (src / 'd' / 'f').write_bytes(b'x')
+    os.chmod(src / 'd', 0o777)
+    os.chmod(src / 'd' / 'f', 0o646)
+    dst.mkdir()
+
+    copy(['-rtp'], src, dst, ['d', 'd/f'])
+
+    assert mode(dst / 'd') == 0o777
+    assert mode(dst / 'd' / 'f') == 0o646
@@ -0,0 +1,59 @@
+import os
+from array import array
+
+from jsync.filelist import FileList
+from jsync.order import DiskOrder, interleave, split_jobs
+
+
+def test_sort_by_location(tmp_path):
+    files = FileList()
+    for n in ('c', 'a', 'b'):
+        (tmp_path / n).write_bytes(b'x')
+    files.extend([('a', '>f+++++++++', 1), ('b', '>f+++++++++', 1), ('c', '>f+++++++++', 1)])
+    files.append(('missing', '>f+++++++++', 1))
+
+    order = DiskOrder(str(tmp_path), files)
+    order.locate()
+    inodes = {n: os.lstat(tmp_path / n).st_ino for n in 'abc'}
+
+    ordered = [e[0] for e in order.sort(files[:])]
+    assert ordered == ['missing'] + sorted('abc', key=inodes.get)
+    assert order.devices() == {0, os.lstat(tmp_path).st_dev}
+    assert order.sequential([order.sort(files[:3])]) == 1.0
+
+
+def test_groups_and_sequential(file_list):
+    files = file_list([1, 10, 100, 1000])
+    order = DiskOrder('/', files)
+    order.devs.extend([1, 2, 2, 1])
+    order.pos.extend([5, 1, 2, 4])
+
+    groups = order.groups(files)
+    assert [list(g.indexes) for g in groups] == [[0, 3], [1, 2]]
+
+    # 0 -> 3 goes back on device 1, 1 -> 2 goes forward on device 2
+    assert order.sequential(groups) == 0.5
+
+
+def partitioner(view, n):
+    return [view[k::n] for k in range(n)]
+
+
+def test_split_jobs_by_bytes(file_list):
+    files = file_list([300, 300, 300, 100])
+    big, small = files.view(array('I', [0, 1, 2])), files.view(array('I', [3]))
+
+    parts = split_jobs([big, small], 4, partitioner)
+    assert [list(p.indexes) for p in parts] == [[0], [1], [2], [3]]
+
+
+def test_split_jobs_more_devices_than_jobs(file_list):
+    files = file_list([500, 300, 200, 100])
+    groups = [files.view(array('I', [i])) for i in range(4)]
+
+    parts = split_jobs(groups, 2, partitioner)
+    assert [list(p.indexes) for p in parts] == [[0, 3], [1, 2]]
+
+
+def test_interleave():
+    assert interleave([[1, 2, 3], ['a'], ['x', 'y']]) == [1, 'a', 'x', 2, 'y', 3]
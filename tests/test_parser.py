@@ -0,0 +1,72 @@
+import pytest
+
+from jsync.parser import ProgressParser, RecordParser, unescape
+
+
+@pytest.mark.parametrize(
+    ('name', 'raw'),
+    [
+        (b'plain name', b'plain name'),
+        (b'new\\#012line', b'new\nline'),
+        (b'\\#377\\#376', b'\xff\xfe'),
+        (b'back\\slash', b'back\\slash'),
+    ],
+)
+def test_unescape(name, raw):
+    assert unescape(name) == raw
+
+
+def record_parser():
+    records, progress = [], []
+    parser = RecordParser(
+        lambda attr, size, name: records.append((attr, size, name)),
+        lambda size, rate: progress.append((size, rate)),
+    )
+    return parser, records, progress
+
+
+def test_records():
+    parser, records, _ = record_parser()
+    parser.feed(b'>f+++++++++ 1024 dir/file name\ncd+++++++++ 0 dir/\n')
+    parser.feed(b'*deleting 0 old\\#012name\n.d..t...... 4096 ./\n')
+    parser.feed(b'sent 1024 bytes  received 35 bytes  2118.00 bytes/sec\n')
+
+    assert records == [
+        ('>f+++++++++', 1024, b'dir/file name'),
+        ('cd+++++++++', 0, b'dir/'),
+        ('*deleting', 0, b'old\nname'),
+        ('.d..t......', 4096, b'./'),
+    ]
+
+
+def test_lines_split_across_chunks():
+    parser, records, progress = record_parser()
+    data = (
+        b'>f+++++++++ 10 a\n'
+        b'             10 100%    1.00MB/s    0:00:00 (xfr#1, to-chk=1/2)\r'
+        b'>f+++++++++ 20 b\n'
+        b'             30 100%    2.50kB/s    0:00:00 (xfr#2, to-chk=0/2)\r'
+    )
+    for i in range(0, len(data), 7):
+        parser.feed(data[i : i + 7])
+    parser.close()
+
+    assert records == [('>f+++++++++', 10, b'a'), ('>f+++++++++', 20, b'b')]
+    assert progress == [(10, 1000000.0), (30, 2500.0)]
+
+
+def test_close_flushes_partial_line():
+    parser, records, _ = record_parser()
+    parser.feed(b'>f+++++++++ 5 last')
+    assert records == []
+    parser.close()
+    assert records == [('>f+++++++++', 5, b'last')]
+
+
+def test_progress_parser_skips_summary():
+    lines = []
+    parser = ProgressParser(lines.append)
+    parser.feed(b'sending incremental file list\nfile\ncreated directory dst\n')
+    parser.feed(b'sent 10 bytes  received 20 bytes  60.00 bytes/sec\n')
+    parser.feed(b'total size is 10  speedup is 1.00\n')
+    assert lines == ['file']
@@ -0,0 +1,39 @@
+from jsync.partition import partition_count, partition_size
+
+
+def test_count_parts_cover_list_in_order(file_list):
+    parts = partition_count(file_list([1] * 10), 3)
+    assert [len(p) for p in parts] == [3, 3, 4]
+    assert [i for p in parts for i in p.indexes] == list(range(10))
+
+
+def test_size_parts_cover_list_once(file_list):
+    files = file_list(range(1000))
+    parts = partition_size(files, 4)
+    indexes = [i for p in parts for i in p.indexes]
+    assert sorted(indexes) == list(range(1000))
+
+
+def test_size_parts_keep_rsync_order(file_list):
+    for p in partition_size(file_list([5, 1, 100, 7, 3, 60] * 50), 3):
+        assert list(p.indexes) == sorted(p.indexes)
+
+
+def test_size_balances_bytes(file_list):
+    sizes = [10**9] * 4 + [1000] * 4000
+    parts = partition_size(file_list(sizes), 4, overhead=0)
+    loads = [p.nbytes for p in parts]
+    assert max(loads) - min(loads) <= 1000
+    # every huge file goes to its own job
+    assert all(sum(1 for i in p.indexes if sizes[i] == 10**9) == 1 for p in parts)
+
+
+def test_size_overhead_spreads_empty_files(file_list):
+    parts = partition_size(file_list([0] * 1000 + [10**6]), 2)
+    assert min(len(p) for p in parts) > 400
+
+
+def test_size_accepts_views(file_list):
+    files = file_list(range(100))
+    parts = partition_size(files[10:50], 2)
+    assert sorted(i for p in parts for i in p.indexes) == list(range(10, 50))
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from jsync.events import EventBus, FileDone, JobAdded, JobError, JobProgress, TotalProgress
+from jsync.render import ConsoleRenderer
+
+
+@pytest.fixture
+def renderer():
+    r = ConsoleRenderer(EventBus(), max_echo=2)
+    r.bus.subscribe(r)
+    r.bus.publish(JobAdded(1))
+    return r
+
+
+def completed(r, task):
+    return r.progress.tasks[task].completed
+
+
+def test_progress_applied_on_tick(renderer):
+    task = renderer.tasks[1]
+    for size in (10, 20, 30):
+        renderer.bus.publish(JobProgress(1, size, 100, 1.0, 'a'))
+    renderer.bus.publish(TotalProgress(30, 100, 1.0))
+    assert completed(renderer, task) == 0
+
+    renderer.flush()
+    assert completed(renderer, task) == 30
+    assert completed(renderer, renderer.master) == 30
+    assert renderer.counters == {}
+
+
+def test_echo_is_batched(renderer, capsys):
+    for n in range(5):
+        renderer.bus.publish(FileDone(1, f'file{n}', '>f+++++++++', n))
+    assert capsys.readouterr().out == ''
+    assert renderer.files == {1: 'file4'}
+
+    renderer.flush()
+    out = capsys.readouterr().out
+    assert 'file0\nfile1\n' in out
+    assert 'file2' not in out
+    assert '... and 3 more files' in out
+    assert (renderer.echo, renderer.dropped) == ([], 0)
+
+
+def test_error_flushes_echo_first(renderer, capsys):
+    renderer.bus.publish(FileDone(1, 'file0', '>f+++++++++', 0))
+    renderer.bus.publish(JobError(1, 'broken'))
+    out = capsys.readouterr().out
+    assert out.index('file0') < out.index('Error: broken')
+
+
+def test_quiet_does_not_echo(capsys):
+    r = ConsoleRenderer(EventBus(), quiet=True)
+    r.bus.subscribe(r)
+    r.bus.publish(JobAdded(1))
+    r.bus.publish(FileDone(1, 'file0', '>f+++++++++', 0))
+    assert r.echo == []
+    assert r.files == {1: 'file0'}
+
+
+def test_ticker_flushes_periodically(capsys):
+    async def run():
+        with ConsoleRenderer(EventBus(), tick=0.01) as r:
+            r.bus.publish(JobAdded(1))
+            r.bus.publish(FileDone(1, 'file0', '>f+++++++++', 0))
+            r.bus.publish(JobProgress(1, 5, 10, 1.0, 'file0'))
+            await asyncio.sleep(0.1)
+            assert (r.echo, r.counters, r.files) == ([], {}, {})
+            assert completed(r, r.tasks[1]) == 5
+        return r
+
+    r = asyncio.run(run())
+    assert r.ticker is None
+    assert r not in r.bus.subscribers
+    assert 'file0' in capsys.readouterr().out
@@ -0,0 +1,127 @@
+import asyncio
+import sys
+
+import pytest
+
+from jsync.rsync import RSync, ShardSink, inline_filters
+
+
+def test_shard_sink_reports_directory_once():
+    files, seen = [], set()
+    a, b = ShardSink(files, seen), ShardSink(files, seen)
+    a.append((b'd', 'cd+++++++++', 0))
+    a.append((b'd/f', '>f+++++++++', 1))
+    b.append((b'd', 'cd+++++++++', 0))
+    b.append((b'd/g', '>f+++++++++', 2))
+    b.append((b'x', '*deleting', 0))
+    assert [f[0] for f in files] == [b'd', b'd/f', b'd/g', b'x']
+
+
+def test_relative_source_of_sharded_scan():
+    rsync = RSync('-a', '/data/src', 'host:/dst/')
+    assert (rsync.source(), rsync.relative_source()) == ('/data', 'src')
+    rsync = RSync('-a', '/data/src/', 'host:/dst/')
+    assert (rsync.source(), rsync.relative_source()) == ('/data/src', '')
+
+
+def test_remote_paths():
+    assert RSync.is_remote('host:/path')
+    assert RSync.is_remote('host::module/path')
+    assert RSync.is_remote('rsync://host/module')
+    assert not RSync.is_remote('/local/dir:with-colon')
+
+
+def test_inline_filters(tmp_path):
+    excludes = tmp_path / 'excludes'
+    excludes.write_bytes(b'*.o\n# comment\n\n; comment\nbuild/\r\nodd \xff\n')
+    includes = tmp_path / 'includes'
+    includes.write_bytes(b'keep.o')
+
+    opts = ['-a', f'--include-from={includes}', f'--exclude-from={excludes}', '--filter=- *.tmp']
+    assert inline_filters(opts) == [
+        '-a',
+        '--include=keep.o',
+        '--exclude=*.o',
+        '--exclude=build/',
+        '--exclude=odd \udcff',
+        '--filter=- *.tmp',
+    ]
+
+    rsync = RSync('-a', f'--exclude-from={excludes}', 'src/', 'dst/').with_inline_filters()
+    assert rsync.opts[1] == '--exclude=*.o'
+    assert '--exclude=*.o' in rsync.args_transfer
+
+
+@pytest.mark.parametrize(
+    'opt',
+    [
+        '-aF',
+        '-f. rules',
+        '-f:- .gitignore',
+        '--filter=merge rules',
+        '--filter=dir-merge,- .ignore',
+        '--exclude-from=-',
+        '--include-from=/nonexistent/rules',
+    ],
+)
+def test_inline_filters_refused(opt):
+    with pytest.raises(Exception, match='rsync option'):
+        inline_filters(['-a', opt])
+
+
+# stdin of the process is written to file argv[1] after argv[2] seconds
+CAT = (
+    'import shutil, sys, time; time.sleep(float(sys.argv[2])); '
+    'shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], "wb"))'
+)
+
+
+async def feed(rsync, names, out, delay=0):
+    proc = await asyncio.create_subprocess_exec(
+        sys.executable, '-c', CAT, str(out), str(delay), stdin=asyncio.subprocess.PIPE
+    )
+    writes, drains = [], 0
+    write, drain = proc.stdin.write, proc.stdin.drain
+
+    async def counted_drain():
+        nonlocal drains
+        drains += 1
+        await drain()
+
+    proc.stdin.write = lambda data: writes.append(len(data)) or write(data)
+    proc.stdin.drain = counted_drain
+    await rsync.feed_input(proc, names)
+    await proc.wait()
+    return writes, drains
+
+
+def test_feed_input_names(tmp_path):
+    names = [b'plain', b'new\nline', b'\xff\xfe', b'tab\tand space', b'-dash', b'back\\slash']
+    out = tmp_path / 'out'
+    asyncio.run(feed(RSync(), names, out))
+    assert out.read_bytes() == b''.join(n + b'\0' for n in names)
+
+
+def test_feed_input_chunks(tmp_path):
+    rsync = RSync()
+    rsync.feed_chunk = 100
+    names = [b'%09d' % i for i in range(95)]  # 10 bytes with NUL
+    out = tmp_path / 'out'
+    writes, drains = asyncio.run(feed(rsync, names, out))
+
+    assert writes == [100] * 9 + [50]
+    assert drains == 1  # final drain only, buffer stays below high water
+    assert out.read_bytes() == b''.join(n + b'\0' for n in names)
+
+
+def test_feed_input_waits_for_drain(tmp_path):
+    rsync = RSync()
+    rsync.feed_chunk = 64 * 1024
+    rsync.feed_high_water = 128 * 1024
+    names = [b'x' * 1023] * 4096  # 4M: more than pipe and write buffer take
+    out = tmp_path / 'out'
+    writes, drains = asyncio.run(feed(rsync, names, out, delay=0.2))
+
+    assert sum(writes) == 4096 * 1024
+    assert drains > 1
+    assert out.stat().st_size == 4096 * 1024
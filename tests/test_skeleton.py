@@ -0,0 +1,15 @@
+from jsync.skeleton import DirectorySink
+
+
+def test_directory_sink():
+    files, dirs = [], []
+    sink = DirectorySink(files, dirs)
+    sink.append(('d/', 'cd+++++++++', 0))
+    sink.append(('d/f', '>f+++++++++', 1))
+    sink.append(('e/', '.d..t......', 0))
+    sink.append(('old/', '*deleting', 0))
+    sink.append(('link', 'cL+++++++++', 0))
+
+    assert [e[0] for e in dirs] == ['d/', 'e/']
+    assert [e[0] for e in files] == ['d/f', 'old/', 'link']
+    assert len(sink) == 3
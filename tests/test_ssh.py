@@ -0,0 +1,49 @@
+import pytest
+
+from jsync.rsync import RSync
+from jsync.ssh import SSHPool
+
+
+@pytest.mark.parametrize(
+    ('args', 'usable'),
+    [
+        (['-a', 'src/', 'host:/dst/'], True),
+        (['-a', '-essh -p 2222', 'src/', 'user@host:/dst/'], True),
+        (['-a', '--rsh=/usr/bin/ssh -i key', 'host:/src/', 'dst/'], True),
+        (['-a', '--rsh=rsh', 'src/', 'host:/dst/'], False),
+        (['-a', 'src/', 'host::module/dst/'], False),
+        (['-a', 'src/', 'dst/'], False),
+    ],
+)
+def test_usable(args, usable):
+    assert SSHPool.usable(RSync(*args)) == usable
+
+
+def test_commands():
+    pool = SSHPool(RSync('-a', '--rsh=ssh -p 2222', 'src/', 'user@host:/dst/'), 2)
+    assert pool.host == 'user@host'
+
+    master = pool.master_command('/tmp/c/0')
+    assert master[:3] == ['ssh', '-p', '2222']
+    assert master[-1] == 'user@host'
+    assert 'ControlPath=/tmp/c/0' in master
+    assert 'ControlMaster=yes' in master
+
+    assert pool.client_command('/tmp/c/0') == (
+        'ssh -p 2222 -o ControlPath=/tmp/c/0 -o ControlMaster=no'
+    )
+
+
+def test_rsync_for_spreads_jobs_over_masters():
+    rsync = RSync('-a', '-essh', 'src/', 'host:/dst/')
+    pool = SSHPool(rsync, 2)
+    assert pool.rsync_for(0) is rsync
+
+    pool.masters = ['/tmp/c/0', '/tmp/c/1']
+    rsh = [r.remote_shell()[1] for r in map(pool.rsync_for, range(3))]
+    assert [r.split('ControlPath=')[1].split()[0] for r in rsh] == [
+        '/tmp/c/0',
+        '/tmp/c/1',
+        '/tmp/c/0',
+    ]
+    assert not [o for o in pool.rsync_for(1).opts if o.startswith('-e')]
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import subprocess
+
+import pytest
+
+from jsync.filelist import FileList
+from jsync.parser import RecordParser
+from jsync.rsync import RSync
+from jsync.tar import TarEngine, split_small, unescape
+
+
+def test_split_small():
+    files = FileList()
+    files.extend(
+        [
+            ('d/', 'cd+++++++++', 4096),
+            ('small', '>f+++++++++', 10),
+            ('large', '>f+++++++++', 10000),
+            ('link', 'cL+++++++++', 0),
+        ]
+    )
+    small, rest = split_small(files[:], 1000)
+    assert [e[0] for e in small] == ['small']
+    assert [e[0] for e in rest] == ['d/', 'large', 'link']
+
+
+@pytest.mark.parametrize(
+    ('args', 'reasons'),
+    [
+        (['-a', 'src/', 'dst/'], []),
+        (['-rtpog', 'src/', 'host:/dst/'], []),
+        (['-a', 'src/', 'host::module/'], ['rsync daemon']),
+        (['-aAX', 'src/', 'dst/'], ['-aAX']),
+        (['-avz', '--no-p', '--delete', '--bwlimit=100', 'src/', 'dst/'], []),
+        (['-a', '-essh -p 22', '--rsync-path=/opt/rsync', 'src/', 'host:dst/'], []),
+        (['-aL', '--copy-unsafe-links', 'src/', 'dst/'], ['-aL', '--copy-unsafe-links']),
+        (['-a', '-b', '--inplace', 'src/', 'dst/'], ['-b', '--inplace']),
+        (
+            ['-a', '--link-dest=../prev', '--fake-super', 'src/', 'dst/'],
+            ['--link-dest=../prev', '--fake-super'],
+        ),
+        (['-aB1024', 'src/', 'dst/'], ['-aB1024']),
+        (['-rto', 'src/', 'dst/'], ['-o without -g']),
+        (['-rtg', 'src/', 'dst/'], ['-g without -o']),
+        (['-a', '--chmod=u+w', 'src/', 'dst/'], ['--chmod=u+w']),
+    ],
+)
+def test_unsupported(args, reasons):
+    rsync = RSync(*args)
+    assert TarEngine.unsupported(rsync) == reasons
+    assert TarEngine.usable(rsync) == (not reasons)
+
+
+@pytest.mark.parametrize(
+    ('opts', 'root', 'tar'),
+    [
+        (['-a'], True, ['--same-permissions', '--same-owner']),
+        (['-a'], False, ['--same-permissions', '--no-same-owner']),
+        (['-r'], True, ['--no-same-permissions', '--no-same-owner', '--touch']),
+        (['-rt'], False, ['--no-same-permissions', '--no-same-owner']),
+        (
+            ['-a', '--no-perms', '--numeric-ids'],
+            True,
+            ['--no-same-permissions', '--same-owner', '--numeric-owner'],
+        ),
+    ],
+)
+def test_extract_options(opts, root, tar):
+    assert TarEngine(RSync(*opts, 'src/', 'dst/')).extract_options(root) == tar
+
+
+def test_local_owner_by_euid():
+    extract = TarEngine(RSync('-a', 'src/', 'dst/')).commands()[1]
+    owner = '--same-owner' if os.geteuid() == 0 else '--no-same-owner'
+    assert owner in extract
+
+
+def test_remote_commands(tmp_path):
+    create, extract = TarEngine(RSync('-a', '--rsh=ssh -p 22', 'src/', 'host:dst dir/')).commands()
+    assert create[:3] == ['tar', '-C', 'src']
+    assert extract[:4] == ['ssh', '-p', '22', 'host']
+    assert extract[4].startswith("mkdir -p 'dst dir/' && tar -C 'dst dir/'")
+
+    # owner is decided by the remote shell
+    owner = '--same-owner' if os.geteuid() == 0 else '--no-same-owner'
+    cmd = extract[4].replace(' tar ', ' echo ', 1)
+    run = subprocess.run(['sh', '-c', cmd], cwd=tmp_path, capture_output=True, check=True)
+    assert run.stdout.split()[-3:] == [owner.encode(), b'-xvf', b'-']
+
+
+@pytest.mark.parametrize(
+    ('listed', 'raw'),
+    [
+        (rb'a b', b'a b'),
+        (rb'new\nline', b'new\nline'),
+        (rb'tab\there\a', b'tab\there\x07'),
+        (rb'back\\slash', b'back\\slash'),
+        (rb'\377\376', b'\xff\xfe'),
+    ],
+)
+def test_unescape(listed, raw):
+    assert unescape(listed) == raw
+
+
+def test_transfer_reports_files_tar_listed(tmp_path):
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    src.mkdir()
+    names = [b'a', b'gone', b'new\nline', b'\xffz']
+    for n in names:
+        if n != b'gone':
+            (src / os.fsdecode(n)).write_bytes(b'data')
+
+    files = FileList()
+    files.extend((n, '>f+++++++++', 4) for n in names)
+    done = []
+    parser = RecordParser(lambda attr, size, name: done.append(name), lambda size, rate: None)
+    engine = TarEngine(RSync('-rt', f'{src}/', f'{dst}/'))
+
+    with pytest.raises(Exception, match='tar create'):
+        asyncio.run(engine.transfer(files[:], parser, lambda line: None))
+
+    assert done == [b'a', b'new\nline', b'\xffz']
+    assert (dst / 'new\nline').read_bytes() == b'data'
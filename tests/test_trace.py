@@ -0,0 +1,50 @@
+import json
+
+from jsync.events import EventBus, FileDone, JobAdded, JobError, JobFinished, JobStarted, Span
+from jsync.trace import Tracer
+
+
+def test_trace(tmp_path):
+    path = tmp_path / 'trace.json'
+    bus = EventBus()
+    tracer = Tracer(str(path), bus, burst=60)
+
+    bus.publish(JobAdded(1))
+    bus.publish(JobStarted(1, 'rsync'))
+    bus.publish(FileDone(1, 'a', '>f+++++++++', 10))
+    bus.publish(JobError(1, 'first error'))
+    bus.publish(JobError(1, 'second error'))
+    bus.publish(Span('rsync', 1, tracer.started, tracer.started + 1, {'files': 1}))
+    bus.publish(JobFinished(1))
+    bus.message('Done', 'all files', 'info')
+    tracer.close()
+    bus.publish(FileDone(1, 'b', '>f+++++++++', 10))  # unsubscribed
+
+    events = json.loads(path.read_text())
+    names = [(e['ph'], e['name']) for e in events]
+    assert names == [
+        ('M', 'process_name'),
+        ('M', 'thread_name'),
+        ('M', 'thread_name'),
+        ('X', 'file'),
+        ('X', 'rsync'),
+        ('X', 'errors'),
+        ('X', 'job'),
+        ('i', 'Done'),
+    ]
+    assert events[2]['args'] == {'name': 'job #1'}
+    assert events[4]['dur'] == 1000000
+    assert events[5]['args'] == {'count': 2, 'first': 'first error'}
+    assert {e['tid'] for e in events[3:7]} == {1}
+
+
+def test_interrupted_trace_is_flushed_on_close(tmp_path):
+    path = tmp_path / 'trace.json'
+    bus = EventBus()
+    tracer = Tracer(str(path), bus)
+    bus.publish(JobError(3, 'error'))
+    tracer.close()
+
+    events = json.loads(path.read_text())
+    assert events[-1]['name'] == 'errors'
+    assert events[-1]['tid'] == 3
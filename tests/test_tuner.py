@@ -0,0 +1,80 @@
+from jsync.batches import BatchQueue
+from jsync.events import EventBus
+from jsync.filelist import FileList
+from jsync.rsync import RSync
+from jsync.syncer import Syncer
+from jsync.tuner import JobTuner
+
+
+def test_grows_while_throughput_grows():
+    tuner = JobTuner(min_jobs=2, max_jobs=4)
+    assert tuner.decide(1, 2, 100) == 3
+    assert tuner.decide(2, 3, 150) == 4
+    assert tuner.decide(3, 4, 200) == 4  # max_jobs
+    assert [d[4] for d in tuner.decisions] == ['throughput grows'] * 2
+
+
+def test_no_growth_without_backlog():
+    tuner = JobTuner()
+    assert tuner.decide(1, 2, 100, backlog=0) == 2
+    assert tuner.decisions == []
+
+
+def test_drops_a_quarter_on_loss():
+    tuner = JobTuner(min_jobs=2, max_jobs=16)
+    tuner.decide(1, 12, 1000)
+    assert tuner.decide(2, 12, 800) == 9
+    assert tuner.decide(3, 9, 500) == 7
+    assert tuner.decisions[-1][4] == 'throughput drops'
+
+
+def test_drop_keeps_min_jobs():
+    tuner = JobTuner(min_jobs=3, max_jobs=8)
+    tuner.decide(1, 4, 1000)
+    assert tuner.decide(2, 4, 100) == 3
+    assert tuner.decide(3, 3, 10) == 3
+
+
+def test_probe_after_plateau():
+    tuner = JobTuner(min_jobs=2, max_jobs=8, probe=3)
+    tuner.decide(1, 4, 1000)
+    assert [tuner.decide(t, 4, 1010) for t in range(2, 5)] == [4, 4, 5]
+    assert tuner.decisions[-1][4] == 'probe after plateau'
+    assert tuner.best == 1010
+
+
+def test_report():
+    tuner = JobTuner(min_jobs=2, max_jobs=4)
+    tuner.decide(1, 2, 100)
+    tuner.decide(2, 3, 300)
+    lines = tuner.report()
+    assert len(lines) == 2 + 2
+    assert 'throughput grows' in lines[0]
+    assert lines[2].startswith('   2 jobs:')
+
+
+def test_target_is_last_decision():
+    tuner = JobTuner(min_jobs=2, max_jobs=3)
+    assert tuner.target == 2
+    tuner.decide(1, 2, 100)
+    tuner.decide(2, 3, 200)
+    assert tuner.target == 3
+    tuner.decide(3, 3, 10)
+    assert tuner.target == 2
+
+
+def test_requeue_keeps_jobs_retired_by_tuner():
+    files = FileList()
+    files.extend((f'f{i}', '>f+++++++++', 1) for i in range(10))
+
+    with Syncer('auto', RSync('-a', 'src/', 'dst/'), min_jobs=2, max_jobs=4, bus=EventBus()) as s:
+        s.queue = BatchQueue()
+        s.create_jobs([None] * 4)
+        s.jobs[1].retire()
+        s.jobs[3].retire()
+        # the tuner has shrunk the pool to 2 jobs
+        s.njobs = s.tuner.target
+
+        s.requeue(files[:])
+        assert [j.retired for j in s.jobs] == [False, False, True, True]
+        assert s.queue.nfiles == 10
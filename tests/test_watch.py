@@ -0,0 +1,52 @@
+import asyncio
+import sys
+
+import pytest
+
+from jsync.watch import Watcher
+
+pytestmark = pytest.mark.skipif(sys.platform != 'linux', reason='inotify is Linux only')
+
+
+async def watch(root, change, prefix=''):
+    watcher = Watcher(str(root), prefix, delay=0.05)
+    watcher.start()
+    try:
+        change()
+        return await watcher.changes(timeout=5)
+    finally:
+        watcher.close()
+
+
+def test_changes(tmp_path):
+    (tmp_path / 'd').mkdir()
+    (tmp_path / 'old').write_bytes(b'x')
+
+    def change():
+        (tmp_path / 'd' / 'f').write_bytes(b'data')
+        (tmp_path / 'old').unlink()
+
+    changed, overflow = asyncio.run(watch(tmp_path, change, 'src'))
+    assert not overflow
+    assert changed == {b'src', b'src/d', b'src/d/f', b'src/old'}
+
+
+def test_new_directory_is_reported_and_watched(tmp_path):
+    def change():
+        (tmp_path / 'new' / 'sub').mkdir(parents=True)
+        (tmp_path / 'new' / 'sub' / 'f').write_bytes(b'x')
+
+    changed, _ = asyncio.run(watch(tmp_path, change))
+    assert {b'.', b'new', b'new/sub', b'new/sub/f'} <= changed
+
+
+def test_nothing_changed(tmp_path):
+    async def idle():
+        watcher = Watcher(str(tmp_path))
+        watcher.start()
+        try:
+            return await watcher.changes(timeout=0.05)
+        finally:
+            watcher.close()
+
+    assert asyncio.run(idle()) is None